@@ -0,0 +1,296 @@
+import asyncio
+import collections
+import math
+import threading
+import time
+
+# Header a client sends with how many milliseconds it will wait for the response
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+_local = threading.local()
+
+
+class AdmissionRejected(Exception):
+    """A request the server will not run: ``status`` is 429 (the endpoint's
+    queue is full), 503 (no slot in time, or none before the deadline) or
+    504 (the deadline has already passed), with ``retry_after`` seconds."""
+
+    def __init__(self, message, status, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = {429: "queue_full", 503: "overloaded", 504: "expired"}[status]
+
+    def response(self):
+        # (body, status[, headers]) like the endpoint handlers
+        if self.retry_after is None:
+            return {"error": str(self)}, self.status
+        return {"error": str(self)}, self.status, {"Retry-After": str(self.retry_after)}
+
+
+def parse_deadline(value, now=None):
+    # Monotonic deadline from a DEADLINE_HEADER value; None when absent or invalid
+    try:
+        budget_ms = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(budget_ms):
+        return None
+    return (time.monotonic() if now is None else now) + max(0.0, budget_ms) / 1000.0
+
+
+def set_deadline(deadline):
+    # Deadline of the request this thread is working on (None: no deadline)
+    _local.deadline = deadline
+
+
+def current_deadline():
+    return getattr(_local, "deadline", None)
+
+
+def timeout_for(timeout, deadline=None):
+    # `timeout` (None: no limit) shortened to what is left before the deadline
+    deadline = current_deadline() if deadline is None else deadline
+    if deadline is None:
+        return timeout
+    remaining = max(0.0, deadline - time.monotonic())
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def with_deadline(deadline, fn):
+    # fn wrapped to run under `deadline` on another thread (a pool worker)
+    def run(*args, **kwargs):
+        previous = current_deadline()
+        set_deadline(deadline)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            set_deadline(previous)
+    return run
+
+
+class _Waiter:
+    __slots__ = ("endpoint", "enqueued", "wake", "granted")
+
+    def __init__(self, endpoint, enqueued, wake):
+        self.endpoint = endpoint
+        self.enqueued = enqueued
+        self.wake = wake
+        self.granted = False
+
+
+class AdmissionController:
+    """Per-endpoint concurrency limits, shared capacity and weighted queues.
+
+    At most ``limits[endpoint]`` requests of an endpoint run at once, and at
+    most ``max_in_flight`` in total (0: no total limit). A request that
+    cannot run waits in its endpoint's queue. When a slot frees, the queues
+    are served in proportion to their ``weights`` (stride scheduling), so an
+    endpoint with weight 4 gets four slots for every one of an endpoint with
+    weight 1 while both wait, and neither starves. Within a queue requests
+    run in arrival order.
+
+    Load is shed before any work is done: a full queue (``max_queue`` per
+    endpoint) answers 429, and a request whose deadline would pass before
+    its estimated turn, or that waits longer than ``queue_timeout_s``,
+    answers 503. Both carry a Retry-After estimated from the queue length
+    and the endpoint's recent service time. Thread-safe, with blocking
+    (``enter``) and asyncio (``enter_async``) waits.
+    """
+
+    def __init__(self, limits, weights=None, max_in_flight=0, max_queue=64, queue_timeout_s=30.0,
+                 on_wait=None):
+        self.limits = {name: max(1, int(limit)) for name, limit in limits.items()}
+        weights = weights or {}
+        self.weights = {name: max(1e-3, float(weights.get(name, 1.0))) for name in self.limits}
+        self.max_in_flight = max(0, int(max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout_s = queue_timeout_s
+        # on_wait(endpoint, seconds) for every admitted request, e.g. a histogram
+        self.on_wait = on_wait
+        self._lock = threading.Lock()
+        self._queues = {name: collections.deque() for name in self.limits}
+        self._in_flight = dict.fromkeys(self.limits, 0)
+        self._total = 0
+        # Stride scheduling: an endpoint's pass advances by 1/weight per admission
+        self._pass = dict.fromkeys(self.limits, 0.0)
+        self._virtual = 0.0
+        self._service_s = dict.fromkeys(self.limits)
+        self._admitted = collections.Counter()
+        self._completed = collections.Counter()
+        self._rejected = collections.Counter()  # (endpoint, reason)
+
+    def _has_slot(self, name):
+        return (self._in_flight[name] < self.limits[name]
+                and (not self.max_in_flight or self._total < self.max_in_flight))
+
+    def _grant(self, name):
+        self._in_flight[name] += 1
+        self._total += 1
+        self._admitted[name] += 1
+        start = max(self._pass[name], self._virtual)
+        self._virtual = start
+        self._pass[name] = start + 1.0 / self.weights[name]
+
+    def _dispatch(self):
+        # Hand free slots to waiting requests, lowest pass first
+        while not self.max_in_flight or self._total < self.max_in_flight:
+            ready = [name for name, queue in self._queues.items() if queue and self._has_slot(name)]
+            if not ready:
+                return
+            name = min(ready, key=lambda n: max(self._pass[n], self._virtual))
+            waiter = self._queues[name].popleft()
+            waiter.granted = True
+            self._grant(name)
+            waiter.wake()
+
+    def _estimated_wait(self, name):
+        # Seconds until a request joining this queue now would run
+        service = self._service_s[name] or 0.0
+        return (len(self._queues[name]) + 1) * service / self.limits[name]
+
+    def _retry_after(self, name):
+        return max(1, math.ceil(self._estimated_wait(name)))
+
+    def _reject(self, name, message, status):
+        error = AdmissionRejected(message, status, None if status == 504 else self._retry_after(name))
+        self._rejected[name, error.reason] += 1
+        return error
+
+    def _try_enter(self, name, deadline, wake):
+        # None when the request may run now, else its queued waiter; raises AdmissionRejected
+        now = time.monotonic()
+        with self._lock:
+            if deadline is not None and now >= deadline:
+                raise self._reject(name, "Request deadline has already passed", 504)
+            if not self._queues[name] and self._has_slot(name):
+                self._grant(name)
+                return None
+            if len(self._queues[name]) >= self.max_queue:
+                raise self._reject(name, f"/{name} queue is full, please retry", 429)
+            if deadline is not None and now + self._estimated_wait(name) > deadline:
+                raise self._reject(name, "Server is busy, the request would not finish before its deadline", 503)
+            waiter = _Waiter(name, now, wake)
+            self._queues[name].append(waiter)
+            return waiter
+
+    def _leave_queue(self, waiter):
+        # False if a slot was granted meanwhile (the caller then holds it)
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._queues[waiter.endpoint].remove(waiter)
+            return True
+
+    def _give_up(self, waiter, deadline):
+        # The rejection of a request that waited too long, or None if a slot
+        # was granted meanwhile
+        if not self._leave_queue(waiter):
+            return None
+        with self._lock:
+            if expired(deadline):
+                return self._reject(waiter.endpoint, "Request deadline passed while queued", 504)
+            return self._reject(waiter.endpoint, f"/{waiter.endpoint} did not get a slot within "
+                                                 f"{self.queue_timeout_s:g}s", 503)
+
+    def _wait_timeout(self, deadline):
+        return timeout_for(self.queue_timeout_s, deadline) if deadline is not None else self.queue_timeout_s
+
+    def _admitted_after(self, name, waiter):
+        waited = time.monotonic() - waiter.enqueued if waiter is not None else 0.0
+        if self.on_wait is not None:
+            self.on_wait(name, waited)
+        return waited
+
+    def enter(self, name, deadline=None):
+        # Block until the request may run; returns seconds waited
+        event = threading.Event()
+        waiter = self._try_enter(name, deadline, event.set)
+        if waiter is not None and not event.wait(self._wait_timeout(deadline)):
+            error = self._give_up(waiter, deadline)
+            if error is not None:
+                raise error
+        return self._admitted_after(name, waiter)
+
+    async def enter_async(self, name, deadline=None):
+        # enter() for the event loop; a cancelled wait never keeps a slot
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+        waiter = self._try_enter(name, deadline, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self._wait_timeout(deadline))
+            except asyncio.TimeoutError:
+                error = self._give_up(waiter, deadline)
+                if error is not None:
+                    raise error
+            except asyncio.CancelledError:
+                if not self._leave_queue(waiter):
+                    self.release(name)
+                raise
+        return self._admitted_after(name, waiter)
+
+    def release(self, name, seconds=None):
+        # A request admitted by enter() finished after running for `seconds`
+        with self._lock:
+            self._in_flight[name] -= 1
+            self._total -= 1
+            self._completed[name] += 1
+            if seconds is not None:
+                previous = self._service_s[name]
+                self._service_s[name] = seconds if previous is None else previous + 0.2 * (seconds - previous)
+            self._dispatch()
+
+    def waiting(self, name):
+        return len(self._queues[name])
+
+    def in_flight(self, name):
+        return self._in_flight[name]
+
+    def rejected(self):
+        with self._lock:
+            return dict(self._rejected)
+
+    def stats(self):
+        with self._lock:
+            endpoints = {
+                name: {
+                    "concurrency": limit,
+                    "weight": self.weights[name],
+                    "in_flight": self._in_flight[name],
+                    "waiting": len(self._queues[name]),
+                    "admitted": self._admitted[name],
+                    "completed": self._completed[name],
+                    "rejected": {reason: count for (endpoint, reason), count in sorted(self._rejected.items())
+                                 if endpoint == name},
+                    "service_ms": round(self._service_s[name] * 1000.0, 3) if self._service_s[name] else None,
+                }
+                for name, limit in self.limits.items()
+            }
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._total,
+                "max_queue": self.max_queue,
+                "queue_timeout_s": self.queue_timeout_s,
+                "endpoints": endpoints,
+            }
+
+
+def parse_endpoint_values(spec, names, variable):
+    # "predict=8,wound=16" -> {"predict": 8.0, "wound": 16.0}; names must be known
+    values = {}
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        name, _, value = entry.partition("=")
+        if name.strip() not in names:
+            raise ValueError(f"Unknown endpoint in {variable}: {name.strip()}")
+        values[name.strip()] = float(value)
+    return values
@@ -1,213 +1,854 @@
-import numpy as np
-import pandas as pd
-import joblib
-import cv2
-import pytesseract
-from scipy.sparse import hstack
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from sklearn.feature_extraction.text import TfidfVectorizer
-from ultralytics import YOLO
+import hmac
+import json
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from admission import (DEADLINE_HEADER, AdmissionController, AdmissionRejected, current_deadline, expired,
+                       parse_deadline, parse_endpoint_values, set_deadline, timeout_for, with_deadline)
+from batching import MicroBatcher
+from ensemble import ensemble_from_env
+from features import FeatureAssembler
+from frame_stream import IouTracker, StreamSession, UploadedStream
+from instrumentation import CONTENT_TYPE, SampledInfoFilter, metrics, record_request, stage
+from image_ingest import (decode_image, decode_letterboxed, letterbox, letterbox_buffer, set_buffer_allocator,
+                          upright_size)
+from inference_pool import (InferencePool, PoolQueueFull, PoolTimeout, SharedImages, load_pool_config, pin_threads,
+                            shared_view)
+from near_duplicate import NearDuplicateIndex, image_hash
+from model_registry import ModelRegistry, ModelWatcher, process_memory
+from ocr_engine import OCRQueueFull, OCRTimeout, engine_from_env
+from ocr_regions import OCR_MAX_SIDE, assemble_text, crop_regions, propose_text_regions, rescale_boxes
+from onnx_backend import OnnxClassifier, backends_from_env, onnx_path
+from result_cache import cache_from_env
+from yolo_profiles import (REQUEST_FIELDS, Detections, detected_classes, label_array, profiles_from_env,
+                           request_profile)
+
+# JSON responses, with their serialization time recorded as a stage
+class TimedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        with stage("serialize"):
+            return super().response(*args, **kwargs)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)  # Enable CORS for cross-origin requests
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging: LOG_LEVEL (default INFO), with only a LOG_SAMPLE_RATE
+# fraction of per-request INFO lines kept; warnings and errors are all kept
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
+# Per-request lines go to a logger of their own, so only they are sampled
+request_logger = logging.getLogger(f"{__name__}.requests")
+request_log_filter = SampledInfoFilter(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+request_logger.addFilter(request_log_filter)
+# Werkzeug's access lines carry the request line, status and size as
+# arguments; its startup lines have none and are always kept
+logging.getLogger("werkzeug").addFilter(SampledInfoFilter(request_log_filter.rate,
+                                                           select=lambda record: bool(record.args)))
 
-# Load pre-trained models and vectorizer for /predict endpoint
-try:
-    models = {
-        "Logistic_Regression": joblib.load("model_weights/Logistic_Regression.pkl"),
-        "Naive_Bayes": joblib.load("model_weights/Naive_Bayes.pkl"),
-        "SVM": joblib.load("model_weights/SVM.pkl"),
-        "XGBoost": joblib.load("model_weights/XGBoost.pkl")
-    }
-    vectorizer = joblib.load("model_weights/content_vectorizer.pkl")
-    brand_columns = joblib.load("model_weights/brand_columns.pkl")
-    logger.info("Text prediction models and vectorizer loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load text prediction models or vectorizer: {str(e)}")
-    raise
-
-# Load the pre-trained YOLOv8 model for /process_image endpoint
-try:
-    yolo_model = YOLO('model_weights/yolov8n.pt')  # YOLOv8 model
-    logger.info("YOLO model for object detection loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load YOLO model for object detection: {str(e)}")
-    raise
-
-# Load the pre-trained YOLOv8 model for /wound endpoint
-try:
-    wound_model = YOLO('model_weights/best.pt')  # YOLOv8 model for wound detection
-    logger.info("YOLO model for wound detection loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load YOLO model for wound detection: {str(e)}")
-    raise
-
-# Preprocessing function for /predict endpoint
-def preprocess_input(content, brand):
+# Endpoints served by this deployment (comma-separated); models behind a
+# disabled endpoint are never imported or loaded
+ALL_ENDPOINTS = ("predict", "ocr", "process_image", "wound", "analyze", "process_stream")
+ENABLED_ENDPOINTS = {name.strip() for name in os.environ.get("API_ENDPOINTS", ",".join(ALL_ENDPOINTS)).split(",") if name.strip()}
+unknown_endpoints = ENABLED_ENDPOINTS - set(ALL_ENDPOINTS)
+if unknown_endpoints:
+    raise ValueError(f"Unknown endpoints in API_ENDPOINTS: {', '.join(sorted(unknown_endpoints))}")
+
+# Text prediction models for /predict, in response order
+TEXT_MODEL_NAMES = ["Logistic_Regression", "Naive_Bayes", "SVM", "XGBoost"]
+
+# Inference backend per model ("native", "onnx" or "onnx-int8"), from
+# MODEL_BACKEND / MODEL_BACKENDS; ONNX files come from export_onnx.py
+MODEL_BACKENDS = backends_from_env(TEXT_MODEL_NAMES + ["yolo", "wound"])
+MODEL_FILES = {name: f"model_weights/{name}.pkl" for name in TEXT_MODEL_NAMES}
+MODEL_FILES.update({"yolo": "model_weights/yolov8n.pt", "wound": "model_weights/best.pt"})
+
+# Weight file a model is served from under its configured backend
+def model_file(name):
+    backend = MODEL_BACKENDS[name]
+    return MODEL_FILES[name] if backend == "native" else onnx_path(MODEL_FILES[name], backend)
+
+# Model loaders: heavy libraries are imported on first load, not at startup
+def load_pickle(path):
+    import joblib
+    return joblib.load(path)
+
+def load_text_model(name):
+    if MODEL_BACKENDS[name] == "native":
+        return load_pickle(model_file(name))
+    return OnnxClassifier(model_file(name))
+
+def load_text_features():
+    # Vectorizer and brand columns wrapped in the feature assembler for /predict
+    # endpoints; FAST_TFIDF=0 falls back to the vectorizer's own transform
+    return FeatureAssembler(load_pickle("model_weights/content_vectorizer.pkl"),
+                            load_pickle("model_weights/brand_columns.pkl"),
+                            fast_tfidf=os.environ.get("FAST_TFIDF", "1") == "1")
+
+# Intra-op threads of PyTorch YOLO inference (YOLO_THREADS, 0 = PyTorch's default)
+YOLO_THREADS = int(os.environ.get("YOLO_THREADS", "0"))
+
+def load_yolo(path):
+    from ultralytics import YOLO
+    if YOLO_THREADS:
+        import torch
+        torch.set_num_threads(YOLO_THREADS)
+    # ultralytics runs .onnx exports through onnxruntime
+    return YOLO(path, task="detect") if path.endswith(".onnx") else YOLO(path)
+
+# Registry of lazily loaded models; MODEL_MEMORY_BUDGET_MB (0 = unlimited) caps
+# the resident size of loaded models, unloading the least recently used first.
+# The text models are trained on the vectorizer's features, so they are one
+# group that is versioned and reloaded together.
+model_registry = ModelRegistry(int(float(os.environ.get("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024))
+TEXT_GROUP = "text"
+for model_name in TEXT_MODEL_NAMES:
+    model_registry.register(model_name, lambda name=model_name: load_text_model(name), files=[model_file(model_name)],
+                            group=TEXT_GROUP)
+model_registry.register("brand_columns", lambda: load_pickle("model_weights/brand_columns.pkl"),
+                        files=["model_weights/brand_columns.pkl"], group=TEXT_GROUP)
+model_registry.register("text_features", load_text_features,
+                        files=["model_weights/content_vectorizer.pkl", "model_weights/brand_columns.pkl"],
+                        group=TEXT_GROUP)
+model_registry.register("yolo", lambda: load_yolo(model_file("yolo")), files=[model_file("yolo")])
+model_registry.register("wound", lambda: load_yolo(model_file("wound")), files=[model_file("wound")])
+
+# Changed weight files are picked up every MODEL_WATCH_INTERVAL_S seconds
+# (0 = only through POST /admin/reload): the new version is loaded and warmed
+# next to the serving one and swapped in once ready
+model_watcher = ModelWatcher(model_registry, float(os.environ.get("MODEL_WATCH_INTERVAL_S", "10")))
+
+# Serving topology (INFERENCE_POOLS_CONFIG, a JSON file written by
+# plan_pools.py): each model family under "pools" runs in its own worker
+# processes with a pinned thread budget, and this process only parses
+# requests, decodes uploads and writes responses. Decoded YOLO inputs are
+# written straight into shared memory that the workers read in place. The
+# "ocr" entry sizes the OCR engine's processes, which always run apart.
+POOL_FAMILIES = (TEXT_GROUP, "yolo", "wound", "ocr")
+pool_config = load_pool_config(os.environ.get("INFERENCE_POOLS_CONFIG"), POOL_FAMILIES)
+if pool_config["pools"]:
+    # Processes started from here on, the pool workers first, serve their own models
+    os.environ["INFERENCE_POOLS_CONFIG"] = ""
+
+# Thread settings of a worker with `threads` threads
+def worker_environ(threads):
+    return {"YOLO_THREADS": threads, "ENSEMBLE_WORKERS": threads, "ONNX_THREADS": threads}
+
+inference_pools = {family: InferencePool(family, "allAPI", environ=worker_environ(settings["threads"]), **settings)
+                   for family, settings in pool_config["pools"].items() if family != "ocr"}
+shared_images = SharedImages(pool_config["shared_memory_blocks"])
+if inference_pools.keys() & {"yolo", "wound"}:
+    set_buffer_allocator(shared_images.allocate)
+if pool_config["frontend"].get("threads"):
+    pin_threads(pool_config["frontend"]["threads"])
+
+def start_inference_pools():
+    for pool in inference_pools.values():
+        pool.start()
+
+def shutdown_inference_pools():
+    for pool in inference_pools.values():
+        pool.shutdown()
+
+# Models each endpoint needs, for warmup
+ENDPOINT_MODELS = {
+    "predict": ["brand_columns", "text_features"] + TEXT_MODEL_NAMES,
+    "ocr": [],
+    "process_image": ["yolo"],
+    "wound": ["wound"],
+    # /analyze runs the models of the other endpoints
+    "analyze": [],
+    "process_stream": ["yolo"]
+}
+
+# Load every model of the enabled endpoints up front instead of on first
+# request; models of families with an inference pool load in its workers
+def warmup_models():
+    for endpoint in ALL_ENDPOINTS:
+        if endpoint in ENABLED_ENDPOINTS:
+            model_registry.warmup([name for name in ENDPOINT_MODELS[endpoint]
+                                   if model_registry.group_of(name) not in inference_pools])
+
+# Disabled endpoints answer 404 as if they did not exist; returns None for enabled ones
+def disabled_endpoint_response(path):
+    endpoint = (path.strip("/").split("/") or [""])[0]
+    if endpoint in ALL_ENDPOINTS and endpoint not in ENABLED_ENDPOINTS:
+        return {"error": f"Endpoint /{endpoint} is not enabled on this server"}, 404
+    return None
+
+# Endpoint label of a request path for metrics; other paths share one label
+# so that scanners cannot create unbounded series
+METRIC_ENDPOINTS = set(ALL_ENDPOINTS) | {"predict/batch", "stats", "metrics", "admin/reload"}
+
+def endpoint_label(path):
+    endpoint = path.strip("/")
+    return endpoint if endpoint in METRIC_ENDPOINTS else "other"
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def watch_model_files():
+    model_watcher.ensure_started()
+
+@app.before_request
+def reject_disabled_endpoints():
+    return disabled_endpoint_response(request.path)
+
+# Admission control (configured below): past an endpoint's limits a request
+# waits in a weighted queue or is shed before any work is done. The deadline
+# header bounds the wait and the work done for the request.
+@app.before_request
+def admit_request():
+    endpoint = endpoint_label(request.path)
+    if endpoint not in admission.limits or request.method == "OPTIONS":
+        return None
+    deadline = parse_deadline(request.headers.get(DEADLINE_HEADER))
     try:
-        # Feature engineering
-        text_length = len(content)
-        word_count = len(content.split())
-        avg_word_length = sum(len(word) for word in content.split()) / word_count if word_count > 0 else 0
-
-        # TF-IDF vectorization
-        tfidf_content = vectorizer.transform([content])
-
-        # One-hot encode brand
-        brand_data = np.zeros(len(brand_columns))
-        brand_col = f"Brand_{brand}"
-        if brand_col in brand_columns:
-            brand_idx = brand_columns.index(brand_col)
-            brand_data[brand_idx] = 1
-
-        # Other features DataFrame
-        other_features = pd.DataFrame({
-            'text_length': [text_length],
-            'word_count': [word_count],
-            'avg_word_length': [avg_word_length],
-            **{col: [brand_data[i]] for i, col in enumerate(brand_columns)}
-        })
-
-        # Combine TF-IDF and other features
-        combined_features = hstack([tfidf_content, other_features])
-
-        return combined_features
+        admission.enter(endpoint, deadline)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected {request.path}: {str(e)}")
+        return e.response()
+    g.admitted = (endpoint, time.perf_counter(), deadline)
+    set_deadline(deadline)
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get("request_start")
+    if start is not None:
+        record_request(endpoint_label(request.path), response.status_code, time.perf_counter() - start)
+    return response
+
+# Runs before record_request_metrics (after_request runs in reverse order)
+@app.after_request
+def expire_late_responses(response):
+    admitted = g.get("admitted")
+    if admitted is not None and response.status_code >= 500 and expired(admitted[2]):
+        return app.make_response(deadline_exceeded_response(admitted[0]))
+    return response
+
+@app.teardown_request
+def release_admission(_error):
+    admitted = g.pop("admitted", None)
+    if admitted is not None:
+        admission.release(admitted[0], time.perf_counter() - admitted[1])
+        set_deadline(None)
+
+# Run a batch of (image, YoloProfile) items through one of the YOLO models in
+# the registry; returns (result, model version) per item. Items of different
+# profiles differ in input size or settings, so each profile is its own call.
+# With an inference pool for the model, the batch runs in one of its workers.
+def run_yolo_batch(model_name, items):
+    pool = inference_pools.get(model_name)
+    if pool is not None:
+        # The inputs go as shared-memory locations, kept alive here until the worker is done
+        described = [shared_images.describe(image) for image, _ in items]
+        return pool.call("run_pooled_yolo_batch", model_name, [image for image, _ in described],
+                         [profile for _, profile in items], timeout=YOLO_RESULT_TIMEOUT_S)
+    model, version = model_registry.get_versioned(model_name)
+    by_profile = {}
+    for index, (_, profile) in enumerate(items):
+        by_profile.setdefault(profile, []).append(index)
+    results = [None] * len(items)
+    with stage("inference", model_name):
+        for profile, indices in by_profile.items():
+            for index, result in zip(indices, model([items[i][0] for i in indices], **profile.predict_kwargs())):
+                results[index] = (result, version)
+    return results
+
+# run_yolo_batch in an inference worker: inputs are read in place from shared
+# memory, and results go back as Detections, which pickle without the image
+def run_pooled_yolo_batch(model_name, images, profiles):
+    items = [(shared_view(image), profile) for image, profile in zip(images, profiles)]
+    return [(Detections.from_result(result), version) for result, version in run_yolo_batch(model_name, items)]
+
+# Micro-batching window for the YOLO endpoints: concurrent requests arriving
+# within YOLO_MAX_WAIT_MS are run through the model as one batch
+YOLO_MAX_BATCH_SIZE = int(os.environ.get("YOLO_MAX_BATCH_SIZE", "8"))
+YOLO_MAX_WAIT_MS = float(os.environ.get("YOLO_MAX_WAIT_MS", "10"))
+YOLO_RESULT_TIMEOUT_S = float(os.environ.get("YOLO_RESULT_TIMEOUT_S", "60"))
+# Inference profile of each YOLO model when a request does not choose one
+# (YOLO_PROFILE / YOLO_PROFILES): input side, confidence, NMS and class settings
+YOLO_PROFILES = profiles_from_env(["yolo", "wound"])
+
+# With an inference pool, one batch per worker process is in flight at a time
+yolo_batcher = MicroBatcher("yolo", lambda images: run_yolo_batch("yolo", images),
+                            max_batch_size=YOLO_MAX_BATCH_SIZE, max_wait_ms=YOLO_MAX_WAIT_MS,
+                            workers=inference_pools["yolo"].processes if "yolo" in inference_pools else 1)
+wound_batcher = MicroBatcher("wound", lambda images: run_yolo_batch("wound", images),
+                             max_batch_size=YOLO_MAX_BATCH_SIZE, max_wait_ms=YOLO_MAX_WAIT_MS,
+                             workers=inference_pools["wound"].processes if "wound" in inference_pools else 1)
+
+# Sample inputs a reloaded model group is run on before it serves
+def warm_text_models(models):
+    features = models["text_features"].transform_one("Local council approves new budget for road repairs.", "Unknown")
+    for name in TEXT_MODEL_NAMES:
+        if name in models:
+            models[name].predict(features)
+
+def warm_yolo_model(models):
+    for name, model in models.items():
+        profile = YOLO_PROFILES[name]
+        model([np.zeros((profile.imgsz, profile.imgsz, 3), dtype=np.uint8)], **profile.predict_kwargs())
+
+model_registry.register_warmup(TEXT_GROUP, warm_text_models)
+model_registry.register_warmup("yolo", warm_yolo_model)
+model_registry.register_warmup("wound", warm_yolo_model)
+
+# Start of an inference worker process (inference_pool.py) serving model
+# group `family`: its models are loaded and run once before the pool serves,
+# and their files are watched as in the API process
+def init_inference_worker(family):
+    models, version = model_registry.snapshot(model_registry.members(family))
+    (warm_text_models if family == TEXT_GROUP else warm_yolo_model)(models)
+    model_watcher.ensure_started()
+    logger.info(f"Inference worker {os.getpid()} serving {family} version {version}")
+
+# Run by every worker of a group's inference pool for POST /admin/reload
+def reload_pooled_group(group):
+    return model_registry.reload(group) or model_registry.version(group)
+
+# Reloads a model group where it is served: in every worker of its inference
+# pool, or in this process. Returns {pid: version}
+def reload_group(group):
+    if group not in inference_pools:
+        return {os.getpid(): model_registry.reload(group) or model_registry.version(group)}
+    try:
+        return inference_pools[group].broadcast("reload_pooled_group", group)
+    except Exception as e:
+        logger.error(f"Reload of {group} in its inference pool failed: {str(e)}")
+        raise
+
+# Response of a handler run by a worker of the `family` inference pool
+def pool_response(family, function, *args):
+    pool = inference_pools[family]
+    try:
+        return pool.call(function, *args, timeout=timeout_for(pool.timeout_s))
+    except PoolQueueFull:
+        logger.warning(f"Inference pool {family} is full, rejecting request")
+        return {"error": "Inference service is busy, please retry"}, 503, {"Retry-After": "1"}
+    except PoolTimeout:
+        logger.error(f"Inference pool {family} timed out")
+        return {"error": "Inference timed out"}, 504
+    except Exception as e:
+        logger.error(f"Inference pool {family} failed: {str(e)}")
+        return {"error": f"Internal Server Error: {str(e)}"}, 500
+
+# Result cache for all four endpoints, keyed by request content plus model version
+result_cache = cache_from_env()
+tesseract_version = "unknown"
+if "ocr" in ENABLED_ENDPOINTS:
+    try:
+        import pytesseract
+        tesseract_version = str(pytesseract.get_tesseract_version())
+    except Exception:
+        pass
+
+# Model group behind each endpoint
+ENDPOINT_GROUPS = {"predict": TEXT_GROUP, "process_image": "yolo", "wound": "wound"}
+
+# Version of the models currently serving an endpoint. Responses carry the
+# version that produced them as "model_version", and cache keys include it,
+# so a reload never serves results of the previous models.
+def endpoint_version(endpoint):
+    if endpoint == "ocr":
+        return f"tesseract-{tesseract_version}"
+    return model_registry.version(ENDPOINT_GROUPS[endpoint])
+
+# Cache key of a /process_image or /wound response from models of `version`
+# run with `profile`
+def image_cache_key(endpoint, image_bytes, version, profile):
+    return result_cache.make_key(f"/{endpoint}", image_bytes, f"{version}:{profile.key}")
+
+# Class name -> index of a YOLO model, for the `classes` request field
+def yolo_class_indices(model_name):
+    if model_name in inference_pools:
+        # The model is only loaded in the pool's workers
+        return inference_pools[model_name].call("yolo_class_indices", model_name)
+    indices = {name: index for index, name in model_registry.get(model_name).names.items()}
+    if model_name == "wound":
+        # The standardized wound names are accepted too
+        indices.update((WOUND_CLASS_MAPPING[name], index) for name, index in list(indices.items())
+                       if name in WOUND_CLASS_MAPPING)
+    return indices
+
+# Profile of a request to a YOLO model from its form or query fields; raises ValueError
+def yolo_request_profile(model_name, fields, with_classes=True):
+    fields = {name: (fields or {}).get(name) for name in REQUEST_FIELDS}
+    if not any(value not in (None, "") for value in fields.values()):
+        return YOLO_PROFILES[model_name]
+    return request_profile(YOLO_PROFILES[model_name], fields,
+                           (lambda: yolo_class_indices(model_name)) if with_classes else None)
+
+# Preprocessing function for /predict endpoint; text_features defaults to the registry's
+def preprocess_input(content, brand, text_features=None):
+    try:
+        # TF-IDF, hand-crafted features and brand one-hot in a single sparse row
+        if text_features is None:
+            text_features = model_registry.get("text_features")
+        with stage("features"):
+            return text_features.transform_one(content, brand)
     except Exception as e:
         logger.error(f"Error in preprocessing: {str(e)}")
         return None
 
-# OCR function for /ocr endpoint
-def ocr_image(image):
+# Ensemble executor for /predict: runs the text models concurrently, or in
+# "fast" mode cheapest first until a quorum agrees (ENSEMBLE_MODE, ENSEMBLE_QUORUM)
+ensemble = ensemble_from_env(TEXT_MODEL_NAMES, model_registry.get)
+
+def credibility_label(pred):
+    return 'Not Credible' if pred == 1 else 'Credible'
+
+# Maximum number of articles accepted by /predict/batch in one call
+MAX_BATCH_ITEMS = 1000
+
+# Batch preprocessing function for /predict/batch endpoint: one row per (content, brand) pair
+def preprocess_batch(contents, brands, text_features):
     try:
-        # Convert image to grayscale for better OCR accuracy
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Apply thresholding to enhance text visibility
-        thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-        
-        # Run Tesseract OCR on the processed image
-        text = pytesseract.image_to_string(thresh)
-        
-        return text
+        with stage("features"):
+            return text_features.transform(contents, brands)
+    except Exception as e:
+        logger.error(f"Error in batch preprocessing: {str(e)}")
+        return None
+
+# Score a feature matrix with every model of `text_models`; a model that fails
+# on the whole matrix is retried row by row so one bad article cannot fail the batch
+def predict_batch(features, text_models):
+    n_rows = features.shape[0]
+    results = [{} for _ in range(n_rows)]
+    for model_name in TEXT_MODEL_NAMES:
+        model = text_models[model_name]
+        try:
+            with stage("inference", model_name):
+                preds = model.predict(features)
+            for row, pred in enumerate(preds):
+                results[row][model_name] = credibility_label(pred)
+        except Exception as model_error:
+            logger.error(f"Error in batched {model_name} prediction, retrying per item: {str(model_error)}")
+            for row in range(n_rows):
+                try:
+                    pred = model.predict(features[row])[0]
+                    results[row][model_name] = credibility_label(pred)
+                except Exception as row_error:
+                    results[row][model_name] = f'Error: {str(row_error)}'
+    return results
+
+# OCR engine for /ocr endpoint: a bounded pool of worker processes with warm Tesseract instances
+# (sized by the "ocr" entry of INFERENCE_POOLS_CONFIG when there is one)
+ocr_pool = pool_config["pools"].get("ocr")
+ocr_engine = engine_from_env(workers=ocr_pool["processes"], threads=ocr_pool["threads"],
+                             max_queue=ocr_pool["max_queue"], timeout_s=ocr_pool["timeout_s"]) \
+    if ocr_pool else engine_from_env()
+
+# Admission limits per endpoint (ADMISSION_CONCURRENCY, e.g. "predict=8,wound=16"):
+# OCR has its own admission queue, and the YOLO endpoints need enough
+# concurrent requests to fill a micro-batch
+def default_concurrency():
+    cpus = os.cpu_count() or 1
+    return {
+        "predict": cpus,
+        "predict/batch": max(1, cpus // 2),
+        "ocr": ocr_engine.workers + ocr_engine.max_queue,
+        "process_image": 2 * YOLO_MAX_BATCH_SIZE,
+        "wound": 2 * YOLO_MAX_BATCH_SIZE,
+        "analyze": 2 * YOLO_MAX_BATCH_SIZE,
+        # Each stream holds its slot until it ends
+        "process_stream": 2 * YOLO_MAX_BATCH_SIZE,
+    }
+
+# Queue weights while endpoints compete for ADMISSION_MAX_IN_FLIGHT slots
+DEFAULT_ADMISSION_WEIGHTS = {"wound": 4, "predict": 2}
+
+queue_wait_seconds = metrics.histogram("api_queue_wait_seconds", "Time admitted requests waited for a slot",
+                                       ("endpoint",))
+deadline_exceeded_total = metrics.counter(
+    "api_deadline_exceeded_total", "Admitted requests whose deadline passed while they ran", ("endpoint",))
+
+# The ASGI_* names are the settings' names from before they applied to both servers
+def admission_from_env():
+    concurrency = default_concurrency()
+    concurrency.update({name: int(value) for name, value in parse_endpoint_values(
+        os.environ.get("ADMISSION_CONCURRENCY", os.environ.get("ASGI_CONCURRENCY")), concurrency,
+        "ADMISSION_CONCURRENCY").items()})
+    weights = dict(DEFAULT_ADMISSION_WEIGHTS)
+    weights.update(parse_endpoint_values(os.environ.get("ADMISSION_WEIGHTS"), concurrency, "ADMISSION_WEIGHTS"))
+    return AdmissionController(
+        concurrency, weights,
+        max_in_flight=int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", str(max(16, 4 * (os.cpu_count() or 1))))),
+        max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", os.environ.get("ASGI_MAX_QUEUE", "64"))),
+        queue_timeout_s=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_S",
+                                             os.environ.get("ASGI_QUEUE_TIMEOUT_S", "30"))),
+        on_wait=lambda endpoint, seconds: queue_wait_seconds.observe(seconds, endpoint))
+
+admission = admission_from_env()
+
+# Response for an admitted request whose deadline passed before it finished;
+# the client has given up, so the outcome of the work no longer matters
+def deadline_exceeded_response(endpoint):
+    deadline_exceeded_total.inc(endpoint)
+    return {"error": "Request deadline exceeded"}, 504
+
+# OCR function for /ocr endpoint; a full queue or a timeout is raised to the caller
+def ocr_image(image, lang=None, psm=None):
+    try:
+        # Grayscale, Otsu threshold and Tesseract all run in an OCR worker process
+        with stage("tesseract"):
+            return ocr_engine.run(image, lang=lang, psm=psm, timeout=timeout_for(ocr_engine.timeout_s))
+    except (OCRQueueFull, OCRTimeout):
+        raise
     except Exception as e:
         logger.error(f"Error in OCR processing: {str(e)}")
         return None
 
+# OCR modes for /ocr: "full" thresholds and OCRs the whole frame, "regions"
+# finds text regions first and OCRs only those crops in parallel
+OCR_MODES = ("full", "regions")
+OCR_DEFAULT_MODE = os.environ.get("OCR_MODE", "full")
+# Crops are single blocks of text, so default to Tesseract's uniform-block mode
+OCR_REGION_PSM = 6
+
+# Region-proposal OCR function for /ocr endpoint; returns (text, regions) or (None, None).
+# Boxes are in the pixels of the upright upload of `size` (width, height) that
+# `image` was decoded from at reduced scale, or of `image` itself
+def ocr_image_regions(image, lang=None, psm=None, size=None):
+    try:
+        regions = propose_text_regions(image)
+        if not regions:
+            # Nothing that looks like text lines: fall back to the whole frame
+            return ocr_image(image, lang=lang, psm=psm), []
+        crops = crop_regions(image, regions)
+        with stage("tesseract"):
+            texts = ocr_engine.run_many(crops, lang=lang, psm=psm if psm is not None else OCR_REGION_PSM,
+                                        timeout=timeout_for(ocr_engine.timeout_s))
+        scaled = rescale_boxes([box for _, box in regions], image, size)
+        boxes = [{"text": text.strip(), "box": list(box)} for box, text in zip(scaled, texts)]
+        return assemble_text(regions, texts), boxes
+    except (OCRQueueFull, OCRTimeout):
+        raise
+    except Exception as e:
+        logger.error(f"Error in region OCR processing: {str(e)}")
+        return None, None
+
+# Endpoint handlers, shared by the Flask routes below and the ASGI front end
+# (asgiAPI.py): each takes parsed request data and returns (body, status) or
+# (body, status, headers)
+
 # /predict endpoint: Text credibility prediction
-@app.route('/predict', methods=['POST'])
-def predict():
+def predict_response(data, args):
+    if TEXT_GROUP in inference_pools:
+        return pool_response(TEXT_GROUP, "predict_response", data,
+                             {name: args.get(name) for name in ('models', 'mode', 'quorum')})
     try:
-        data = request.get_json()
         content = data.get('content')
         brand = data.get('brand', 'Unknown')
 
         if not content:
             logger.warning("Content is required but not provided")
-            return jsonify({'error': 'Content is required'}), 400
+            return {'error': 'Content is required'}, 400
+
+        # Optional model subset, ensemble mode and quorum (JSON body or query string)
+        options = {name: data[name] if data.get(name) is not None else args.get(name)
+                   for name in ('models', 'mode', 'quorum')}
+        try:
+            models, mode, quorum = ensemble.validate(**options)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid ensemble options: {str(e)}")
+            return {'error': str(e)}, 400
+
+        # One version of the vectorizer and classifiers for the whole request,
+        # even if a reload swaps in new ones meanwhile
+        text_models, version = model_registry.snapshot(["brand_columns", "text_features"] + models)
+
+        # Serve repeated articles from the cache; brands without a one-hot column
+        # all produce the same features, so they share one cache entry
+        brand_key = str(brand) if f"Brand_{brand}" in text_models["brand_columns"] else ""
+        payload = json.dumps([content, brand_key, sorted(models), mode, quorum], ensure_ascii=False).encode("utf-8")
+        cache_key = result_cache.make_key("/predict", payload, version)
+        cached = result_cache.get("/predict", cache_key)
+        if cached is not None:
+            request_logger.info("Predictions served from result cache")
+            return cached, 200
 
         # Preprocess input
-        features = preprocess_input(content, brand)
+        features = preprocess_input(content, brand, text_models["text_features"])
 
         if features is None or features.shape[0] == 0:
             logger.error("Feature preprocessing failed")
-            return jsonify({'error': 'Feature preprocessing failed'}), 500
+            return {'error': 'Feature preprocessing failed'}, 500
 
-        # Get predictions from all models
+        # Get predictions from the selected models, concurrently
+        result = ensemble.run(features, models=models, mode=mode, quorum=quorum, get_model=text_models.__getitem__)
         predictions = {}
-        for model_name, model in models.items():
-            try:
-                pred = model.predict(features)[0]
-                predictions[model_name] = 'Not Credible' if pred == 1 else 'Credible'
-            except Exception as model_error:
-                logger.error(f"Error in {model_name} prediction: {str(model_error)}")
-                predictions[model_name] = f'Error: {str(model_error)}'
-
-        logger.info("Predictions generated successfully")
-        return jsonify({
+        for model_name in models:
+            if model_name in result['outcomes']:
+                ok, value = result['outcomes'][model_name]
+                predictions[model_name] = credibility_label(value) if ok else f'Error: {str(value)}'
+
+        response = {
             'status': 'success',
-            'predictions': predictions
-        })
+            'predictions': predictions,
+            'verdict': credibility_label(result['verdict']) if result['verdict'] is not None else None,
+            'model_version': version
+        }
+        if mode == 'fast':
+            response['skipped'] = result['skipped']
+        # Timings describe this computation, so cache hits are served without them
+        if not any(str(p).startswith('Error') for p in predictions.values()):
+            result_cache.set(cache_key, response)
+        response = dict(response, timings_ms=result['timings_ms'])
+
+        request_logger.info("Predictions generated successfully")
+        return response, 200
 
     except Exception as e:
         logger.error(f"Server error in /predict: {str(e)}")
-        return jsonify({'error': f'Internal Server Error: {str(e)}'}), 500
+        return {'error': f'Internal Server Error: {str(e)}'}, 500
 
-# /ocr endpoint: Image text extraction
-@app.route('/ocr', methods=['POST'])
-def ocr_api():
+# /predict/batch endpoint: Text credibility prediction for many articles in one call
+def predict_batch_response(data):
+    if TEXT_GROUP in inference_pools:
+        return pool_response(TEXT_GROUP, "predict_batch_response", data)
+    try:
+        items = data.get('items') if isinstance(data, dict) else None
+
+        if not isinstance(items, list) or not items:
+            logger.warning("Items list is required but not provided")
+            return {'error': 'Items must be a non-empty list'}, 400
+        if len(items) > MAX_BATCH_ITEMS:
+            logger.warning(f"Batch of {len(items)} items exceeds limit of {MAX_BATCH_ITEMS}")
+            return {'error': f'At most {MAX_BATCH_ITEMS} items are allowed per batch'}, 400
+
+        # Validate each item on its own so a bad item only fails itself
+        results = [None] * len(items)
+        valid_rows, contents, brands = [], [], []
+        for row, item in enumerate(items):
+            content = item.get('content') if isinstance(item, dict) else None
+            if not content or not isinstance(content, str):
+                results[row] = {'error': 'Content is required'}
+                continue
+            valid_rows.append(row)
+            contents.append(content)
+            brands.append(str(item.get('brand', 'Unknown')))
+
+        text_models, version = model_registry.snapshot(["text_features"] + TEXT_MODEL_NAMES)
+        if valid_rows:
+            # Vectorize all valid items into one sparse matrix
+            features = preprocess_batch(contents, brands, text_models["text_features"])
+            if features is not None and features.shape[0] == len(valid_rows):
+                for row, predictions in zip(valid_rows, predict_batch(features, text_models)):
+                    results[row] = {'status': 'success', 'predictions': predictions}
+            else:
+                # Fall back to per-item preprocessing to isolate the failing items
+                logger.error("Batch feature preprocessing failed, retrying per item")
+                for row, content, brand in zip(valid_rows, contents, brands):
+                    item_features = preprocess_input(content, brand, text_models["text_features"])
+                    if item_features is None or item_features.shape[0] == 0:
+                        results[row] = {'error': 'Feature preprocessing failed'}
+                    else:
+                        results[row] = {'status': 'success', 'predictions': predict_batch(item_features, text_models)[0]}
+
+        request_logger.info(f"Batch predictions generated for {len(valid_rows)}/{len(items)} items")
+        return {
+            'status': 'success',
+            'results': results,
+            'model_version': version
+        }, 200
+
+    except Exception as e:
+        logger.error(f"Server error in /predict/batch: {str(e)}")
+        return {'error': f'Internal Server Error: {str(e)}'}, 500
+
+# /ocr response body for a decoded image of an upload of `size` (see
+# ocr_image_regions); OCR queue and timeout errors are raised, and None is
+# returned when OCR fails
+def extract_text(img, mode, lang, psm, size=None):
+    if mode == "regions":
+        extracted_text, regions = ocr_image_regions(img, lang=lang, psm=psm, size=size)
+    else:
+        extracted_text, regions = ocr_image(img, lang=lang, psm=psm), None
+    if extracted_text is None:
+        return None
+    response = {"extracted_text": extracted_text}
+    if regions is not None:
+        response["regions"] = regions
+    response["model_version"] = endpoint_version("ocr")
+    return response
+
+# Cache key of an /ocr result; OCR options change the text, so they are part of it
+def ocr_cache_key(image_bytes, mode, lang, psm):
+    return result_cache.make_key("/ocr", image_bytes, f"{endpoint_version('ocr')}:{mode}:{lang}:{psm}")
+
+# /ocr endpoint: Image text extraction; image_bytes is None when no image was uploaded
+def ocr_response(image_bytes, form):
     try:
         # Check if an image is provided in the request
-        if 'image' not in request.files:
+        if image_bytes is None:
             logger.warning("No image file found in request for /ocr")
-            return jsonify({"error": "No image file found in the request"}), 400
-        
-        # Get the image file from the request
-        file = request.files['image']
+            return {"error": "No image file found in the request"}, 400
+
+        # Optional OCR mode, Tesseract language and page segmentation mode
+        mode = form.get('mode') or OCR_DEFAULT_MODE
+        if mode not in OCR_MODES:
+            logger.warning(f"Invalid OCR mode: {mode}")
+            return {"error": f"Invalid OCR mode: {mode}"}, 400
+        try:
+            lang, psm = ocr_engine.validate_options(form.get('lang'), form.get('psm'))
+        except ValueError as e:
+            logger.warning(f"Invalid OCR options: {str(e)}")
+            return {"error": str(e)}, 400
+
+        # Serve repeated uploads of the same image from the cache
+        cache_key = ocr_cache_key(image_bytes, mode, lang, psm)
+        cached = result_cache.get("/ocr", cache_key)
+        if cached is not None:
+            request_logger.info("/ocr response served from result cache")
+            return cached, 200
         
-        # Convert the image file to a format that OpenCV can work with
-        img_array = np.frombuffer(file.read(), np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        # Decode upright, at reduced resolution for photos far larger than OCR uses
+        img = decode_image(image_bytes, target_side=OCR_MAX_SIDE)
         if img is None:
             logger.error("Failed to decode image for /ocr")
-            return jsonify({"error": "Invalid image file"}), 400
+            return {"error": "Invalid image file"}, 400
         
         # Perform OCR on the image
-        extracted_text = ocr_image(img)
-        if extracted_text is None:
+        try:
+            response = extract_text(img, mode, lang, psm, upright_size(image_bytes))
+        except OCRQueueFull:
+            logger.warning("OCR queue is full, rejecting request")
+            return {"error": "OCR service is busy, please retry"}, 503, {"Retry-After": "1"}
+        except OCRTimeout:
+            logger.error("OCR processing timed out")
+            return {"error": "OCR processing timed out"}, 504
+        if response is None:
             logger.error("OCR processing failed")
-            return jsonify({"error": "OCR processing failed"}), 500
+            return {"error": "OCR processing failed"}, 500
+
+        result_cache.set(cache_key, response)
 
-        logger.info("OCR text extracted successfully")
-        return jsonify({"extracted_text": extracted_text})
+        request_logger.info("OCR text extracted successfully")
+        return response, 200
 
     except Exception as e:
         logger.error(f"Server error in /ocr: {str(e)}")
-        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+        return {"error": f"Internal Server Error: {str(e)}"}, 500
 
-# /process_image endpoint: YOLO object detection
-@app.route('/process_image', methods=['POST'])
-def process_image():
+# /process_image response body for a model input letterboxed to profile.imgsz
+def detect_objects(img, profile):
+    result, version = yolo_batcher((img, profile), timeout=YOLO_RESULT_TIMEOUT_S, deadline=current_deadline())
+
+    # Labels of all detections at once from the class tensor
+    labels = label_array(result.names)[detected_classes(result)].tolist()
+    return {"yolo_labels": labels, "model_version": version}
+
+# /process_image endpoint: YOLO object detection. Optional form fields choose
+# an inference profile or override its settings.
+def process_image_response(image_bytes, form=None):
     try:
         # Check if an image is provided in the request
-        if 'image' not in request.files:
+        if image_bytes is None:
             logger.warning("No image file found in request for /process_image")
-            return jsonify({"error": "No image file found in the request"}), 400
-        
-        # Get the image file from the request
-        file = request.files['image']
+            return {"error": "No image file found in the request"}, 400
+        try:
+            profile = yolo_request_profile("yolo", form)
+        except ValueError as e:
+            logger.warning(f"Invalid inference options: {str(e)}")
+            return {"error": str(e)}, 400
+
+        # Serve repeated uploads of the same image from the cache
+        cache_key = image_cache_key("process_image", image_bytes, endpoint_version("process_image"), profile)
+        cached = result_cache.get("/process_image", cache_key)
+        if cached is not None:
+            request_logger.info("/process_image response served from result cache")
+            return cached, 200
         
-        # Convert image to numpy array for OpenCV
-        img_array = np.frombuffer(file.read(), np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        # Decode at reduced resolution straight into the letterboxed model input
+        img = decode_letterboxed(image_bytes, profile.imgsz)
         if img is None:
             logger.error("Failed to decode image for /process_image")
-            return jsonify({"error": "Invalid image file"}), 400
+            return {"error": "Invalid image file"}, 400
         
         # Perform YOLO object detection
         logger.debug("Performing YOLO object detection")
-        img_resized = cv2.resize(img, (640, 640))
-        results = yolo_model(img_resized)
-        
-        # Extract only the labels from YOLO detections
-        labels = []
-        for detection in results[0].boxes:
-            class_idx = int(detection.cls[0])  # Class index
-            label = yolo_model.names[class_idx]  # Class name
-            labels.append(label)
-        
-        logger.info(f"Detected {len(labels)} objects")
-        return jsonify({"yolo_labels": labels})
+        response = detect_objects(img, profile)
+        result_cache.set(image_cache_key("process_image", image_bytes, response["model_version"], profile), response)
+
+        request_logger.info(f"Detected {len(response['yolo_labels'])} objects")
+        return response, 200
     
     except Exception as e:
         logger.error(f"Server error in /process_image: {str(e)}")
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
+        return {"error": f"Server error: {str(e)}"}, 500
+
+# /process_stream: object detection over a frame stream (MJPEG body, video
+# file or WebSocket frames) with the /process_image model and batcher.
+# STREAM_MAX_FPS caps inferred frames per second of stream time (0: no cap),
+# STREAM_DEFAULT_FPS is the frame rate assumed for MJPEG bodies, and
+# STREAM_MAX_VIDEO_MB bounds spooled video uploads.
+STREAM_MAX_FPS = float(os.environ.get("STREAM_MAX_FPS", "10"))
+STREAM_DEFAULT_FPS = float(os.environ.get("STREAM_DEFAULT_FPS", "15"))
+STREAM_MAX_VIDEO_BYTES = int(float(os.environ.get("STREAM_MAX_VIDEO_MB", "100")) * 1024 * 1024)
+
+# [(label, [x1, y1, x2, y2])] of one letterboxed image
+def detect_boxes(img, profile):
+    result, _ = yolo_batcher((img, profile), timeout=YOLO_RESULT_TIMEOUT_S, deadline=current_deadline())
+    labels = label_array(result.names)[detected_classes(result)].tolist()
+    return list(zip(labels, result.boxes.xyxy.tolist()))
+
+# Model input of a stream frame: JPEG bytes are decoded at reduced
+# resolution, decoded video frames only letterboxed
+def decode_stream_frame(frame, size):
+    if frame is None:
+        return None
+    if isinstance(frame, (bytes, bytearray)):
+        return decode_letterboxed(frame, size)
+    with stage("resize"):
+        return letterbox(frame, size, out=letterbox_buffer(size))
+
+def stream_param(params, name, default, cast=float, low=0):
+    value = cast(params.get(name, default))
+    if value < low:
+        raise ValueError(f"{name} must be at least {low}")
+    return value
+
+# Detection session of one stream from its query parameters: max_fps, fps
+# (MJPEG frame rate), min_hits, max_missed and iou, plus the inference
+# profile fields of /process_image; raises ValueError
+def stream_session(params):
+    profile = yolo_request_profile("yolo", params)
+    tracker = IouTracker(iou_threshold=stream_param(params, "iou", 0.3),
+                         min_hits=stream_param(params, "min_hits", 2, int, 1),
+                         max_missed=stream_param(params, "max_missed", 3, int))
+    return StreamSession(lambda img: detect_boxes(img, profile), lambda frame: decode_stream_frame(frame, profile.imgsz),
+                         stream_param(params, "max_fps", STREAM_MAX_FPS), tracker)
+
+def uploaded_stream(params, content_type):
+    return UploadedStream(stream_session(params), content_type,
+                          fps=stream_param(params, "fps", STREAM_DEFAULT_FPS, low=0.001),
+                          max_video_bytes=STREAM_MAX_VIDEO_BYTES)
+
+# /process_stream response lines for a request body given as an iterator of
+# chunks: a label-delta event per change, then a summary (or an error line)
+def process_stream_lines(stream, chunks):
+    try:
+        for chunk in chunks:
+            for event in stream.feed(chunk):
+                yield json.dumps(event) + "\n"
+        for event in stream.finish():
+            yield json.dumps(event) + "\n"
+    except Exception as e:
+        logger.error(f"Server error in /process_stream: {str(e)}")
+        yield json.dumps({"error": f"Server error: {str(e)}"}) + "\n"
+    finally:
+        stream.close()
 
 # First aid information for wounds
 FIRST_AID = {
@@ -274,73 +915,443 @@ FIRST_AID = {
     }
 }
 
-# /wound endpoint: Wound detection using YOLO
-@app.route('/wound', methods=['POST'])
-def wound_detection():
+# Map predicted wound class names to standardized names
+WOUND_CLASS_MAPPING = {
+    "Otarcie": "Abrasion",
+    "Laseration": "Laceration",
+    "Rana kluta": "Stab Wound",
+    "Bruises": "Bruise",
+    "Burn": "Burn",
+    "Cut": "Cut"
+}
+
+# /wound response body for a model input letterboxed to profile.imgsz
+def detect_wounds(img, profile):
+    result, version = wound_batcher((img, profile), timeout=YOLO_RESULT_TIMEOUT_S, deadline=current_deadline())
+
+    # Unique labels from the class tensor, mapped to standardized names if applicable
+    labels = {WOUND_CLASS_MAPPING.get(label, label)
+              for label in label_array(result.names)[np.unique(detected_classes(result))]}
+
+    # Prepare response with unique labels and first aid
+    response = {
+        "detected_wounds": [],
+        "message": "No wounds detected." if not labels else f"Detected {len(labels)} unique wound type(s).",
+        "model_version": version
+    }
+
+    if labels:
+        for label in labels:
+            wound_info = FIRST_AID.get(label, {
+                "definition": "Unknown wound type.",
+                "first_aid": ["Seek medical attention."]
+            })
+            response["detected_wounds"].append({
+                "wound_type": label,
+                "definition": wound_info["definition"],
+                "first_aid": wound_info["first_aid"]
+            })
+    return response
+
+# Near-duplicate /wound uploads (a burst of photos of the same wound) reuse
+# the detection of the first: WOUND_DEDUP_MAX_DISTANCE is the most bits the
+# perceptual hashes may differ (-1 turns this off), WOUND_DEDUP_MAX_ENTRIES
+# how many recent detections are kept
+wound_index = NearDuplicateIndex(max_entries=int(os.environ.get("WOUND_DEDUP_MAX_ENTRIES", "512")),
+                                 max_distance=int(os.environ.get("WOUND_DEDUP_MAX_DISTANCE", "4")))
+
+def form_flag(form, name):
+    return str((form or {}).get(name, "")).strip().lower() in ("1", "true", "yes", "on")
+
+# /wound endpoint: Wound detection using YOLO. A `fresh` form field skips
+# both caches and runs the model (its result replaces the cached ones), and
+# inference profile fields work as for /process_image.
+def wound_response(image_bytes, form=None):
     try:
         # Check if an image is provided in the request
-        if 'image' not in request.files:
+        if image_bytes is None:
             logger.warning("No image file found in request for /wound")
-            return jsonify({"error": "No image file found in the request"}), 400
-        
-        # Get the image file from the request
-        file = request.files['image']
+            return {"error": "No image file found in the request"}, 400
+        try:
+            profile = yolo_request_profile("wound", form)
+        except ValueError as e:
+            logger.warning(f"Invalid inference options: {str(e)}")
+            return {"error": str(e)}, 400
+
+        # Serve repeated uploads of the same image from the cache
+        fresh = form_flag(form, "fresh")
+        version = endpoint_version("wound")
+        cache_key = image_cache_key("wound", image_bytes, version, profile)
+        cached = None if fresh else result_cache.get("/wound", cache_key)
+        if cached is not None:
+            request_logger.info("/wound response served from result cache")
+            return cached, 200
         
-        # Convert image to numpy array for OpenCV
-        img_array = np.frombuffer(file.read(), np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        # Decode at reduced resolution straight into the letterboxed model input
+        img = decode_letterboxed(image_bytes, profile.imgsz)
         if img is None:
             logger.error("Failed to decode image for /wound")
-            return jsonify({"error": "Invalid image file"}), 400
+            return {"error": "Invalid image file"}, 400
+
+        # A different upload of (nearly) the same picture; the index holds
+        # results of the deployment's profile only
+        use_index = wound_index.enabled and profile == YOLO_PROFILES["wound"]
+        if use_index:
+            with stage("hash"):
+                img_hash = image_hash(img)
+            if fresh:
+                wound_index.record_forced()
+            else:
+                response = wound_index.lookup(img_hash, version)
+                if response is not None:
+                    request_logger.info("/wound response served from near-duplicate index")
+                    result_cache.set(cache_key, response)
+                    return response, 200
         
         # Perform YOLO wound detection
         logger.debug("Performing YOLO wound detection")
-        img_resized = cv2.resize(img, (640, 640))
-        results = wound_model(img_resized)
-        
-        # Map predicted class names to standardized names
-        class_mapping = {
-            "Otarcie": "Abrasion",
-            "Laseration": "Laceration",
-            "Rana kluta": "Stab Wound",
-            "Bruises": "Bruise",
-            "Burn": "Burn",
-            "Cut": "Cut"
-        }
-        
-        # Extract unique labels from YOLO detections
-        labels = set()
-        for detection in results[0].boxes:
-            class_idx = int(detection.cls[0])  # Class index
-            label = wound_model.names[class_idx]  # Class name
-            # Map to standardized name if applicable
-            standardized_label = class_mapping.get(label, label)
-            labels.add(standardized_label)
-        
-        # Prepare response with unique labels and first aid
-        response = {
-            "detected_wounds": [],
-            "message": "No wounds detected." if not labels else f"Detected {len(labels)} unique wound type(s)."
-        }
-        
-        if labels:
-            for label in labels:
-                wound_info = FIRST_AID.get(label, {
-                    "definition": "Unknown wound type.",
-                    "first_aid": ["Seek medical attention."]
-                })
-                response["detected_wounds"].append({
-                    "wound_type": label,
-                    "definition": wound_info["definition"],
-                    "first_aid": wound_info["first_aid"]
-                })
-        
-        logger.info(f"Wound detection completed: {response['message']}")
-        return jsonify(response)
+        start = time.perf_counter()
+        response = detect_wounds(img, profile)
+        # Stored under the version that ran, which a reload may have changed
+        if use_index:
+            wound_index.add(img_hash, response["model_version"], response, time.perf_counter() - start)
+        result_cache.set(image_cache_key("wound", image_bytes, response["model_version"], profile), response)
+
+        request_logger.info(f"Wound detection completed: {response['message']}")
+        return response, 200
     
     except Exception as e:
         logger.error(f"Server error in /wound: {str(e)}")
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
+        return {"error": f"Server error: {str(e)}"}, 500
+
+# /analyze tasks and the endpoint whose models each one uses; a task is only
+# available when that endpoint is enabled. Results are collected in this
+# order, so credibility starts as soon as OCR is done.
+ANALYZE_TASKS = {
+    "ocr": "ocr",
+    "credibility": "predict",
+    "objects": "process_image",
+    "wounds": "wound"
+}
+# Threads that run the tasks of /analyze requests; tasks mostly wait on the
+# OCR pool and the YOLO batchers, so this can exceed the CPU count
+analyze_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("ANALYZE_WORKERS", "16")),
+                                  thread_name_prefix="analyze")
+
+# Run fn(*args), returning (body, elapsed ms); failures become an error body
+def run_task(task, fn, *args):
+    start = time.perf_counter()
+    try:
+        body = fn(*args)
+        if body is None:
+            body = {"error": f"Task {task} failed"}
+    except OCRQueueFull:
+        body = {"error": "OCR service is busy, please retry"}
+    except OCRTimeout:
+        body = {"error": "OCR processing timed out"}
+    except Exception as e:
+        logger.error(f"Error in /analyze task {task}: {str(e)}")
+        body = {"error": f"Server error: {str(e)}"}
+    return body, round((time.perf_counter() - start) * 1000.0, 3)
+
+# /analyze endpoint: several image tasks on one upload, decoded once and run concurrently
+def analyze_response(image_bytes, form):
+    try:
+        # Check if an image is provided in the request
+        if image_bytes is None:
+            logger.warning("No image file found in request for /analyze")
+            return {"error": "No image file found in the request"}, 400
+
+        # Requested tasks (default: every enabled image task); credibility
+        # checks the OCR'd text, so it brings OCR with it
+        available = [task for task, endpoint in ANALYZE_TASKS.items() if endpoint in ENABLED_ENDPOINTS]
+        requested = form.get('tasks')
+        if requested:
+            tasks = list(dict.fromkeys(task.strip() for task in requested.split(",") if task.strip()))
+        else:
+            tasks = [task for task in available if task != "credibility"]
+        unknown = [task for task in tasks if task not in ANALYZE_TASKS]
+        if unknown:
+            logger.warning(f"Unknown /analyze tasks: {unknown}")
+            return {"error": f"Unknown tasks: {', '.join(unknown)}"}, 400
+        if "credibility" in tasks:
+            tasks.append("ocr")
+        tasks = [task for task in ANALYZE_TASKS if task in tasks]
+        unavailable = [task for task in tasks if task not in available]
+        if unavailable:
+            logger.warning(f"Unavailable /analyze tasks: {unavailable}")
+            return {"error": f"Tasks not enabled on this server: {', '.join(unavailable)}"}, 400
+        if not tasks:
+            logger.warning("No /analyze tasks requested or enabled")
+            return {"error": "No tasks to run"}, 400
+
+        # OCR options, as for /ocr
+        mode = form.get('mode') or OCR_DEFAULT_MODE
+        lang = psm = None
+        if "ocr" in tasks:
+            if mode not in OCR_MODES:
+                logger.warning(f"Invalid OCR mode: {mode}")
+                return {"error": f"Invalid OCR mode: {mode}"}, 400
+            try:
+                lang, psm = ocr_engine.validate_options(form.get('lang'), form.get('psm'))
+            except ValueError as e:
+                logger.warning(f"Invalid OCR options: {str(e)}")
+                return {"error": str(e)}, 400
+
+        # Inference profile fields, as for /process_image, apply to both YOLO
+        # tasks; their class names differ, so there is no class filter here
+        profiles = {}
+        try:
+            for task, model_name in (("objects", "yolo"), ("wounds", "wound")):
+                if task in tasks:
+                    profiles[task] = yolo_request_profile(model_name, form, with_classes=False)
+        except ValueError as e:
+            logger.warning(f"Invalid inference options: {str(e)}")
+            return {"error": str(e)}, 400
+
+        # Image tasks share the cache entries of their own endpoints, so a photo
+        # already sent to /ocr, /process_image or /wound is not processed again
+        cache_keys = {"ocr": ("/ocr", ocr_cache_key(image_bytes, mode, lang, psm))}
+        for task, profile in profiles.items():
+            endpoint = ANALYZE_TASKS[task]
+            cache_keys[task] = (f"/{endpoint}", image_cache_key(endpoint, image_bytes, endpoint_version(endpoint), profile))
+        results, timings, cached = {}, {}, []
+        for task in tasks:
+            if task in cache_keys:
+                body = result_cache.get(*cache_keys[task])
+                if body is not None:
+                    results[task] = body
+                    cached.append(task)
+        pending = [task for task in tasks if task in cache_keys and task not in results]
+
+        # Decode once: at OCR resolution when OCR runs (or at the larger input
+        # side when the YOLO tasks use different ones), with the YOLO inputs
+        # letterboxed from that image; otherwise straight into the YOLO input
+        futures = {}
+        if pending:
+            start = time.perf_counter()
+            sizes = sorted({profiles[task].imgsz for task in pending if task in profiles})
+            if "ocr" in pending or len(sizes) > 1:
+                img = decode_image(image_bytes, target_side=OCR_MAX_SIDE if "ocr" in pending else sizes[-1])
+                model_inputs = {}
+                if img is not None and sizes:
+                    with stage("resize"):
+                        model_inputs = {size: letterbox(img, size, out=letterbox_buffer(size)) for size in sizes}
+            else:
+                img = decode_letterboxed(image_bytes, sizes[0])
+                model_inputs = {sizes[0]: img}
+            if img is None:
+                logger.error("Failed to decode image for /analyze")
+                return {"error": "Invalid image file"}, 400
+            timings["decode"] = round((time.perf_counter() - start) * 1000.0, 3)
+
+            # A letterboxed input is only read, so YOLO tasks of one size share it
+            runners = {"ocr": (extract_text, img, mode, lang, psm, upright_size(image_bytes))}
+            for task, detect in (("objects", detect_objects), ("wounds", detect_wounds)):
+                if task in pending:
+                    runners[task] = (detect, model_inputs[profiles[task].imgsz], profiles[task])
+            # Tasks run on pool threads, under this request's deadline
+            task_runner = with_deadline(current_deadline(), run_task)
+            futures = {task: analyze_pool.submit(task_runner, task, *runners[task]) for task in pending}
+
+        # Credibility of the OCR'd text starts as soon as OCR is done, while
+        # the YOLO tasks may still be running
+        for task in tasks:
+            if task in futures:
+                results[task], timings[task] = futures[task].result()
+                if "error" not in results[task]:
+                    cache_key = cache_keys[task][1] if task == "ocr" else \
+                        image_cache_key(ANALYZE_TASKS[task], image_bytes, results[task]["model_version"], profiles[task])
+                    result_cache.set(cache_key, results[task])
+            elif task == "credibility":
+                text = results["ocr"].get("extracted_text", "").strip()
+                if text:
+                    article = {"content": text, "brand": form.get('brand') or "Unknown"}
+                    results[task], timings[task] = run_task(task, lambda: predict_response(article, {})[0])
+                else:
+                    results[task] = {"error": "No text found in the image"}
+
+        request_logger.info(f"/analyze completed tasks {tasks} ({len(cached)} from cache)")
+        return {
+            "status": "success",
+            "results": results,
+            "cached": cached,
+            "timings_ms": timings
+        }, 200
+
+    except Exception as e:
+        logger.error(f"Server error in /analyze: {str(e)}")
+        return {"error": f"Internal Server Error: {str(e)}"}, 500
+
+# Values the batchers, OCR pool and result cache already keep, read by /metrics at scrape time
+metrics.callback("api_queue_depth", "Requests waiting for a YOLO batch, an OCR worker or an inference pool", ("queue",),
+                 lambda: {("yolo",): yolo_batcher.queue_depth(), ("wound",): wound_batcher.queue_depth(),
+                          ("ocr",): ocr_engine.queue_depth(),
+                          **{(f"pool_{family}",): pool.queue_depth() for family, pool in inference_pools.items()}})
+metrics.callback("api_cache_hits_total", "Result cache hits by endpoint", ("endpoint",),
+                 lambda: {(endpoint.strip("/"),): counts["hits"] for endpoint, counts in result_cache.stats()["by_endpoint"].items()},
+                 kind="counter")
+metrics.callback("api_cache_misses_total", "Result cache misses by endpoint", ("endpoint",),
+                 lambda: {(endpoint.strip("/"),): counts["misses"] for endpoint, counts in result_cache.stats()["by_endpoint"].items()},
+                 kind="counter")
+metrics.callback("api_near_duplicate_lookups_total", "/wound near-duplicate index lookups by result", ("result",),
+                 lambda: {(result,): wound_index.stats()[key]
+                          for result, key in (("hit", "hits"), ("miss", "misses"), ("forced", "forced"))},
+                 kind="counter")
+metrics.callback("api_near_duplicate_saved_seconds_total", "Inference time saved by /wound near-duplicate hits", (),
+                 lambda: {(): wound_index.stats()["saved_seconds"]}, kind="counter")
+metrics.callback("api_endpoint_waiting", "Requests waiting for an endpoint slot", ("endpoint",),
+                 lambda: {(name,): admission.waiting(name) for name in admission.limits})
+metrics.callback("api_endpoint_in_flight", "Requests running per endpoint", ("endpoint",),
+                 lambda: {(name,): admission.in_flight(name) for name in admission.limits})
+metrics.callback("api_endpoint_rejected_total",
+                 "Requests shed by admission control (reason is queue_full, overloaded or expired)",
+                 ("endpoint", "reason"), admission.rejected, kind="counter")
+metrics.callback("api_model_loaded", "Whether each registered model is loaded (1) or not (0)", ("model",),
+                 lambda: {(name,): int(model["loaded"]) for name, model in model_registry.stats()["models"].items()})
+
+# /stats endpoint: batching metrics (batch-size distribution and queue wait), result cache and OCR pool counters
+def stats_response():
+    return {
+        "batching": {
+            "yolo": yolo_batcher.stats(),
+            "wound": wound_batcher.stats()
+        },
+        "admission": admission.stats(),
+        "cache": result_cache.stats(),
+        "near_duplicate": {"wound": wound_index.stats()},
+        "ocr": ocr_engine.stats(),
+        "inference_pools": {family: pool.stats() for family, pool in inference_pools.items()},
+        "shared_memory": shared_images.stats(),
+        "model_versions": {endpoint: endpoint_version(endpoint) for endpoint in ("predict", "ocr", "process_image", "wound")},
+        "model_backends": MODEL_BACKENDS,
+        "yolo_profiles": {name: profile.key for name, profile in YOLO_PROFILES.items()},
+        "ensemble": ensemble.stats(),
+        "models": model_registry.stats(),
+        "process": {"pid": os.getpid(), "memory": process_memory()}
+    }, 200
+
+# POST /admin/reload: reload model groups from their weight files now instead
+# of waiting for the watcher. Off unless ADMIN_TOKEN is set; requests must send
+# it as "Authorization: Bearer <token>".
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+reload_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-reload")
+
+def admin_authorized(authorization):
+    expected = f"Bearer {ADMIN_TOKEN}".encode("utf-8")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest((authorization or "").encode("utf-8"), expected)
+
+# Loads in the background (202) unless `wait` is set; `models` names model
+# groups or models (default: every group). Pooled groups are reloaded in each
+# of their pool's workers, whose versions are listed under "workers"
+def reload_response(authorization, data):
+    if not ADMIN_TOKEN:
+        return {"error": "Endpoint /admin/reload is not enabled on this server"}, 404
+    if not admin_authorized(authorization):
+        logger.warning("Unauthorized /admin/reload request")
+        return {"error": "Unauthorized"}, 401
+    data = data if isinstance(data, dict) else {}
+    requested = data.get("models") or model_registry.groups()
+    if isinstance(requested, str):
+        requested = [name.strip() for name in requested.split(",") if name.strip()]
+    groups = []
+    for name in requested:
+        if name in model_registry.groups():
+            groups.append(name)
+        elif name in model_registry.names():
+            groups.append(model_registry.group_of(name))
+        else:
+            return {"error": f"Unknown model: {name}"}, 400
+    groups = list(dict.fromkeys(groups))
+
+    if not form_flag(data, "wait"):
+        for group in groups:
+            reload_pool.submit(reload_group, group)
+        logger.info(f"Reloading model groups {groups} in the background")
+        return {"status": "reloading", "groups": groups}, 202
+    versions, workers, errors = {}, {}, {}
+    for group in groups:
+        try:
+            by_worker = reload_group(group)
+        except Exception as e:
+            errors[group] = str(e)
+            continue
+        # One version per group, or a list while its processes disagree
+        reported = sorted(set(by_worker.values()), key=str)
+        versions[group] = reported[0] if len(reported) == 1 else reported
+        if group in inference_pools:
+            workers[group] = {str(pid): version for pid, version in by_worker.items()}
+    body = {"versions": versions}
+    if workers:
+        body["workers"] = workers
+    if errors:
+        return dict(body, error="Reload failed, the previous versions keep serving", errors=errors), 500
+    return dict(body, status="reloaded"), 200
+
+# Whole upload of the "image" form field, or None when the request has none
+def uploaded_image_bytes():
+    # Werkzeug parses the multipart body on first access, so this times the upload read
+    with stage("upload"):
+        file = request.files.get('image')
+        return file.read() if file is not None else None
+
+# Flask routes
+@app.route('/predict', methods=['POST'])
+def predict():
+    return predict_response(request.get_json(silent=True), request.args)
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch_api():
+    return predict_batch_response(request.get_json(silent=True))
+
+@app.route('/ocr', methods=['POST'])
+def ocr_api():
+    return ocr_response(uploaded_image_bytes(), request.form)
+
+@app.route('/process_image', methods=['POST'])
+def process_image():
+    return process_image_response(uploaded_image_bytes(), request.form)
+
+@app.route('/wound', methods=['POST'])
+def wound_detection():
+    return wound_response(uploaded_image_bytes(), request.form)
+
+@app.route('/process_stream', methods=['POST'])
+def process_stream():
+    try:
+        stream = uploaded_stream(request.args, request.content_type)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    chunks = iter(lambda: request.stream.read(64 * 1024), b"")
+    return Response(stream_with_context(process_stream_lines(stream, chunks)), content_type="application/x-ndjson")
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    return analyze_response(uploaded_image_bytes(), request.form)
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    return reload_response(request.headers.get('Authorization'), request.get_json(silent=True))
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return stats_response()
+
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
+    # Spawned pool workers would run this script again as their main module
+    if inference_pools:
+        raise SystemExit("INFERENCE_POOLS_CONFIG needs the server to import allAPI: use asgiAPI.py "
+                         "or `flask --app allAPI run`")
+    # Start the OCR workers before the server spawns any request threads
+    # (with the debug reloader, only its child process serves requests)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        if "ocr" in ENABLED_ENDPOINTS:
+            ocr_engine.start()
+        # MODEL_WARMUP=1 loads the enabled endpoints' models before serving
+        if os.environ.get("MODEL_WARMUP", "0") == "1":
+            warmup_models()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
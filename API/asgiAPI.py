@@ -0,0 +1,366 @@
+# ASGI front end for the same endpoints as allAPI.py, for serving under uvicorn:
+#   python API/asgiAPI.py --port 5000  (from the repository root, like allAPI.py)
+# Uploads are received on the event loop without holding a worker thread, and
+# decoding and inference run on a bounded thread pool per endpoint.
+import argparse
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile
+
+import allAPI
+from admission import DEADLINE_HEADER, AdmissionRejected, expired, parse_deadline, with_deadline
+from instrumentation import CONTENT_TYPE, metrics, record_request, stage
+
+logger = logging.getLogger(__name__)
+# uvicorn's access log line per request is sampled like allAPI's request logging
+logging.getLogger("uvicorn.access").addFilter(allAPI.request_log_filter)
+
+# Largest accepted request body; bigger uploads are cut off with 413
+MAX_UPLOAD_BYTES = int(float(os.environ.get("MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+
+
+class UploadTooLarge(Exception):
+    """Raised while receiving a request body over MAX_UPLOAD_BYTES."""
+
+
+class EndpointLimit:
+    """Thread pool of one endpoint, entered through allAPI's admission control.
+
+    A request first takes a slot from the shared AdmissionController (the
+    same limits, weighted queues and load shedding as the Flask server),
+    waiting on the event loop, then runs on the endpoint's own threads, so a
+    burst on one endpoint cannot take the threads of another.
+    """
+
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"asgi-{name}")
+
+    async def acquire(self, deadline=None):
+        # Raises AdmissionRejected; returns the start time to pass to release()
+        await allAPI.admission.enter_async(self.name, deadline)
+        return time.perf_counter()
+
+    def release(self, started):
+        allAPI.admission.release(self.name, time.perf_counter() - started)
+
+    async def run(self, fn, deadline, *args):
+        started = await self.acquire(deadline)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, with_deadline(deadline, fn), *args)
+        finally:
+            self.release(started)
+
+
+limits = {name: EndpointLimit(name, concurrency) for name, concurrency in allAPI.admission.limits.items()}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if "ocr" in allAPI.ENABLED_ENDPOINTS:
+        allAPI.ocr_engine.start()
+    if os.environ.get("MODEL_WARMUP", "0") == "1":
+        allAPI.warmup_models()
+    allAPI.start_inference_pools()
+    allAPI.model_watcher.ensure_started()
+    yield
+    for limit in limits.values():
+        limit.executor.shutdown(wait=False, cancel_futures=True)
+    allAPI.ocr_engine.shutdown()
+    allAPI.shutdown_inference_pools()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+def json_response(result):
+    body, status, *headers = result
+    with stage("serialize"):
+        return JSONResponse(body, status_code=status, headers=headers[0] if headers else None)
+
+
+@app.middleware("http")
+async def reject_disabled_endpoints(request, call_next):
+    # Also records the latency and status of every request, and starts the
+    # deadline clock before the upload is received
+    start = time.perf_counter()
+    request.state.deadline = parse_deadline(request.headers.get(DEADLINE_HEADER))
+    disabled = allAPI.disabled_endpoint_response(request.url.path)
+    response = json_response(disabled) if disabled is not None else await call_next(request)
+    record_request(allAPI.endpoint_label(request.url.path), response.status_code, time.perf_counter() - start)
+    return response
+
+
+async def run_endpoint(name, request, fn, *args):
+    deadline = request.state.deadline
+    try:
+        result = await limits[name].run(fn, deadline, *args)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected {request.url.path}: {str(e)}")
+        return json_response(e.response())
+    if result[1] >= 500 and expired(deadline):
+        result = allAPI.deadline_exceeded_response(name)
+    return json_response(result)
+
+
+def size_limited(request):
+    # Same request, but its body stream raises UploadTooLarge past MAX_UPLOAD_BYTES
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        received += len(message.get("body", b""))
+        if received > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+        return message
+    return Request(request.scope, receive)
+
+
+async def read_upload(request):
+    # (image bytes or None, other form fields). The multipart body is parsed as
+    # it streams in, with file parts spooled to a temporary file, so a slow
+    # client only costs an idle coroutine until the upload is complete.
+    if int(request.headers.get("content-length") or 0) > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    form = await size_limited(request).form()
+    try:
+        image = form.get("image")
+        image_bytes = await image.read() if isinstance(image, UploadFile) else None
+        fields = {key: value for key, value in form.items() if not isinstance(value, UploadFile)}
+    finally:
+        await form.close()
+    return image_bytes, fields
+
+
+async def image_endpoint(name, request, handler, with_form=False):
+    try:
+        with stage("upload"):
+            image_bytes, fields = await read_upload(request)
+    except UploadTooLarge as e:
+        logger.warning(str(e))
+        return JSONResponse({"error": str(e)}, status_code=413)
+    if with_form:
+        return await run_endpoint(name, request, handler, image_bytes, fields)
+    return await run_endpoint(name, request, handler, image_bytes)
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@app.post("/predict")
+async def predict(request: Request):
+    return await run_endpoint("predict", request, allAPI.predict_response, await read_json(request), request.query_params)
+
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request):
+    return await run_endpoint("predict/batch", request, allAPI.predict_batch_response, await read_json(request))
+
+
+@app.post("/ocr")
+async def ocr(request: Request):
+    return await image_endpoint("ocr", request, allAPI.ocr_response, with_form=True)
+
+
+@app.post("/process_image")
+async def process_image(request: Request):
+    return await image_endpoint("process_image", request, allAPI.process_image_response, with_form=True)
+
+
+@app.post("/wound")
+async def wound(request: Request):
+    return await image_endpoint("wound", request, allAPI.wound_response, with_form=True)
+
+
+@app.post("/analyze")
+async def analyze(request: Request):
+    return await image_endpoint("analyze", request, allAPI.analyze_response, with_form=True)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """Streamed response for an endpoint that keeps reading its request body.
+
+    StreamingResponse listens for the client disconnecting by reading
+    request messages, which would swallow the body still being uploaded;
+    here a disconnect surfaces through the body reader instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        finally:
+            try:
+                # Runs the body's cleanup now rather than whenever it is collected
+                await self.body_iterator.aclose()
+            finally:
+                if self.background is not None:
+                    await self.background()
+
+
+def blocking_chunks(body, loop):
+    # Chunks of an async request body, for code running on a worker thread
+    async def next_chunk():
+        return await body.__anext__()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(next_chunk(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+@app.post("/process_stream")
+async def process_stream(request: Request):
+    # NDJSON label deltas, streamed back while the body is still arriving
+    try:
+        stream = allAPI.uploaded_stream(request.query_params, request.headers.get("content-type"))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    limit = limits["process_stream"]
+    try:
+        started = await limit.acquire(request.state.deadline)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected {request.url.path}: {str(e)}")
+        return json_response(e.response())
+    loop = asyncio.get_running_loop()
+    lines = allAPI.process_stream_lines(stream, blocking_chunks(request.stream(), loop))
+    next_line = with_deadline(request.state.deadline, next)
+
+    def close():
+        # Closing lines closes the stream too, unless it never started
+        try:
+            lines.close()
+        finally:
+            stream.close()
+
+    async def body():
+        # Each step reads, decodes and infers on the endpoint's own threads
+        step = None
+        try:
+            while True:
+                step = loop.run_in_executor(limit.executor, next_line, lines, None)
+                line = await step
+                if line is None:
+                    return
+                yield line
+        finally:
+            # A client that leaves early must not leave a spooled video behind;
+            # a step cancelled mid-way still owns lines until its thread is done
+            if step is None or step.done():
+                close()
+            else:
+                step.add_done_callback(lambda _: close())
+    # The slot is released once the response ends, also when the client leaves early
+    return DuplexStreamingResponse(body(), media_type="application/x-ndjson",
+                                   background=BackgroundTask(limit.release, started))
+
+
+@app.websocket("/process_stream")
+async def process_stream_ws(websocket: WebSocket):
+    """Live detection: each binary message is one JPEG frame.
+
+    Frames are timed by arrival. While a frame is being inferred only the
+    newest one that arrives is kept, so a slow detector drops the backlog
+    instead of lagging behind the camera. Label-delta events are sent as
+    JSON text; sending the text "end" gets the summary before closing.
+    """
+    if allAPI.disabled_endpoint_response(websocket.url.path) is not None:
+        await websocket.close(code=1008)
+        return
+    try:
+        session = allAPI.stream_session(websocket.query_params)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    limit = limits["process_stream"]
+    try:
+        started = await limit.acquire(parse_deadline(websocket.headers.get(DEADLINE_HEADER)))
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected WebSocket {websocket.url.path}: {str(e)}")
+        await websocket.close(code=1013, reason=str(e))
+        return
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    latest = []
+    arrived = asyncio.Event()
+
+    async def receive():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return "disconnect"
+            if message.get("bytes") is not None:
+                if latest:
+                    session.skip()
+                latest[:] = [(time.perf_counter() - start, message["bytes"])]
+                arrived.set()
+            elif (message.get("text") or "").strip() == "end":
+                return "end"
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while latest or not receiver.done():
+            if not latest:
+                arrived.clear()
+                waiter = asyncio.ensure_future(arrived.wait())
+                await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                continue
+            t, frame = latest.pop()
+            event = await loop.run_in_executor(limit.executor, session.offer, t, frame)
+            if event is not None:
+                await websocket.send_json(event)
+        if receiver.result() == "end":
+            await websocket.send_json(session.summary())
+            await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Server error in /process_stream: {str(e)}")
+        await websocket.close(code=1011)
+    finally:
+        receiver.cancel()
+        limit.release(started)
+
+
+@app.post("/admin/reload")
+async def admin_reload(request: Request):
+    # With `wait`, the reload blocks a pool thread rather than the event loop
+    body, status = await asyncio.to_thread(allAPI.reload_response, request.headers.get("Authorization"),
+                                           await read_json(request))
+    return JSONResponse(body, status_code=status)
+
+
+@app.get("/stats")
+async def stats():
+    body, status = allAPI.stats_response()
+    return JSONResponse(body, status_code=status)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
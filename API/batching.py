@@ -0,0 +1,170 @@
+import collections
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects single-item requests into batches for one model.
+
+    Requests arriving within ``max_wait_ms`` of the first queued request are
+    grouped (up to ``max_batch_size``) and handed to ``run_batch`` in one call
+    on a background thread. ``run_batch`` takes a list of inputs and returns a
+    list of results in the same order; each result goes back to the future of
+    the request that submitted it. Because only the worker thread calls the
+    model, the model object is never used from two threads at once.
+
+    With ``workers`` > 1, that many threads form and run batches side by
+    side. Only for a ``run_batch`` that hands the batch to something able to
+    run several at once, such as a pool of inference worker processes.
+
+    A request may carry a deadline (``time.monotonic()`` seconds); if it has
+    passed by the time its batch is formed, the request fails with
+    TimeoutError and takes no place in the batch.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size=8, max_wait_ms=10.0, history=1000, workers=1):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = collections.Counter()
+        self._queue_waits_ms = collections.deque(maxlen=history)
+        self._batch_ms = collections.deque(maxlen=history)
+        self._items = 0
+        self._errors = 0
+        self._expired = 0
+
+    def _ensure_started(self):
+        # The workers start on first use so that importing the API (or forking
+        # worker processes) never leaves a batching thread behind
+        if len(self._threads) == self.workers and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._start_lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                name = f"batcher-{self.name}" if self.workers == 1 else f"batcher-{self.name}-{len(self._threads)}"
+                thread = threading.Thread(target=self._worker, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, item, deadline=None):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter(), deadline))
+        return future
+
+    def __call__(self, item, timeout=None, deadline=None):
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return self.submit(item, deadline).result(timeout)
+
+    def _drop_expired(self, batch):
+        # Fail requests whose deadline has passed instead of running them
+        now = time.monotonic()
+        live = []
+        for entry in batch:
+            deadline = entry[3]
+            if deadline is not None and deadline <= now:
+                entry[1].set_exception(TimeoutError(f"{self.name} request expired before inference"))
+            else:
+                live.append(entry)
+        if len(live) < len(batch):
+            with self._stats_lock:
+                self._expired += len(batch) - len(live)
+        return live
+
+    def _collect(self):
+        # Block for the first request, then keep the window open until the
+        # batch is full or max_wait has passed since that first request
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._drop_expired(self._collect())
+            if not batch:
+                continue
+            started = time.perf_counter()
+            items = [item for item, _, _, _ in batch]
+            try:
+                results = self.run_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name} returned {len(results)} results for {len(items)} inputs")
+                error = None
+            except Exception as e:
+                logger.error(f"Batched inference failed for {self.name}: {str(e)}")
+                results, error = None, e
+            finished = time.perf_counter()
+
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._batch_ms.append((finished - started) * 1000.0)
+                self._queue_waits_ms.extend((started - enqueued) * 1000.0 for _, _, enqueued, _ in batch)
+                self._items += len(batch)
+                if error is not None:
+                    self._errors += 1
+
+            for i, (_, future, _, _) in enumerate(batch):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[i])
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            waits = sorted(self._queue_waits_ms)
+            batch_ms = sorted(self._batch_ms)
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+            items, errors, expired = self._items, self._errors, self._expired
+        batches = sum(batch_sizes.values())
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'workers': self.workers,
+            'queue_depth': self.queue_depth(),
+            'batches': batches,
+            'items': items,
+            'errors': errors,
+            'expired': expired,
+            'mean_batch_size': items / batches if batches else 0.0,
+            'batch_size_distribution': {str(size): count for size, count in batch_sizes.items()},
+            'queue_wait_ms': _summary(waits),
+            'batch_latency_ms': _summary(batch_ms),
+        }
+
+
+def _summary(sorted_values):
+    # Summary of the most recent samples (already sorted)
+    if not sorted_values:
+        return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+    n = len(sorted_values)
+    return {
+        'count': n,
+        'mean': sum(sorted_values) / n,
+        'p50': sorted_values[n // 2],
+        'p99': sorted_values[min(n - 1, int(n * 0.99))],
+        'max': sorted_values[-1],
+    }
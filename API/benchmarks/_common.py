@@ -0,0 +1,67 @@
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Benchmarks live in API/benchmarks; make the API modules importable and
+# resolve model_weights/ from the repository root like allAPI.py does
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(API_DIR)
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+def model_path(name):
+    return os.path.join(REPO_DIR, 'model_weights', name)
+
+
+def time_calls(fn, repeat=200, warmup=5):
+    # Per-call latency summary in microseconds
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'mean_us': statistics.fmean(samples),
+        'p50_us': samples[len(samples) // 2],
+        'p99_us': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def print_row(label, stats):
+    print(f"{label:<40} mean {stats['mean_us']:>10.1f} us   p50 {stats['p50_us']:>10.1f} us   p99 {stats['p99_us']:>10.1f} us")
+
+
+def run_metadata():
+    # What a results file was measured on, so runs can be compared across commits
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'argv': sys.argv[1:],
+    }
+
+
+def write_results(path, results):
+    # {"meta": run_metadata(), "results": [...]}; each result has a unique "name"
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'meta': run_metadata(), 'results': results}, f, indent=2)
+    print(f"Results written to {path}")
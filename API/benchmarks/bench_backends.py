@@ -0,0 +1,78 @@
+# Per-request latency and batch throughput of each model under every inference
+# backend (native, onnx, onnx-int8) on CPU. Export the ONNX files first with
+# python API/export_onnx.py --quantize
+# Run from the repository root: python API/benchmarks/bench_backends.py
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+
+from _common import model_path, print_row, time_calls
+from export_onnx import TEXT_MODEL_NAMES, YOLO_MODELS, parity_articles
+from onnx_backend import BACKENDS, OnnxClassifier, onnx_path
+
+
+def throughput(fn, items, repeat=3):
+    # Best-of-`repeat` items per second for one call over `items` items
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return items / best
+
+
+def bench_text(names, batch_size, repeat):
+    features = parity_articles(os.path.dirname(model_path('content_vectorizer.pkl')), batch_size)
+    for name in names:
+        for backend in BACKENDS:
+            path = model_path(f'{name}.pkl')
+            if backend != 'native':
+                path = onnx_path(path, backend)
+                if not os.path.exists(path):
+                    continue
+            model = joblib.load(path) if backend == 'native' else OnnxClassifier(path)
+            label = f'{name} [{backend}]'
+            print_row(f'{label}, 1 article', time_calls(lambda: model.predict(features[:1]), repeat=repeat))
+            print(f"{'':<40} {throughput(lambda: model.predict(features), batch_size):>10.0f} articles/s "
+                  f"at batch {batch_size}")
+
+
+def bench_yolo(names, batch_size, repeat):
+    from ultralytics import YOLO
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (640, 640, 3), dtype=np.uint8) for _ in range(batch_size)]
+    for name in names:
+        for backend in BACKENDS:
+            path = model_path(name)
+            if backend != 'native':
+                path = onnx_path(path, backend)
+                if not os.path.exists(path):
+                    continue
+            model = YOLO(path, task='detect') if backend != 'native' else YOLO(path)
+            label = f'{name} [{backend}]'
+            print_row(f'{label}, 1 image', time_calls(lambda: model(images[:1], verbose=False), repeat=repeat))
+            print(f"{'':<40} {throughput(lambda: model(images, verbose=False), batch_size):>10.1f} images/s "
+                  f"at batch {batch_size}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', default=TEXT_MODEL_NAMES + YOLO_MODELS)
+    parser.add_argument('--text-batch', type=int, default=256)
+    parser.add_argument('--image-batch', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    text_names = [name for name in args.models if name in TEXT_MODEL_NAMES]
+    yolo_names = [name for name in args.models if name in YOLO_MODELS]
+    if text_names:
+        bench_text(text_names, args.text_batch, args.repeat)
+    if yolo_names:
+        bench_yolo(yolo_names, args.image_batch, max(5, args.repeat // 10))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# Compare two results files written by bench_suite.py (or replay.py): the
+# change in each benchmark's p50 and p99 from the baseline run to the new one.
+# Run from the repository root:
+#   python API/benchmarks/bench_compare.py benchmark_results/old.json benchmark_results/new.json
+import argparse
+import json
+import sys
+
+# Latency fields by results file kind: bench_suite.py reports microseconds,
+# replay.py milliseconds
+FIELDS = (("p50_us", "p99_us"), ("p50_ms", "p99_ms"))
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    return data.get("meta", {}), {result["name"]: result for result in data["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--fail-above", type=float, default=None,
+                        help="exit with status 1 if any p50 grows by more than this percentage")
+    args = parser.parse_args()
+
+    base_meta, base = load(args.baseline)
+    new_meta, new = load(args.candidate)
+    print(f"baseline  {base_meta.get('commit')} {base_meta.get('time')}")
+    print(f"candidate {new_meta.get('commit')} {new_meta.get('time')}")
+    print(f"{'benchmark':<44} {'p50 before':>11} {'p50 after':>11} {'change':>8} {'p99 change':>11}")
+    regressions = []
+    for name in [name for name in base if name in new]:
+        fields = next((f for f in FIELDS if f[0] in base[name] and f[0] in new[name]), None)
+        if fields is None or not base[name][fields[0]] or not base[name][fields[1]]:
+            continue
+        p50, p99 = fields
+        change = (new[name][p50] / base[name][p50] - 1.0) * 100.0
+        change_p99 = (new[name][p99] / base[name][p99] - 1.0) * 100.0
+        print(f"{name:<44} {base[name][p50]:>11.1f} {new[name][p50]:>11.1f} {change:>+7.1f}% {change_p99:>+10.1f}%")
+        if args.fail_above is not None and change > args.fail_above:
+            regressions.append(name)
+    for name in sorted(set(base) ^ set(new)):
+        print(f"{name:<44} only in {'baseline' if name in base else 'candidate'}")
+    if regressions:
+        print(f"p50 regressions above {args.fail_above}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
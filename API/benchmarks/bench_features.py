@@ -0,0 +1,70 @@
+# Micro-benchmark: per-item /predict feature assembly, pandas path vs FeatureAssembler.
+# Run from the repository root: python API/benchmarks/bench_features.py
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.sparse import hstack
+
+from _common import model_path, print_row, time_calls
+from features import FeatureAssembler
+
+SHORT_TEXT = "Senate approves new budget for public schools in Manila"
+LONG_TEXT = " ".join([
+    "The department of health confirmed on Tuesday that the vaccination drive",
+    "will continue in all provinces despite reports circulating on social media",
+    "claiming that the program had been suspended by the president.",
+] * 40)
+
+
+# preprocess_input as it was before FeatureAssembler, kept here as the baseline
+def legacy_preprocess(vectorizer, brand_columns, content, brand):
+    text_length = len(content)
+    word_count = len(content.split())
+    avg_word_length = sum(len(word) for word in content.split()) / word_count if word_count > 0 else 0
+    tfidf_content = vectorizer.transform([content])
+    brand_data = np.zeros(len(brand_columns))
+    brand_col = f"Brand_{brand}"
+    if brand_col in brand_columns:
+        brand_idx = brand_columns.index(brand_col)
+        brand_data[brand_idx] = 1
+    other_features = pd.DataFrame({
+        'text_length': [text_length],
+        'word_count': [word_count],
+        'avg_word_length': [avg_word_length],
+        **{col: [brand_data[i]] for i, col in enumerate(brand_columns)}
+    })
+    return hstack([tfidf_content, other_features])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args()
+
+    vectorizer = joblib.load(model_path('content_vectorizer.pkl'))
+    brand_columns = joblib.load(model_path('brand_columns.pkl'))
+    assembler = FeatureAssembler(vectorizer, brand_columns)
+    known_brand = brand_columns[0][len('Brand_'):]
+
+    # The assembler must produce the same matrix as the pandas path
+    for text in (SHORT_TEXT, LONG_TEXT, "   ", "x"):
+        for brand in (known_brand, 'Unknown'):
+            old = legacy_preprocess(vectorizer, brand_columns, text, brand).tocsr()
+            new = assembler.transform_one(text, brand)
+            assert old.shape == new.shape and old.dtype == new.dtype, (old.shape, new.shape)
+            assert (old != new).nnz == 0, f"feature mismatch for {text[:20]!r}/{brand}"
+    print("parity: OK")
+
+    for label, text in (('short', SHORT_TEXT), ('long', LONG_TEXT)):
+        print_row(f"{label} text, pandas + hstack", time_calls(
+            lambda: legacy_preprocess(vectorizer, brand_columns, text, known_brand), repeat=args.repeat))
+        print_row(f"{label} text, FeatureAssembler", time_calls(
+            lambda: assembler.transform_one(text, known_brand), repeat=args.repeat))
+        print_row(f"{label} text, TF-IDF transform only", time_calls(
+            lambda: vectorizer.transform([text]), repeat=args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Decode latency and peak memory of the image endpoints' input path by upload
+# size: full decode + stretch to 640x640 (before) vs reduced-resolution decode
+# + letterbox (image_ingest), plus the OCR decode at OCR_MAX_SIDE.
+# Run from the repository root: python API/benchmarks/bench_image_ingest.py
+import argparse
+import json
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from _common import print_row, time_calls
+from corpora import make_photo
+from image_ingest import decode_image, decode_letterboxed
+from ocr_regions import OCR_MAX_SIDE
+
+RESOLUTIONS = [(640, 480), (1600, 1200), (3000, 2250), (4032, 3024), (6000, 4000)]
+
+
+def baseline_detection(data):
+    # The endpoints' previous path: full-size decode, then stretch to 640x640
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.resize(img, (640, 640))
+
+
+def baseline_ocr(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def peak_memory_mb(fn):
+    # Peak of Python/NumPy allocations during one call (OpenCV allocates its
+    # output arrays through NumPy, so decoded images are counted)
+    fn()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    paths = {
+        "detect: full decode + resize": baseline_detection,
+        "detect: reduced decode + letterbox": decode_letterboxed,
+        "ocr: full decode": baseline_ocr,
+        f"ocr: decode at >= {OCR_MAX_SIDE}px": lambda data: decode_image(data, target_side=OCR_MAX_SIDE),
+    }
+    results = []
+    for width, height in RESOLUTIONS:
+        data = make_photo(width, height)
+        print(f"{width}x{height} ({len(data) / 1e6:.1f} MB JPEG)")
+        for label, fn in paths.items():
+            stats = time_calls(lambda: fn(data), repeat=args.repeat, warmup=2)
+            peak = peak_memory_mb(lambda: fn(data))
+            print_row(f"  {label}", stats)
+            print(f"  {'':<40} peak {peak:>10.1f} MB")
+            results.append(dict(stats, resolution=f"{width}x{height}", path=label, peak_mb=round(peak, 2)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Throughput benchmark: in-thread pytesseract (old /ocr path) vs the OCREngine worker pool.
+# Run from the repository root: python API/benchmarks/bench_ocr.py --clients 8 --workers 4
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from _common import API_DIR
+from ocr_engine import OCREngine, OCRQueueFull, preprocess_for_ocr
+
+SAMPLE_LINES = [
+    "Senate approves new budget for public schools",
+    "Typhoon signal number two raised over Metro Manila",
+    "Apply pressure with a clean cloth to stop bleeding",
+    "Keep out of reach of children. Store below 30C.",
+]
+
+
+def synthetic_corpus(count, width=1600, height=1200):
+    # Black text on white pages, at phone-photo-like resolution
+    images = []
+    for i in range(count):
+        page = np.full((height, width, 3), 255, np.uint8)
+        for row in range(8):
+            line = SAMPLE_LINES[(i + row) % len(SAMPLE_LINES)]
+            cv2.putText(page, line, (60, 120 + row * 130), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 3)
+        images.append(page)
+    return images
+
+
+def load_corpus(directory, synthetic):
+    images = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.png')) + glob.glob(os.path.join(directory, '*.jpg'))):
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None:
+            images.append(img)
+    return images + synthetic_corpus(synthetic)
+
+
+def run_load(ocr, images, clients, total):
+    latencies, rejected = [], 0
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            ocr(images[i % len(images)])
+        except OCRQueueFull:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for latency in pool.map(one, range(total)):
+            if latency is None:
+                rejected += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'images_per_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0,
+        'rejected': rejected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=API_DIR, help='directory of .png/.jpg sample images')
+    parser.add_argument('--synthetic', type=int, default=8, help='number of generated text pages to add')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=48)
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--max-queue', type=int, default=64)
+    args = parser.parse_args()
+
+    import pytesseract
+    images = load_corpus(args.corpus, args.synthetic)
+    print(f"corpus: {len(images)} images")
+
+    def in_thread(image):
+        return pytesseract.image_to_string(preprocess_for_ocr(image))
+
+    engine = OCREngine(workers=args.workers, max_queue=args.max_queue, timeout_s=120).start()
+    try:
+        for label, ocr in (('pytesseract in request thread', in_thread), (f'OCREngine ({args.workers} workers)', engine.run)):
+            result = run_load(ocr, images, args.clients, args.requests)
+            print(f"{label:<32} {result['images_per_s']:7.2f} images/s   p50 {result['p50_ms']:8.1f} ms   "
+                  f"p99 {result['p99_ms']:8.1f} ms   rejected {result['rejected']}")
+    finally:
+        engine.shutdown()
+
+
+if __name__ == '__main__':
+    main()
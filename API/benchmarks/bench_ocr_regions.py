@@ -0,0 +1,55 @@
+# Latency/accuracy benchmark: whole-image OCR vs region-proposal OCR on large photos.
+# Run from the repository root: python API/benchmarks/bench_ocr_regions.py
+import argparse
+import difflib
+import os
+import re
+import time
+
+import numpy as np
+
+import _common  # noqa: F401  (puts API/ on sys.path)
+from corpora import make_page
+from ocr_engine import OCREngine
+from ocr_regions import assemble_text, crop_regions, propose_text_regions
+
+RESOLUTIONS = [(1600, 1200), (3000, 2250), (4032, 3024)]
+
+
+def accuracy(text, truth):
+    words = lambda s: re.findall(r"\w+", s.lower())
+    return difflib.SequenceMatcher(None, words(text), words(truth)).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--pages', type=int, default=3, help='pages per resolution')
+    args = parser.parse_args()
+
+    engine = OCREngine(workers=args.workers, max_queue=64, timeout_s=300).start()
+    try:
+        print(f"{'resolution':<12} {'mode':<8} {'latency ms':>11} {'accuracy':>9} {'regions':>8}")
+        for width, height in RESOLUTIONS:
+            pages = [make_page(width, height, seed) for seed in range(args.pages)]
+            for mode in ('full', 'regions'):
+                latencies, scores, counts = [], [], []
+                for page, truth in pages:
+                    start = time.perf_counter()
+                    if mode == 'full':
+                        text, count = engine.run(page), 1
+                    else:
+                        regions = propose_text_regions(page)
+                        texts = engine.run_many(crop_regions(page, regions), psm=6)
+                        text, count = assemble_text(regions, texts), len(regions)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    scores.append(accuracy(text, truth))
+                    counts.append(count)
+                print(f"{width}x{height:<7} {mode:<8} {np.mean(latencies):>11.1f} {np.mean(scores):>9.3f} "
+                      f"{np.mean(counts):>8.1f}")
+    finally:
+        engine.shutdown()
+
+
+if __name__ == '__main__':
+    main()
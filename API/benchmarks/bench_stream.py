@@ -0,0 +1,116 @@
+# Sustained frame rate of /process_stream's detection loop on CPU: a synthetic
+# 640x480 MJPEG clip with moving objects goes through StreamSession and the
+# YOLO model, once uncapped (every frame offline) and once with adaptive frame
+# skipping (max_fps). With --live the frames arrive in real time at --fps and,
+# like the WebSocket endpoint, a busy session only takes the newest frame;
+# lag is how far behind the stream its events were sent.
+# Run from the repository root: python API/benchmarks/bench_stream.py --live
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from _common import model_path, write_results
+from corpora import make_photo
+from frame_stream import IouTracker, StreamSession
+from image_ingest import decode_letterboxed
+
+
+def make_clip(frames, width=640, height=480, objects=4, seed=0):
+    # JPEG frames of a static background with objects drifting across it
+    rng = np.random.default_rng(seed)
+    background = cv2.imdecode(np.frombuffer(make_photo(width, height, seed), np.uint8), cv2.IMREAD_COLOR)
+    start = rng.uniform((0, 0), (width - 80, height - 80), (objects, 2))
+    velocity = rng.uniform(-4, 4, (objects, 2))
+    colours = [tuple(int(c) for c in rng.integers(0, 255, 3)) for _ in range(objects)]
+    clip = []
+    for i in range(frames):
+        image = background.copy()
+        for (x, y), colour in zip((start + i * velocity) % (width - 80, height - 80), colours):
+            cv2.rectangle(image, (int(x), int(y)), (int(x) + 80, int(y) + 60), colour, -1)
+        clip.append(cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    return clip
+
+
+def run_offline(session, clip, fps):
+    # Frames as fast as they can be processed, timed on the media clock
+    start = time.perf_counter()
+    events = 0
+    for i, frame in enumerate(clip):
+        events += session.offer(i / fps, frame) is not None
+    return time.perf_counter() - start, events, None
+
+
+def run_live(session, clip, fps):
+    # Frames arrive every 1/fps seconds; frames that arrived while the
+    # session was busy are dropped in favour of the newest one
+    start = time.perf_counter()
+    events, lags, offered = 0, [], -1
+    while offered < len(clip) - 1:
+        now = time.perf_counter() - start
+        latest = min(int(now * fps), len(clip) - 1)
+        if latest <= offered:
+            time.sleep((latest + 1) / fps - now)
+            continue
+        session.skip(latest - offered - 1)
+        offered = latest
+        if session.offer(now, clip[latest]) is not None:
+            events += 1
+            lags.append(time.perf_counter() - start - latest / fps)
+    return time.perf_counter() - start, events, lags
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=model_path('yolov8n.pt'))
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--fps', type=float, default=15.0, help='frame rate of the clip')
+    parser.add_argument('--max-fps', type=float, default=5.0, help='cap of the adaptive run')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--live', action='store_true', help='deliver frames in real time')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+    model = YOLO(args.model)
+
+    def detect(image):
+        result = model(image, imgsz=args.imgsz, verbose=False)[0]
+        return [(result.names[int(c)], box) for c, box in zip(result.boxes.cls.tolist(), result.boxes.xyxy.tolist())]
+
+    def decode(frame):
+        return decode_letterboxed(frame, args.imgsz)
+
+    clip = make_clip(args.frames)
+    detect(decode(clip[0]))  # warm up
+    run = run_live if args.live else run_offline
+    results = []
+    for name, max_fps in (('uncapped', 0.0), (f'adaptive, max_fps={args.max_fps:g}', args.max_fps)):
+        session = StreamSession(detect, decode, max_fps, IouTracker())
+        elapsed, events, lags = run(session, clip, args.fps)
+        summary = session.summary()
+        result = {
+            'name': name,
+            'frames': summary['frames'],
+            'inferred': summary['inferred'],
+            'events': events,
+            'elapsed_s': elapsed,
+            'stream_fps': summary['frames'] / elapsed,
+            'inferred_fps': summary['inferred'] / elapsed,
+            'inference_ms': summary['inference_ms'],
+        }
+        line = (f"{name:<28} {result['stream_fps']:7.1f} frames/s   {result['inferred_fps']:6.1f} inferred/s   "
+                f"{summary['inferred']:>4}/{summary['frames']} inferred   {summary['inference_ms']:7.1f} ms/inference")
+        if lags:
+            result['lag_p50_ms'] = 1000 * float(np.median(lags))
+            result['lag_max_ms'] = 1000 * max(lags)
+            line += f"   lag p50 {result['lag_p50_ms']:.0f} ms, max {result['lag_max_ms']:.0f} ms"
+        print(line)
+        results.append(result)
+    if args.json:
+        write_results(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
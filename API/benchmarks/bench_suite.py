@@ -0,0 +1,101 @@
+# Offline micro-benchmarks of the API's hot paths on the synthetic corpora:
+# /predict feature assembly and ensemble, upload decoding, OCR and both YOLO
+# models, called through allAPI exactly as the endpoints call them (with the
+# result cache off). Results can be written as JSON and compared across commits
+# with bench_compare.py.
+# Run from the repository root:
+#   python API/benchmarks/bench_suite.py --json benchmark_results/$(git rev-parse --short HEAD).json
+import argparse
+import itertools
+import os
+
+# Measure the work itself, not cache hits or log output
+os.environ.setdefault("RESULT_CACHE_BACKEND", "none")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from _common import print_row, time_calls, write_results  # noqa: E402
+from corpora import RESOLUTIONS, article_corpus, image_corpus  # noqa: E402
+
+GROUPS = ("features", "predict", "decode", "ocr", "yolo")
+
+
+def cycling(fn, items):
+    # Zero-argument callable applying fn to the next item on every call
+    items = itertools.cycle(items)
+    return lambda: fn(next(items))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"comma-separated groups of {', '.join(GROUPS)}")
+    parser.add_argument("--repeat", type=int, default=100, help="calls per benchmark (OCR and YOLO use a tenth)")
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--images-per-resolution", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    groups = [group.strip() for group in args.only.split(",") if group.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+
+    import allAPI
+    from image_ingest import decode_image, decode_letterboxed
+    from ocr_regions import OCR_MAX_SIDE
+
+    articles = article_corpus(args.articles, seed=args.seed)
+    images = image_corpus(args.images_per_resolution, seed=args.seed)
+    slow_repeat = max(3, args.repeat // 10)
+    results = []
+
+    def run(name, fn, repeat=args.repeat, warmup=3):
+        stats = time_calls(fn, repeat=repeat, warmup=warmup)
+        print_row(name, stats)
+        results.append(dict(stats, name=name, repeat=repeat))
+
+    def by_resolution(prefix):
+        return {(width, height): [data for name, data in images.items()
+                                  if name.startswith(f"{prefix}_{width}x{height}_")]
+                for width, height in RESOLUTIONS}
+
+    if "features" in groups:
+        run("preprocess_input", cycling(lambda a: allAPI.preprocess_input(a["content"], a["brand"]), articles))
+    if "predict" in groups:
+        run("predict_response", cycling(lambda a: allAPI.predict_response(a, {}), articles))
+        batch = {"items": articles[:32]}
+        run("predict_batch_response[32]", lambda: allAPI.predict_batch_response(batch), repeat=slow_repeat)
+    profile = allAPI.YOLO_PROFILES["yolo"]
+    if "decode" in groups:
+        for (width, height), photos in by_resolution("photo").items():
+            run(f"decode_letterboxed[{width}x{height}]",
+                cycling(lambda data: decode_letterboxed(data, profile.imgsz), photos))
+            run(f"decode_image_ocr[{width}x{height}]",
+                cycling(lambda data: decode_image(data, target_side=OCR_MAX_SIDE), photos), repeat=slow_repeat)
+    if "ocr" in groups:
+        allAPI.ocr_engine.start()
+        try:
+            for (width, height), pages in by_resolution("page").items():
+                decoded = [decode_image(data, target_side=OCR_MAX_SIDE) for data in pages]
+                run(f"ocr_image[{width}x{height}]", cycling(allAPI.ocr_image, decoded), repeat=slow_repeat, warmup=1)
+        finally:
+            allAPI.ocr_engine.shutdown()
+    if "yolo" in groups:
+        photos = [(decode_letterboxed(data, profile.imgsz).copy(), profile)
+                  for name, data in images.items() if name.startswith("photo_")]
+        for model_name in ("yolo", "wound"):
+            run(f"run_yolo_batch[{model_name}, 1 image]",
+                cycling(lambda item: allAPI.run_yolo_batch(model_name, [item]), photos), repeat=slow_repeat)
+            batch = photos[:8]
+            run(f"run_yolo_batch[{model_name}, {len(batch)} images]",
+                lambda: allAPI.run_yolo_batch(model_name, batch), repeat=max(3, slow_repeat // 4), warmup=1)
+        # Decode plus detection, as /process_image does it
+        run("detect_objects[decode + yolo]",
+            cycling(lambda data: allAPI.detect_objects(decode_letterboxed(data, profile.imgsz), profile),
+                    [data for name, data in images.items() if name.startswith("photo_")]), repeat=slow_repeat)
+
+    if args.json:
+        write_results(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# FastTfidf vs TfidfVectorizer.transform: latency on short, medium and long
+# articles and on batches. That the two give the same matrix is checked by
+# tests/test_tfidf_parity.py (python -m pytest tests).
+# Run from the repository root: python API/benchmarks/bench_tfidf.py
+import argparse
+import copy
+
+import joblib
+import numpy as np
+
+from _common import model_path, print_row, time_calls, write_results
+from corpora import article_corpus
+from features import FeatureAssembler, FastTfidf
+from shared_weights import SortedVocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    vectorizer = joblib.load(model_path("content_vectorizer.pkl"))
+    articles = [article["content"] for article in article_corpus(args.articles, seed=args.seed)]
+    shared = copy.deepcopy(vectorizer)
+    shared.vocabulary_ = SortedVocabulary.from_dict(shared.vocabulary_)
+
+    fast = FastTfidf(vectorizer)
+    fast_shared = FastTfidf(shared)
+    lengths = np.array([len(article.split()) for article in articles])
+    by_length = {
+        "short (10 words)": [" ".join(article.split()[:10]) for article in articles],
+        f"medium ({int(np.median(lengths))} words)": articles,
+        "long (5000 words)": [" ".join((article.split() * (5000 // len(article.split()) + 1))[:5000])
+                              for article in articles[:10]],
+    }
+    results = []
+
+    def run(name, fn, items, repeat):
+        index = [0]
+
+        def call():
+            fn(items[index[0] % len(items)])
+            index[0] += 1
+        stats = time_calls(call, repeat=repeat)
+        print_row(name, stats)
+        results.append(dict(stats, name=name, repeat=repeat))
+        return stats
+
+    for label, docs in by_length.items():
+        repeat = args.repeat if not label.startswith("long") else max(10, args.repeat // 10)
+        before = run(f"{label}: vectorizer.transform", lambda doc: vectorizer.transform([doc]), docs, repeat)
+        after = run(f"{label}: FastTfidf", lambda doc: fast.transform([doc]), docs, repeat)
+        run(f"{label}: FastTfidf, sorted vocabulary", lambda doc: fast_shared.transform([doc]), docs, repeat)
+        # What serve_prefork.py workers ran before: one sorted-array lookup per token
+        run(f"{label}: vectorizer.transform, sorted vocabulary", lambda doc: shared.transform([doc]), docs,
+            max(10, repeat // 10))
+        print(f"{'':<40} speed-up {before['p50_us'] / after['p50_us']:.1f}x")
+
+    batch = [articles[:64]]
+    repeat = max(5, args.repeat // 20)
+    before = run("batch of 64: vectorizer.transform", vectorizer.transform, batch, repeat)
+    after = run("batch of 64: FastTfidf", fast.transform, batch, repeat)
+    run("batch of 64: FastTfidf, sorted vocabulary", fast_shared.transform, batch, repeat)
+    print(f"{'':<40} speed-up {before['p50_us'] / after['p50_us']:.1f}x")
+
+    # End to end as /predict builds its features
+    brand_columns = joblib.load(model_path("brand_columns.pkl"))
+    for flag in (False, True):
+        assembler = FeatureAssembler(vectorizer, brand_columns, fast_tfidf=flag)
+        run(f"FeatureAssembler.transform_one, fast_tfidf={flag}",
+            lambda doc: assembler.transform_one(doc, "Unknown"), articles, args.repeat)
+    if args.json:
+        write_results(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
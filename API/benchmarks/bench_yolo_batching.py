@@ -0,0 +1,64 @@
+# Throughput benchmark: one-image-per-call YOLO vs MicroBatcher under concurrent load (CPU).
+# Run from the repository root: python API/benchmarks/bench_yolo_batching.py --clients 8
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from _common import model_path
+from batching import MicroBatcher
+
+
+def run_load(infer, images, clients, requests_per_client):
+    # Each client thread sends its requests back to back, like a Flask worker thread
+    def client(offset):
+        for i in range(requests_per_client):
+            infer(images[(offset + i) % len(images)])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    return clients * requests_per_client / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=model_path('yolov8n.pt'))
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=10, help='requests per client')
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=10.0)
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+    model = YOLO(args.model)
+
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (640, 640, 3), dtype=np.uint8) for _ in range(16)]
+    model(images[0], verbose=False)  # warm up
+
+    # Current path: one image per call; calls are serialized because the
+    # ultralytics predictor is not safe to share between threads
+    lock = threading.Lock()
+
+    def single(image):
+        with lock:
+            return model(image, verbose=False)[0]
+
+    batcher = MicroBatcher('bench', lambda batch: model(batch, verbose=False),
+                           max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+    single_rps = run_load(single, images, args.clients, args.requests)
+    batched_rps = run_load(batcher, images, args.clients, args.requests)
+
+    print(f"one image per call : {single_rps:8.2f} images/s")
+    print(f"micro-batched      : {batched_rps:8.2f} images/s  ({batched_rps / single_rps:.2f}x)")
+    print(json.dumps(batcher.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# Latency/accuracy trade-off of the YOLO inference profiles (yolo_profiles.py)
+# on CPU. Every profile runs over sample images, by default the repository's
+# yolotest.jpg plus random crops and mirror images of it. Accuracy is measured
+# against the detections of the "accurate" profile: recall and precision of
+# its boxes (same class, IoU >= 0.5), and how often the set of labels, which
+# is all /wound reports, is the same. Also times label extraction from the
+# boxes' class tensor against the per-box loop it replaced.
+# Run from the repository root: python API/benchmarks/bench_yolo_profiles.py
+import argparse
+import os
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from _common import API_DIR, model_path, print_row, time_calls, write_results
+from image_ingest import letterbox
+from yolo_profiles import PROFILES, detected_classes, label_array
+
+
+def sample_images(paths, variants, seed=0):
+    # Each image, plus random crops (half to full size), every other one mirrored
+    rng = np.random.default_rng(seed)
+    images = []
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise SystemExit(f"Cannot read image: {path}")
+        images.append(image)
+        height, width = image.shape[:2]
+        for i in range(variants):
+            scale = rng.uniform(0.5, 1.0)
+            h, w = int(height * scale), int(width * scale)
+            y, x = rng.integers(0, height - h + 1), rng.integers(0, width - w + 1)
+            crop = image[y:y + h, x:x + w]
+            images.append(np.ascontiguousarray(crop[:, ::-1] if i % 2 else crop))
+    return images
+
+
+def detections(result, imgsz):
+    # Class indices and boxes relative to the input side; the letterbox is
+    # centred, so relative boxes compare across input sizes
+    return detected_classes(result), np.asarray(result.boxes.xyxy.tolist(), dtype=np.float64).reshape(-1, 4) / imgsz
+
+
+def iou_matrix(a, b):
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-12)
+
+
+def matched_boxes(reference, found, threshold=0.5):
+    # Reference boxes found again: same class and IoU >= threshold, greedily
+    # pairing the closest boxes first, each box used once
+    ref_classes, ref_boxes = reference
+    classes, boxes = found
+    if not len(ref_classes) or not len(classes):
+        return 0
+    ious = iou_matrix(ref_boxes, boxes)
+    ious[ref_classes[:, None] != classes[None, :]] = 0.0
+    matched = 0
+    while True:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[i, j] < threshold:
+            return matched
+        matched += 1
+        ious[i, :] = 0.0
+        ious[:, j] = 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=model_path('yolov8n.pt'))
+    parser.add_argument('--images', nargs='+', default=[os.path.join(API_DIR, 'yolotest.jpg')])
+    parser.add_argument('--variants', type=int, default=11, help='crops and mirror images per image')
+    parser.add_argument('--repeat', type=int, default=3, help='timed passes over the images')
+    parser.add_argument('--threads', type=int, default=0, help='PyTorch intra-op threads (0: default)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+    from ultralytics import YOLO
+    model = YOLO(args.model)
+
+    images = sample_images(args.images, args.variants)
+    inputs = {size: [letterbox(image, size) for image in images] for size in {p.imgsz for p in PROFILES.values()}}
+    reference_profile = PROFILES['accurate']
+    reference = [detections(model([image], **reference_profile.predict_kwargs())[0], reference_profile.imgsz)
+                 for image in inputs[reference_profile.imgsz]]
+    reference_boxes = sum(len(classes) for classes, _ in reference)
+    print(f"{len(images)} images, {reference_boxes} reference boxes ({reference_profile.key})")
+
+    results = []
+    for name, profile in PROFILES.items():
+        kwargs = profile.predict_kwargs()
+        batch = inputs[profile.imgsz]
+        model(batch[:1], **kwargs)  # warm up
+        latencies, found = [], []
+        for _ in range(args.repeat):
+            found = []
+            for image in batch:
+                start = time.perf_counter()
+                result = model([image], **kwargs)[0]
+                latencies.append((time.perf_counter() - start) * 1000.0)
+                found.append(detections(result, profile.imgsz))
+        matched = sum(matched_boxes(ref, det) for ref, det in zip(reference, found))
+        boxes = sum(len(classes) for classes, _ in found)
+        same_labels = statistics.fmean(set(ref[0].tolist()) == set(det[0].tolist())
+                                       for ref, det in zip(reference, found))
+        result = {
+            'name': name,
+            'profile': profile.key,
+            'latency_p50_ms': statistics.median(latencies),
+            'latency_mean_ms': statistics.fmean(latencies),
+            'boxes_per_image': boxes / len(batch),
+            'recall': matched / reference_boxes if reference_boxes else 1.0,
+            'precision': matched / boxes if boxes else 1.0,
+            'same_labels': same_labels,
+        }
+        print(f"{name:<9} {profile.imgsz:>4}px  p50 {result['latency_p50_ms']:7.1f} ms/image   "
+              f"{result['boxes_per_image']:5.1f} boxes/image   recall {result['recall']:.2f}   "
+              f"precision {result['precision']:.2f}   same labels {result['same_labels']:.0%}")
+        results.append(result)
+
+    # Label extraction on the image with the most detections
+    busiest = max(zip(reference, inputs[reference_profile.imgsz]), key=lambda pair: len(pair[0][0]))[1]
+    result = model([busiest], **reference_profile.predict_kwargs())[0]
+    loop = time_calls(lambda: [result.names[int(box.cls[0])] for box in result.boxes])
+    vectorized = time_calls(lambda: label_array(result.names)[detected_classes(result)].tolist())
+    print_row(f'labels, per-box loop ({len(result.boxes)} boxes)', loop)
+    print_row(f'labels, vectorized ({len(result.boxes)} boxes)', vectorized)
+    results.append({'name': 'labels_loop', **loop})
+    results.append({'name': 'labels_vectorized', **vectorized})
+    if args.json:
+        write_results(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
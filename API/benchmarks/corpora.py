@@ -0,0 +1,168 @@
+# Synthetic, seeded corpora for the offline benchmarks: phone-photo-like JPEGs
+# and text pages at several resolutions, /predict articles drawn from the
+# vectorizer's own vocabulary, and a JSONL request log for replay.py.
+# Run from the repository root to write a corpus directory:
+#   python API/benchmarks/corpora.py --out benchmark_corpus
+import argparse
+import json
+import os
+
+import cv2
+import joblib
+import numpy as np
+
+from _common import model_path
+
+RESOLUTIONS = [(640, 480), (1600, 1200), (3000, 2250), (4032, 3024)]
+LINES = [
+    "Senate approves new budget for public schools",
+    "Typhoon signal number two raised over Metro Manila",
+    "Apply pressure with a clean cloth to stop bleeding",
+    "Keep out of reach of children",
+    "Best before 12 2026 store in a cool dry place",
+]
+# Share of each endpoint in the generated request log
+DEFAULT_MIX = "predict=60,predict/batch=5,ocr=10,process_image=10,wound=10,analyze=5"
+IMAGE_ENDPOINTS = ("ocr", "process_image", "wound", "analyze")
+
+
+def make_photo(width, height, seed=0):
+    # Photo-like JPEG: smooth gradients, shapes and mild noise (pure noise
+    # compresses badly and decodes unrealistically slowly)
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                      (x + y) / 2], axis=2)
+    image = image + rng.normal(0, 4, image.shape).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    for _ in range(20):
+        centre = (int(rng.integers(width)), int(rng.integers(height)))
+        colour = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(image, centre, int(rng.integers(10, max(11, width // 8))), colour, -1)
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def make_page(width, height, seed):
+    # Photo-like page: grey gradient background, noise, and text at mixed
+    # sizes. Returns (BGR image, the text on it).
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(200, 245, width, dtype=np.float32)
+    page = np.repeat(np.tile(ramp, (height, 1))[:, :, None], 3, axis=2)
+    page += rng.normal(0, 6, page.shape).astype(np.float32)
+    page = np.clip(page, 0, 255).astype(np.uint8)
+    truth = []
+    y = height // 10
+    for i, line in enumerate(LINES):
+        scale = width / 1600.0 * (1.4 if i % 2 == 0 else 0.8)
+        thickness = max(1, int(round(2 * scale)))
+        (_, text_h), _ = cv2.getTextSize(line, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+        cv2.putText(page, line, (width // 16, y + text_h), cv2.FONT_HERSHEY_SIMPLEX, scale, (20, 20, 20), thickness)
+        truth.append(line)
+        y += int(text_h * 3.2)
+    return page, "\n".join(truth)
+
+
+def image_corpus(per_resolution=2, resolutions=RESOLUTIONS, seed=0):
+    # {file name: JPEG bytes}: photos for detection and text pages for OCR
+    images = {}
+    for width, height in resolutions:
+        for i in range(per_resolution):
+            images[f"photo_{width}x{height}_{i}.jpg"] = make_photo(width, height, seed + i)
+            page, _ = make_page(width, height, seed + i)
+            images[f"page_{width}x{height}_{i}.jpg"] = cv2.imencode(".jpg", page)[1].tobytes()
+    return images
+
+
+def article_corpus(count, seed=0, mean_words=250):
+    """Articles for /predict over the vectorizer's vocabulary.
+
+    Terms are drawn in proportion to their document frequency (recovered from
+    the smoothed idf, df ~ exp(-idf)), so common terms are common here too,
+    and lengths are log-normal around ``mean_words``. Brands mix the trained
+    brand columns with some unknown ones.
+    """
+    vectorizer = joblib.load(model_path("content_vectorizer.pkl"))
+    brand_columns = joblib.load(model_path("brand_columns.pkl"))
+    terms = np.array(sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get))
+    weights = np.exp(-np.asarray(vectorizer.idf_, dtype=np.float64))
+    weights /= weights.sum()
+    brands = [column[len("Brand_"):] for column in brand_columns if column.startswith("Brand_")] + ["Unknown"]
+
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(np.log(mean_words), 0.6, count), 5, 5000).astype(int)
+    return [{"content": " ".join(rng.choice(terms, length, p=weights)), "brand": str(rng.choice(brands))}
+            for length in lengths]
+
+
+def request_log(count, articles, image_names, mix=DEFAULT_MIX, rate=20.0, seed=0):
+    """Request log entries for replay.py, one dict per request.
+
+    Each entry has ``t`` (seconds from the start, Poisson arrivals at
+    ``rate``), ``method`` and ``path``, plus ``json`` for /predict requests or
+    ``files`` (form field -> image file name) and ``form`` for image uploads.
+    """
+    shares = {}
+    for entry in mix.split(","):
+        name, _, share = entry.partition("=")
+        shares[name.strip()] = float(share)
+    endpoints = list(shares)
+    p = np.array([shares[name] for name in endpoints])
+    p /= p.sum()
+    photos = [name for name in image_names if os.path.basename(name).startswith("photo_")]
+    pages = [name for name in image_names if os.path.basename(name).startswith("page_")]
+
+    rng = np.random.default_rng(seed)
+    t = 0.0
+    entries = []
+    for _ in range(count):
+        t += rng.exponential(1.0 / rate)
+        endpoint = endpoints[rng.choice(len(endpoints), p=p)]
+        entry = {"t": round(t, 4), "method": "POST", "path": f"/{endpoint}"}
+        if endpoint == "predict":
+            entry["json"] = articles[rng.integers(len(articles))]
+        elif endpoint == "predict/batch":
+            entry["json"] = {"items": [articles[i] for i in rng.integers(len(articles), size=16)]}
+        elif endpoint in IMAGE_ENDPOINTS:
+            pool = pages if endpoint == "ocr" else photos
+            entry["files"] = {"image": str(rng.choice(pool))}
+            if endpoint == "analyze":
+                entry["form"] = {"tasks": "ocr,objects,wounds"}
+        else:
+            entry["method"] = "GET"
+        entries.append(entry)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default="benchmark_corpus", help="directory to write the corpus to")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--images-per-resolution", type=int, default=2)
+    parser.add_argument("--articles", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=1000, help="entries in the request log")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=share, comma-separated")
+    parser.add_argument("--log-rate", type=float, default=20.0, help="requests/s recorded in the log")
+    args = parser.parse_args()
+
+    image_dir = os.path.join(args.out, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    images = image_corpus(args.images_per_resolution, seed=args.seed)
+    for name, data in images.items():
+        with open(os.path.join(image_dir, name), "wb") as f:
+            f.write(data)
+    articles = article_corpus(args.articles, seed=args.seed)
+    with open(os.path.join(args.out, "articles.jsonl"), "w") as f:
+        for article in articles:
+            f.write(json.dumps(article) + "\n")
+    # Image file names in the log are relative to the log's directory
+    log = request_log(args.requests, articles, [f"images/{name}" for name in images], args.mix, args.log_rate,
+                      args.seed)
+    with open(os.path.join(args.out, "requests.jsonl"), "w") as f:
+        for entry in log:
+            f.write(json.dumps(entry) + "\n")
+    print(f"Wrote {len(images)} images, {len(articles)} articles and {len(log)} requests to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# Load test against running API servers: p50/p99 latency and requests/sec per
+# target, optionally while slow clients trickle uploads in the background
+# (the mobile-upload case that ties up threads in the Flask dev server).
+# Start the servers first, e.g.
+#   python API/allAPI.py                   (Flask, port 5000)
+#   python API/asgiAPI.py --port 8000      (ASGI)
+# then run from the repository root:
+#   python API/benchmarks/loadtest.py --target flask=http://127.0.0.1:5000 \
+#       --target asgi=http://127.0.0.1:8000 --endpoint process_image --slow-clients 16
+import argparse
+import collections
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import API_DIR
+
+SAMPLE_ARTICLE = {"content": "Senate approves new budget for public schools in Manila", "brand": "Inquirer"}
+IMAGE_ENDPOINTS = ("ocr", "process_image", "wound")
+
+
+def multipart_body(image_bytes, filename="image.jpg", fields=None):
+    boundary = uuid.uuid4().hex
+    body = b"".join(f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n".encode()
+                    for name, value in (fields or {}).items())
+    body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"{filename}\"\r\n"
+             f"Content-Type: application/octet-stream\r\n\r\n").encode() + image_bytes + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def build_request(endpoint, image_bytes, index=None):
+    # (path, body, content type) of one request to `endpoint`. With an index,
+    # each request's payload is distinct so the server's result cache misses:
+    # bytes after the end of an image are ignored by the decoder.
+    if endpoint in IMAGE_ENDPOINTS:
+        body, content_type = multipart_body(image_bytes + (str(index).encode() if index is not None else b""))
+        return f"/{endpoint}", body, content_type
+    article = dict(SAMPLE_ARTICLE, content=f"{SAMPLE_ARTICLE['content']} {index}" if index is not None
+                   else SAMPLE_ARTICLE["content"])
+    return f"/{endpoint}", json.dumps(article).encode(), "application/json"
+
+
+class Client(threading.local):
+    # One keep-alive connection per client thread
+    def connection(self, url):
+        if getattr(self, "conn", None) is None:
+            parsed = urllib.parse.urlsplit(url)
+            self.conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=120)
+        return self.conn
+
+    def post(self, url, path, body, content_type, method="POST"):
+        for attempt in range(2):
+            conn = self.connection(url)
+            try:
+                conn.request(method, path, body=body, headers={"Content-Type": content_type} if body else {})
+                response = conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self.conn = None
+                if attempt:
+                    return "connection error"
+
+
+def slow_upload(url, path, body, content_type, kbps, stop):
+    # Send one request at `kbps` KB/s over a raw socket, and keep doing so until stopped
+    parsed = urllib.parse.urlsplit(url)
+    chunk = max(1, int(kbps * 1024 / 10))
+    while not stop.is_set():
+        try:
+            with socket.create_connection((parsed.hostname, parsed.port or 80), timeout=120) as sock:
+                sock.sendall(f"POST {path} HTTP/1.1\r\nHost: {parsed.hostname}\r\nContent-Type: {content_type}\r\n"
+                             f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode())
+                for start in range(0, len(body), chunk):
+                    if stop.is_set():
+                        break
+                    sock.sendall(body[start:start + chunk])
+                    time.sleep(0.1)
+                else:
+                    sock.recv(65536)
+        except OSError:
+            time.sleep(0.1)
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))] if sorted_values else None
+
+
+def run_target(name, url, args, image_bytes):
+    path, body, content_type = build_request(args.endpoint, image_bytes)
+    stop = threading.Event()
+    slow_threads = [threading.Thread(target=slow_upload, args=(url, path, body, content_type, args.slow_kbps, stop),
+                                     daemon=True) for _ in range(args.slow_clients)]
+    for thread in slow_threads:
+        thread.start()
+    if slow_threads:
+        time.sleep(1.0)
+
+    client = Client()
+    latencies, statuses = [], collections.Counter()
+    lock = threading.Lock()
+
+    # Requests of this target are numbered apart from other targets' so
+    # they miss the cache too when targets share a cache file
+    offset = uuid.uuid4().int % 10 ** 9
+
+    def one(index):
+        request_path, request_body, request_type = build_request(
+            args.endpoint, image_bytes, None if args.repeat_payload else offset + index)
+        start = time.perf_counter()
+        status = client.post(url, request_path, request_body, request_type)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        with lock:
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    # Warm the server (model loads) before measuring
+    for index in range(args.warmup):
+        one(-1 - index)
+    latencies.clear()
+    statuses.clear()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+
+    latencies.sort()
+    return {
+        "target": name,
+        "url": url,
+        "endpoint": args.endpoint,
+        "concurrency": args.concurrency,
+        "slow_clients": args.slow_clients,
+        "requests": args.requests,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "requests_per_s": round(args.requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99), 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", action="append", required=True, help="name=url of a running server (repeatable)")
+    parser.add_argument("--endpoint", default="predict", choices=("predict",) + IMAGE_ENDPOINTS)
+    parser.add_argument("--image", default=os.path.join(API_DIR, "yolotest.jpg"), help="upload for image endpoints")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--slow-clients", type=int, default=0, help="background clients uploading slowly")
+    parser.add_argument("--slow-kbps", type=float, default=8.0, help="upload speed of each slow client")
+    parser.add_argument("--repeat-payload", action="store_true",
+                        help="send the same payload every time (measures result-cache hits)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+
+    results = []
+    print(f"{'target':<10} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}  statuses")
+    for target in args.target:
+        name, _, url = target.partition("=")
+        result = run_target(name, url.rstrip("/"), args, image_bytes)
+        results.append(result)
+        print(f"{name:<10} {result['requests_per_s']:>9.1f} {result['p50_ms'] or 0:>9.1f} {result['p99_ms'] or 0:>9.1f}  "
+              f"{result['statuses']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
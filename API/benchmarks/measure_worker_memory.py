@@ -0,0 +1,98 @@
+# Per-worker memory of the pre-forked server: unique (USS) and proportional (PSS)
+# set sizes for 1..N workers when every worker loads its own models
+# (independent), when models are preloaded before forking (preload), and when
+# preloaded weights are also memory-mapped (mmap).
+# Linux only. Run from the repository root:
+#   python API/benchmarks/measure_worker_memory.py --workers 1 2 4 --endpoints predict
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import joblib
+import numpy as np
+
+from _common import API_DIR, REPO_DIR, model_path
+from model_registry import process_memory
+
+
+def sample_articles(count, words=200, seed=0):
+    # Random articles over the vectorizer's vocabulary, so lookups touch all of it
+    vocabulary = sorted(joblib.load(model_path('content_vectorizer.pkl')).vocabulary_)
+    rng = np.random.default_rng(seed)
+    return [{"content": " ".join(rng.choice(vocabulary, words)), "brand": "Inquirer"} for _ in range(count)]
+
+
+def children_of(pid):
+    kids = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                if int(fields[1]) == pid:
+                    kids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return kids
+
+
+def post_json(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read()
+
+
+def measure(workers, port, endpoints, mode, articles):
+    env = dict(os.environ, API_ENDPOINTS=','.join(endpoints))
+    cmd = [sys.executable, os.path.join(API_DIR, 'serve_prefork.py'), '--workers', str(workers),
+           '--port', str(port), '--mode', mode]
+    master = subprocess.Popen(cmd, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        for _ in range(300):
+            try:
+                urllib.request.urlopen(f'{base}/stats', timeout=2).read()
+                break
+            except OSError:
+                time.sleep(0.5)
+        else:
+            raise RuntimeError('server did not start')
+        # Exercise the models so every worker touches them like in production
+        if 'predict' in endpoints:
+            for article in articles:
+                post_json(f'{base}/predict', article)
+        time.sleep(1.0)
+        rows = [process_memory(pid) for pid in children_of(master.pid)]
+        rows = [row for row in rows if row]
+        master_row = process_memory(master.pid)
+    finally:
+        master.terminate()
+        master.wait(timeout=30)
+    return master_row, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--endpoints', nargs='+', default=['predict'])
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--requests', type=int, default=200, help='/predict requests sent before measuring')
+    args = parser.parse_args()
+
+    articles = sample_articles(args.requests)
+    print(f"{'mode':<12} {'workers':>7} {'worker USS MB':>14} {'worker PSS MB':>14} {'total PSS MB':>13}")
+    for mode in ('independent', 'preload', 'mmap'):
+        for workers in args.workers:
+            master_row, rows = measure(workers, args.port, args.endpoints, mode, articles)
+            uss = sum(r['uss_bytes'] for r in rows) / len(rows) / 1e6
+            pss = sum(r['pss_bytes'] for r in rows) / len(rows) / 1e6
+            total = (sum(r['pss_bytes'] for r in rows) + master_row['pss_bytes']) / 1e6
+            print(f"{mode:<12} {workers:>7} {uss:>14.1f} {pss:>14.1f} {total:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+# Open-loop load generator: replays a JSONL request log (as written by
+# corpora.py) against a running server at a target rate, and reports latency
+# per endpoint. Requests are sent on schedule whether or not earlier ones have
+# answered, and latency is measured from the scheduled time, so a server that
+# falls behind shows it in p99 instead of silently slowing the client down.
+# Start a server, write a corpus, then run from the repository root:
+#   python API/benchmarks/corpora.py --out benchmark_corpus
+#   python API/benchmarks/replay.py benchmark_corpus/requests.jsonl --url http://127.0.0.1:5000 --rate 50 \
+#       --json benchmark_results/replay.json
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from _common import write_results
+from loadtest import Client, multipart_body
+
+
+def load_log(path):
+    # Entries with image files read once; file names are relative to the log
+    directory = os.path.dirname(os.path.abspath(path))
+    files = {}
+    entries = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            for name in entry.get("files", {}).values():
+                if name not in files:
+                    with open(os.path.join(directory, name), "rb") as image:
+                        files[name] = image.read()
+            entries.append(entry)
+    return entries, files
+
+
+def build_request(entry, files):
+    # (method, path, body, content type) of one log entry
+    method = entry.get("method", "POST")
+    if "files" in entry:
+        name = entry["files"]["image"]
+        body, content_type = multipart_body(files[name], os.path.basename(name), entry.get("form"))
+    elif "json" in entry:
+        body, content_type = json.dumps(entry["json"]).encode(), "application/json"
+    else:
+        body, content_type = None, None
+    return method, entry["path"], body, content_type
+
+
+def schedule(entries, rate, speed, arrivals, limit, loop, seed):
+    # [(send time in seconds from the start, entry)]: at `rate` (constant or
+    # Poisson arrivals), or at the log's own timestamps divided by `speed`
+    count = limit or len(entries)
+    if not loop:
+        count = min(count, len(entries))
+    rng = np.random.default_rng(seed)
+    if rate > 0:
+        gaps = rng.exponential(1.0 / rate, count) if arrivals == "poisson" else np.full(count, 1.0 / rate)
+        times = np.cumsum(gaps) - gaps[0]
+    else:
+        span = max(entry.get("t", 0.0) for entry in entries) or 1.0
+        times = [(entries[i % len(entries)].get("t", 0.0) + span * (i // len(entries))) / speed for i in range(count)]
+        times = np.asarray(times) - times[0]
+    return [(float(times[i]), entries[i % len(entries)]) for i in range(count)]
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    if not len(values):
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None, "mean_ms": None}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"p50_ms": round(float(p50), 2), "p90_ms": round(float(p90), 2), "p99_ms": round(float(p99), 2),
+            "mean_ms": round(float(values.mean()), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log", help="JSONL request log, e.g. benchmark_corpus/requests.jsonl")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests/s (default: the log's own timing)")
+    parser.add_argument("--speed", type=float, default=1.0, help="speed-up of the log's timing when --rate is 0")
+    parser.add_argument("--arrivals", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--limit", type=int, default=0, help="requests to send (default: the whole log once)")
+    parser.add_argument("--loop", action="store_true", help="repeat the log to reach --limit")
+    parser.add_argument("--concurrency", type=int, default=64, help="most requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests sent first, one at a time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    entries, files = load_log(args.log)
+    url = args.url.rstrip("/")
+    client = Client()
+    for entry in entries[:args.warmup]:
+        method, path, body, content_type = build_request(entry, files)
+        client.post(url, path, body, content_type, method)
+
+    plan = schedule(entries, args.rate, args.speed, args.arrivals, args.limit, args.loop, args.seed)
+    latencies, service, statuses = collections.defaultdict(list), collections.defaultdict(list), \
+        collections.defaultdict(collections.Counter)
+    lags = []
+    lock = threading.Lock()
+
+    def send(scheduled, entry):
+        method, path, body, content_type = build_request(entry, files)
+        started = time.perf_counter()
+        status = client.post(url, path, body, content_type, method)
+        finished = time.perf_counter()
+        with lock:
+            statuses[path][status] += 1
+            lags.append((started - scheduled) * 1000.0)
+            if status == 200:
+                latencies[path].append((finished - scheduled) * 1000.0)
+                service[path].append((finished - started) * 1000.0)
+
+    print(f"Replaying {len(plan)} requests against {url}")
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        start = time.perf_counter()
+        for offset, entry in plan:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, start + offset, entry)
+        sent = time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+
+    results = []
+    print(f"{'endpoint':<16} {'requests':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'service p50':>12}  statuses")
+    for path in sorted(statuses) + ["all"]:
+        if path == "all":
+            path_latencies = [value for values in latencies.values() for value in values]
+            path_service = [value for values in service.values() for value in values]
+            path_statuses = sum(statuses.values(), collections.Counter())
+        else:
+            path_latencies, path_service, path_statuses = latencies[path], service[path], statuses[path]
+        result = dict(percentiles(path_latencies), name=f"replay {path}",
+                      requests=sum(path_statuses.values()),
+                      statuses={str(status): count for status, count in path_statuses.items()},
+                      service_p50_ms=percentiles(path_service)["p50_ms"])
+        results.append(result)
+        print(f"{path:<16} {result['requests']:>9} {result['p50_ms'] or 0:>9.1f} {result['p90_ms'] or 0:>9.1f} "
+              f"{result['p99_ms'] or 0:>9.1f} {result['service_p50_ms'] or 0:>12.1f}  {result['statuses']}")
+    results[-1].update({
+        "offered_rate": round(len(plan) / sent, 2) if sent else None,
+        "achieved_rate": round(len(plan) / elapsed, 2),
+        "max_send_lag_ms": round(max(lags), 2) if lags else None,
+    })
+    print(f"offered {results[-1]['offered_rate']} req/s, completed {results[-1]['achieved_rate']} req/s, "
+          f"worst send lag {results[-1]['max_send_lag_ms']} ms")
+    if args.json:
+        write_results(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
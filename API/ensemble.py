@@ -0,0 +1,176 @@
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import observe_stage
+
+logger = logging.getLogger(__name__)
+
+ENSEMBLE_MODES = ("all", "fast")
+
+
+class EnsembleExecutor:
+    """Runs several models on the same features on a shared thread pool.
+
+    In "all" mode every selected model runs concurrently and the call returns
+    when all have answered. In "fast" mode models are started cheapest first
+    (by a moving average of their measured latency), only as many at a time as
+    could still complete a quorum, and the call returns as soon as ``quorum``
+    of them agree; models that were not needed are reported as skipped.
+    Sklearn, XGBoost and ONNX Runtime spend most of their time in native code
+    that releases the GIL, so threads are enough to overlap them.
+    """
+
+    def __init__(self, model_names, get_model, workers=None, mode="all", quorum=None, cost_alpha=0.2):
+        self.model_names = list(model_names)
+        self.get_model = get_model
+        self.workers = workers or max(len(self.model_names), os.cpu_count() or 1)
+        if mode not in ENSEMBLE_MODES:
+            raise ValueError(f"Invalid ensemble mode: {mode}")
+        self.mode = mode
+        self.quorum = quorum
+        self.cost_alpha = cost_alpha
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ensemble")
+        self._lock = threading.Lock()
+        # Moving average of each model's latency, used for cheapest-first order
+        self._cost_ms = {}
+        self._runs = collections.Counter()
+        self._errors = collections.Counter()
+        self._skipped = collections.Counter()
+        self._early_exits = 0
+
+    def validate(self, models=None, mode=None, quorum=None):
+        # Returns (models, mode, quorum) with defaults filled in; raises ValueError on bad input
+        if isinstance(models, str):
+            models = [name.strip() for name in models.split(",") if name.strip()]
+        models = list(models) if models else list(self.model_names)
+        unknown = [name for name in models if name not in self.model_names]
+        if unknown:
+            raise ValueError(f"Unknown models: {', '.join(unknown)}")
+        models = list(dict.fromkeys(models))
+        mode = mode or self.mode
+        if mode not in ENSEMBLE_MODES:
+            raise ValueError(f"Invalid ensemble mode: {mode}")
+        if quorum is None or quorum == "":
+            quorum = self.quorum or len(models) // 2 + 1
+        quorum = min(int(quorum), len(models))
+        if quorum < 1:
+            raise ValueError(f"Invalid quorum: {quorum}")
+        return models, mode, quorum
+
+    def cheapest_first(self, names):
+        # Models never timed count as free, so they get measured early
+        with self._lock:
+            return sorted(names, key=lambda name: self._cost_ms.get(name, 0.0))
+
+    def _predict(self, name, features, get_model):
+        # Timed from after the model is fetched, so a first-use load does not
+        # count as the model's inference cost
+        start = time.perf_counter()
+        try:
+            model = get_model(name)
+            start = time.perf_counter()
+            outcome = (True, model.predict(features)[0])
+        except Exception as e:
+            logger.error(f"Error in {name} prediction: {str(e)}")
+            outcome = (False, e)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        observe_stage("inference", elapsed_ms / 1000.0, name)
+        with self._lock:
+            self._runs[name] += 1
+            if not outcome[0]:
+                self._errors[name] += 1
+            previous = self._cost_ms.get(name)
+            self._cost_ms[name] = elapsed_ms if previous is None else \
+                previous + self.cost_alpha * (elapsed_ms - previous)
+        return outcome + (elapsed_ms,)
+
+    def run(self, features, models=None, mode=None, quorum=None, get_model=None):
+        """Predict one row with the selected models.
+
+        ``get_model`` overrides the executor's model lookup for this call, e.g.
+        to use models of one version fetched together with the features' vectorizer.
+
+        Returns a dict with ``outcomes`` (model -> (ok, prediction or
+        exception)), ``timings_ms`` (model -> ms), ``verdict`` (the prediction
+        at least ``quorum`` models agree on, or None) and ``skipped`` models.
+        """
+        models, mode, quorum = self.validate(models, mode, quorum)
+        get_model = get_model or self.get_model
+        outcomes, timings = {}, {}
+
+        def collect(future, name):
+            ok, value, elapsed_ms = future.result()
+            outcomes[name] = (ok, value)
+            timings[name] = round(elapsed_ms, 3)
+
+        def leader():
+            votes = collections.Counter(value for ok, value in outcomes.values() if ok)
+            return votes.most_common(1)[0] if votes else (None, 0)
+
+        if mode == "all":
+            futures = {name: self._pool.submit(self._predict, name, features, get_model) for name in models}
+            for name, future in futures.items():
+                collect(future, name)
+            skipped = []
+        else:
+            pending = self.cheapest_first(models)
+            running = {}
+            while True:
+                _, votes = leader()
+                if votes >= quorum:
+                    break
+                # Start just enough models that the quorum could still be reached
+                while len(running) < quorum - votes and pending:
+                    name = pending.pop(0)
+                    running[self._pool.submit(self._predict, name, features, get_model)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, running.pop(future))
+            # Models still running finish in the background; their result is not needed
+            skipped = pending + list(running.values())
+            with self._lock:
+                self._skipped.update(skipped)
+                if skipped:
+                    self._early_exits += 1
+
+        verdict, votes = leader()
+        return {
+            "outcomes": outcomes,
+            "timings_ms": timings,
+            "verdict": verdict if votes >= quorum else None,
+            "skipped": skipped,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "mode": self.mode,
+                "early_exits": self._early_exits,
+                "models": {
+                    name: {
+                        "runs": self._runs.get(name, 0),
+                        "errors": self._errors.get(name, 0),
+                        "skipped": self._skipped.get(name, 0),
+                        "mean_latency_ms": round(self._cost_ms[name], 3) if name in self._cost_ms else None,
+                    }
+                    for name in self.model_names
+                },
+            }
+
+
+def ensemble_from_env(model_names, get_model):
+    quorum = os.environ.get("ENSEMBLE_QUORUM")
+    workers = os.environ.get("ENSEMBLE_WORKERS")
+    return EnsembleExecutor(
+        model_names, get_model,
+        workers=int(workers) if workers else None,
+        mode=os.environ.get("ENSEMBLE_MODE", "all"),
+        quorum=int(quorum) if quorum else None,
+    )
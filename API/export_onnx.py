@@ -0,0 +1,269 @@
+# Export the /predict text models and the YOLO detectors in model_weights/ to
+# ONNX, optionally with int8 dynamic quantization, and check that the exports
+# agree with the native models.
+# Run from the repository root: python API/export_onnx.py [--quantize]
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from onnx_backend import INPUT_COLUMNS, SPARSE_COLUMNS, ZERO_AS_MISSING, OnnxClassifier, onnx_path
+
+TEXT_MODEL_NAMES = ["Logistic_Regression", "Naive_Bayes", "SVM", "XGBoost"]
+YOLO_MODELS = ["yolov8n.pt", "best.pt"]
+# Node names of the TF-IDF and text-length/brand halves of the linear models
+TFIDF_GATHER = "tfidf_gather"
+OTHER_MATMUL = "other_matmul"
+# Images used to compare native and ONNX detections
+PARITY_IMAGES = ["API/yolotest.jpg", "API/test.png", "API/ocrapi_test.png", "API/fakenewsapi_test.png"]
+
+
+def linear_terms(model):
+    # (weights [n_features, k], bias [k]) of a linear text model, so that
+    # scores = X @ weights + bias and the label is argmax (or score > 0 when k == 1)
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.svm import SVC
+    if isinstance(model, MultinomialNB):
+        return model.feature_log_prob_.T, model.class_log_prior_
+    if isinstance(model, SVC) and model.kernel != "linear":
+        raise ValueError(f"Only linear SVMs can be exported, not kernel={model.kernel}")
+    if isinstance(model, (LogisticRegression, SVC)):
+        # SVC.coef_ is the support vectors collapsed into one weight vector,
+        # which keeps the export at a few MB instead of every support vector
+        coef = model.coef_.toarray() if hasattr(model.coef_, "toarray") else np.asarray(model.coef_)
+        return coef.T, np.asarray(model.intercept_)
+    raise TypeError(f"No linear export for {type(model).__name__}")
+
+
+def linear_to_onnx(model, name, n_tfidf):
+    # Linear model over sparse input: the TF-IDF block arrives as COO triplets
+    # (rows, columns, values) and its weights are gathered per non-zero, so a
+    # 100k-column row costs its few hundred terms instead of a dense MatMul.
+    # The unscaled text-length and brand columns come in as a small dense
+    # matrix with their own MatMul, which int8 quantization leaves alone.
+    from onnx import TensorProto, helper, numpy_helper
+    weights, bias = linear_terms(model)
+    n_features, n_scores = weights.shape
+    nodes = [
+        helper.make_node("Gather", ["tfidf_weights", "columns"], ["term_weights"], axis=0, name=TFIDF_GATHER),
+        helper.make_node("Unsqueeze", ["values", "last_axis"], ["term_values"]),
+        helper.make_node("Mul", ["term_weights", "term_values"], ["term_scores"]),
+        helper.make_node("Unsqueeze", ["rows", "last_axis"], ["term_rows"]),
+        helper.make_node("Shape", ["other"], ["other_shape"], end=1),
+        helper.make_node("Concat", ["other_shape", "score_width"], ["scores_shape"], axis=0),
+        helper.make_node("ConstantOfShape", ["scores_shape"], ["empty_scores"],
+                         value=numpy_helper.from_array(np.zeros(1, dtype=np.float32))),
+        helper.make_node("ScatterND", ["empty_scores", "term_rows", "term_scores"], ["tfidf_scores"],
+                         reduction="add"),
+        helper.make_node("MatMul", ["other", "other_weights"], ["other_scores"], name=OTHER_MATMUL),
+        helper.make_node("Add", ["tfidf_scores", "other_scores"], ["raw_scores"]),
+        helper.make_node("Add", ["raw_scores", "bias"], ["scores"]),
+    ]
+    initializers = [
+        numpy_helper.from_array(np.ascontiguousarray(weights[:n_tfidf], dtype=np.float32), "tfidf_weights"),
+        numpy_helper.from_array(np.ascontiguousarray(weights[n_tfidf:], dtype=np.float32), "other_weights"),
+        numpy_helper.from_array(np.asarray(bias, dtype=np.float32), "bias"),
+        numpy_helper.from_array(np.array([n_scores], dtype=np.int64), "score_width"),
+        numpy_helper.from_array(np.array([1], dtype=np.int64), "last_axis"),
+        numpy_helper.from_array(np.asarray(model.classes_, dtype=np.int64), "classes"),
+    ]
+    if n_scores == 1:
+        nodes += [
+            helper.make_node("Greater", ["scores", "zero"], ["positive"]),
+            helper.make_node("Cast", ["positive"], ["positive_index"], to=TensorProto.INT64),
+            helper.make_node("Squeeze", ["positive_index", "last_axis"], ["label_index"]),
+        ]
+        initializers.append(numpy_helper.from_array(np.zeros(1, dtype=np.float32), "zero"))
+    else:
+        nodes.append(helper.make_node("ArgMax", ["scores"], ["label_index"], axis=1, keepdims=0))
+    nodes.append(helper.make_node("Gather", ["classes", "label_index"], ["label"]))
+    inputs = [
+        helper.make_tensor_value_info("rows", TensorProto.INT64, [None]),
+        helper.make_tensor_value_info("columns", TensorProto.INT64, [None]),
+        helper.make_tensor_value_info("values", TensorProto.FLOAT, [None]),
+        helper.make_tensor_value_info("other", TensorProto.FLOAT, [None, n_features - n_tfidf]),
+    ]
+    outputs = [
+        helper.make_tensor_value_info("label", TensorProto.INT64, [None]),
+        helper.make_tensor_value_info("scores", TensorProto.FLOAT, [None, n_scores]),
+    ]
+    # IR version 8 loads on every onnxruntime that supports opset 17
+    onx = helper.make_model(helper.make_graph(nodes, name, inputs, outputs, initializers),
+                            opset_imports=[helper.make_opsetid("", 17)], ir_version=8)
+    onx.metadata_props.add(key=SPARSE_COLUMNS, value=str(n_tfidf))
+    return onx
+
+
+def xgboost_to_onnx(model):
+    # The trees split on a few dozen of the 100k+ columns; the export takes
+    # only those (listed in its metadata) so rows are cheap to densify
+    from onnxmltools.convert import convert_xgboost
+    from onnxmltools.convert.common.data_types import FloatTensorType
+    onx = convert_xgboost(model, initial_types=[("input", FloatTensorType([None, model.n_features_in_]))],
+                          target_opset=15)
+    ensemble = next(node for node in onx.graph.node if node.op_type == "TreeEnsembleClassifier")
+    feature_ids = next(attr for attr in ensemble.attribute if attr.name == "nodes_featureids")
+    used = sorted(set(feature_ids.ints))
+    position = {column: i for i, column in enumerate(used)}
+    feature_ids.ints[:] = [position[column] for column in feature_ids.ints]
+    onx.graph.input[0].type.tensor_type.shape.dim[1].dim_value = len(used)
+    onx.metadata_props.add(key=INPUT_COLUMNS, value=json.dumps(used))
+    # XGBoost was trained on sparse rows, where absent entries are "missing"
+    # rather than 0; OnnxClassifier fills them with NaN to match
+    onx.metadata_props.add(key=ZERO_AS_MISSING, value="1")
+    return onx
+
+
+def native_scores(model, features):
+    # The score each export reports as its second output, from the native model
+    from xgboost import XGBClassifier
+    if isinstance(model, XGBClassifier):
+        return model.predict_proba(features)
+    if hasattr(model, "predict_joint_log_proba"):
+        return model.predict_joint_log_proba(features)
+    return model.decision_function(features).reshape(features.shape[0], -1)
+
+
+def quantize(path):
+    # Dynamic int8 quantization of the MatMul/Conv/Gather weights; returns the new
+    # path, or None when the graph has nothing to quantize (tree ensembles)
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    ops = {node.op_type for node in onnx.load(path).graph.node}
+    if not ops & {"MatMul", "Gemm", "Conv", "Gather"}:
+        return None
+    target = onnx_path(path, "onnx-int8")
+    quantize_dynamic(path, target, weight_type=QuantType.QInt8, nodes_to_exclude=[OTHER_MATMUL])
+    return target
+
+
+def export_text_models(directory, names, quantize_int8):
+    import joblib
+    from xgboost import XGBClassifier
+    n_tfidf = len(joblib.load(os.path.join(directory, "content_vectorizer.pkl")).vocabulary_)
+    exported = []
+    for name in names:
+        model = joblib.load(os.path.join(directory, f"{name}.pkl"))
+        if isinstance(model, XGBClassifier):
+            onx = xgboost_to_onnx(model)
+        else:
+            onx = linear_to_onnx(model, name, n_tfidf)
+        path = onnx_path(os.path.join(directory, f"{name}.pkl"), "onnx")
+        with open(path, "wb") as f:
+            f.write(onx.SerializeToString())
+        print(f"{name}: wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        exported.append((name, model, path))
+        if quantize_int8:
+            quantized = quantize(path)
+            if quantized is None:
+                print(f"{name}: no weights to quantize, int8 export skipped")
+            else:
+                print(f"{name}: wrote {quantized} ({os.path.getsize(quantized) / 1e6:.1f} MB)")
+                exported.append((f"{name} (int8)", model, quantized))
+    return exported
+
+
+def export_yolo(directory, names, quantize_int8, imgsz):
+    from ultralytics import YOLO
+    exported = []
+    for name in names:
+        source = os.path.join(directory, name)
+        # Dynamic batch axis, since the API micro-batches YOLO requests
+        written = YOLO(source).export(format="onnx", imgsz=imgsz, dynamic=True)
+        path = onnx_path(source, "onnx")
+        if os.path.abspath(written) != os.path.abspath(path):
+            shutil.move(written, path)
+        print(f"{name}: wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        exported.append((name, source, path))
+        if quantize_int8:
+            quantized = quantize(path)
+            print(f"{name}: wrote {quantized} ({os.path.getsize(quantized) / 1e6:.1f} MB)")
+            exported.append((f"{name} (int8)", source, quantized))
+    return exported
+
+
+def parity_articles(directory, count, seed=0):
+    # Random articles over the vectorizer's vocabulary with a mix of known and
+    # unknown brands, vectorized the way /predict does
+    import joblib
+    from features import FeatureAssembler
+    assembler = FeatureAssembler(joblib.load(os.path.join(directory, "content_vectorizer.pkl")),
+                                 joblib.load(os.path.join(directory, "brand_columns.pkl")))
+    vocabulary = sorted(assembler.vectorizer.vocabulary_)
+    brands = [column[len("Brand_"):] for column in assembler.brand_columns] + ["Unknown"]
+    rng = np.random.default_rng(seed)
+    contents = [" ".join(rng.choice(vocabulary, rng.integers(5, 400))) for _ in range(count)]
+    return assembler.transform(contents, [brands[i] for i in rng.integers(0, len(brands), count)])
+
+
+def check_text_parity(exported, features, min_agreement):
+    ok = True
+    for name, model, path in exported:
+        onnx_model = OnnxClassifier(path)
+        agreement = float(np.mean(onnx_model.predict(features) == model.predict(features)))
+        score_diff = float(np.max(np.abs(onnx_model.decision_scores(features) - native_scores(model, features))))
+        passed = agreement >= min_agreement
+        ok &= passed
+        print(f"{name:<28} label agreement {agreement:7.2%}   max score diff {score_diff:.2e}   "
+              f"{'OK' if passed else 'FAIL'}")
+    return ok
+
+
+def check_yolo_parity(exported, min_agreement):
+    # Compare the sorted detected labels per image
+    import cv2
+    from ultralytics import YOLO
+    images = [cv2.resize(image, (640, 640)) for image in (cv2.imread(p) for p in PARITY_IMAGES) if image is not None]
+    ok = True
+    for name, source, path in exported:
+        native, onnx_model = YOLO(source), YOLO(path, task="detect")
+        matches = 0
+        for image in images:
+            expected = sorted(native.names[int(c)] for c in native(image, verbose=False)[0].boxes.cls)
+            got = sorted(onnx_model.names[int(c)] for c in onnx_model(image, verbose=False)[0].boxes.cls)
+            matches += expected == got
+        agreement = matches / float(max(1, len(images)))
+        passed = agreement >= min_agreement
+        ok &= passed
+        print(f"{name:<28} same labels on {matches}/{len(images)} images   {'OK' if passed else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export model_weights/ models to ONNX and check parity")
+    parser.add_argument("--weights", default="model_weights", help="directory with the native model files")
+    parser.add_argument("--models", nargs="+", default=TEXT_MODEL_NAMES + YOLO_MODELS,
+                        help="text model names and/or YOLO .pt files to export")
+    parser.add_argument("--quantize", action="store_true", help="also write int8 dynamically quantized exports")
+    parser.add_argument("--imgsz", type=int, default=640, help="YOLO export input size")
+    parser.add_argument("--parity-articles", type=int, default=2000, help="articles used for the text parity check")
+    parser.add_argument("--min-agreement", type=float, default=0.995,
+                        help="lowest label agreement with the native model that passes")
+    parser.add_argument("--no-check", action="store_true", help="skip the parity check")
+    args = parser.parse_args()
+
+    unknown = set(args.models) - set(TEXT_MODEL_NAMES) - set(YOLO_MODELS)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+    text_names = [name for name in args.models if name in TEXT_MODEL_NAMES]
+    yolo_names = [name for name in args.models if name in YOLO_MODELS]
+
+    text_exports = export_text_models(args.weights, text_names, args.quantize) if text_names else []
+    yolo_exports = export_yolo(args.weights, yolo_names, args.quantize, args.imgsz) if yolo_names else []
+    if args.no_check:
+        return 0
+
+    ok = True
+    if text_exports:
+        ok &= check_text_parity(text_exports, parity_articles(args.weights, args.parity_articles), args.min_agreement)
+    if yolo_exports:
+        ok &= check_yolo_parity(yolo_exports, args.min_agreement)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,10 @@
-import numpy as np
-import pandas as pd
 import joblib
-from scipy.sparse import hstack
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+from features import FeatureAssembler
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for cross-origin requests
 
@@ -19,35 +18,12 @@ models = {
 vectorizer = joblib.load("appcon-hackathon/model_weights/content_vectorizer.pkl")
 brand_columns = joblib.load("appcon-hackathon/model_weights/brand_columns.pkl")
 
+feature_assembler = FeatureAssembler(vectorizer, brand_columns)
+
 def preprocess_input(content, brand):
     try:
-        # Feature engineering
-        text_length = len(content)
-        word_count = len(content.split())
-        avg_word_length = sum(len(word) for word in content.split()) / word_count if word_count > 0 else 0
-
-        # TF-IDF vectorization
-        tfidf_content = vectorizer.transform([content])
-
-        # One-hot encode brand
-        brand_data = np.zeros(len(brand_columns))
-        brand_col = f"Brand_{brand}"
-        if brand_col in brand_columns:
-            brand_idx = brand_columns.index(brand_col)
-            brand_data[brand_idx] = 1
-
-        # Other features DataFrame
-        other_features = pd.DataFrame({
-            'text_length': [text_length],
-            'word_count': [word_count],
-            'avg_word_length': [avg_word_length],
-            **{col: [brand_data[i]] for i, col in enumerate(brand_columns)}
-        })
-
-        # Combine TF-IDF and other features
-        combined_features = hstack([tfidf_content, other_features])
-
-        return combined_features
+        # TF-IDF, hand-crafted features and brand one-hot in a single sparse row
+        return feature_assembler.transform_one(content, brand)
     except Exception as e:
         print(f"Error in preprocessing: {str(e)}")
         return None
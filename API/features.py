@@ -0,0 +1,164 @@
+import collections
+import itertools
+import re
+
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+# Hand-crafted features that sit between the TF-IDF block and the brand one-hot
+TEXT_FEATURES = ['text_length', 'word_count', 'avg_word_length']
+
+# sklearn's default token pattern. findall() returns the same tokens without
+# the \b anchors, which are the costly part: every match starts at the
+# beginning of a run of word characters and \w\w+ takes the whole run. On
+# ASCII text the ASCII-only \w matches the same characters, and faster.
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+UNANCHORED_TOKEN_PATTERN = r"(?u)\w\w+"
+ASCII_TOKEN_PATTERN = r"(?a)\w\w+"
+
+
+class FastTfidf:
+    """``TfidfVectorizer.transform`` for plain word unigrams, with identical output.
+
+    sklearn counts terms in a Python loop with a dict update per token. Here
+    each document is tokenized with an equivalent regex and counted in C,
+    the distinct terms of the whole call are mapped to columns in one pass,
+    and one argsort of (row, column) keys puts them in CSR order. idf
+    weighting and row normalization are the same numpy operation and Cython
+    routine sklearn uses, so the matrix matches ``vectorizer.transform`` bit
+    for bit.
+
+    The vocabulary and idf are read from the vectorizer on every call, so
+    they can be swapped for shared copies (shared_weights.py) after this is
+    built.
+    """
+
+    def __init__(self, vectorizer):
+        if not self.supports(vectorizer):
+            raise ValueError("FastTfidf only supports word unigram TfidfVectorizers without custom callables")
+        self.vectorizer = vectorizer
+        default = vectorizer.token_pattern == DEFAULT_TOKEN_PATTERN
+        self.pattern = re.compile(UNANCHORED_TOKEN_PATTERN if default else vectorizer.token_pattern)
+        self.ascii_pattern = re.compile(ASCII_TOKEN_PATTERN) if default else self.pattern
+        from sklearn.utils.sparsefuncs_fast import inplace_csr_row_normalize_l1, inplace_csr_row_normalize_l2
+        self.normalize = {"l1": inplace_csr_row_normalize_l1, "l2": inplace_csr_row_normalize_l2,
+                          None: None}[vectorizer.norm]
+
+    @staticmethod
+    def supports(vectorizer):
+        # Configurations whose transform is exactly decode, lower, findall, count, weight, normalize
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        if not isinstance(vectorizer, TfidfVectorizer) or not hasattr(vectorizer, "vocabulary_"):
+            return False
+        return (vectorizer.analyzer == "word" and vectorizer.input == "content"
+                and vectorizer.tokenizer is None and vectorizer.preprocessor is None
+                and vectorizer.strip_accents is None and vectorizer.stop_words is None
+                and tuple(vectorizer.ngram_range) == (1, 1) and vectorizer.norm in ("l1", "l2", None)
+                and vectorizer.token_pattern is not None and re.compile(vectorizer.token_pattern).groups == 0
+                and (hasattr(vectorizer, "idf_") or not vectorizer.use_idf))
+
+    def columns(self, tokens):
+        # Column of every token, -1 for tokens outside the vocabulary
+        vocabulary = self.vectorizer.vocabulary_
+        if isinstance(vocabulary, dict):
+            return np.fromiter(map(vocabulary.get, tokens, itertools.repeat(-1)), dtype=np.int64, count=len(tokens))
+        return vocabulary.lookup(tokens)
+
+    def transform(self, raw_documents):
+        vectorizer = self.vectorizer
+        terms, term_counts, lengths = [], [], []
+        for doc in raw_documents:
+            if isinstance(doc, bytes):
+                doc = doc.decode(vectorizer.encoding, vectorizer.decode_error)
+            if vectorizer.lowercase:
+                doc = doc.lower()
+            # Counted in C, so only distinct terms are looked up below
+            pattern = self.ascii_pattern if doc.isascii() else self.pattern
+            counter = collections.Counter(pattern.findall(doc))
+            terms.extend(counter.keys())
+            term_counts.extend(counter.values())
+            lengths.append(len(counter))
+
+        n_rows, n_features = len(lengths), len(vectorizer.vocabulary_)
+        columns = self.columns(terms)
+        known = columns >= 0
+        rows = np.repeat(np.arange(n_rows, dtype=np.int64), lengths)[known]
+        # Distinct terms of a row have distinct columns, so sorting the
+        # (row, column) keys puts the nonzeros in CSR order
+        keys = rows * n_features + columns[known]
+        order = np.argsort(keys, kind="stable")
+        indices = columns[known][order].astype(np.int32)
+        counts = np.asarray(term_counts, dtype=np.int64)[known][order]
+        indptr = np.zeros(n_rows + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+
+        # The same sequence of operations as CountVectorizer + TfidfTransformer
+        data = counts.astype(vectorizer.dtype)
+        if vectorizer.binary:
+            data.fill(1)
+        if vectorizer.sublinear_tf:
+            np.log(data, data)
+            data += 1.0
+        if vectorizer.use_idf:
+            data *= vectorizer.idf_[indices]
+        matrix = csr_matrix((data, indices, indptr), shape=(n_rows, n_features))
+        if self.normalize is not None:
+            self.normalize(matrix)
+        return matrix
+
+
+class FeatureAssembler:
+    """Builds the /predict feature matrix [TF-IDF | text features | brand one-hot].
+
+    Everything that does not depend on the request (the brand -> column index
+    and the matrix width) is computed once here, so each call only runs the
+    TF-IDF transform plus a direct CSR construction and a single hstack.
+    The TF-IDF transform goes through FastTfidf unless ``fast_tfidf`` is off
+    or the vectorizer uses options FastTfidf does not cover.
+    """
+
+    def __init__(self, vectorizer, brand_columns, fast_tfidf=True):
+        self.vectorizer = vectorizer
+        self.tfidf = FastTfidf(vectorizer) if fast_tfidf and FastTfidf.supports(vectorizer) else vectorizer
+        self.brand_columns = list(brand_columns)
+        # list.index() returns the first match, so keep the first column for duplicates
+        self.brand_index = {}
+        for i, col in enumerate(self.brand_columns):
+            self.brand_index.setdefault(col, i)
+        self.n_other = len(TEXT_FEATURES) + len(self.brand_columns)
+
+    def other_features(self, contents, brands):
+        # CSR rows of [text_length, word_count, avg_word_length, brand one-hot];
+        # zeros are left out, exactly as the sparse conversion of the old DataFrame did
+        data, indices, indptr = [], [], [0]
+        brand_offset = len(TEXT_FEATURES)
+        for content, brand in zip(contents, brands):
+            words = content.split()
+            text_length = len(content)
+            word_count = len(words)
+            avg_word_length = sum(len(word) for word in words) / word_count if word_count > 0 else 0
+
+            for col, value in enumerate((text_length, word_count, avg_word_length)):
+                if value:
+                    data.append(value)
+                    indices.append(col)
+
+            brand_idx = self.brand_index.get(f"Brand_{brand}")
+            if brand_idx is not None:
+                data.append(1.0)
+                indices.append(brand_offset + brand_idx)
+            indptr.append(len(indices))
+
+        return csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, self.n_other),
+        )
+
+    def transform(self, contents, brands):
+        # One row per (content, brand) pair, in CSR format
+        tfidf_content = self.tfidf.transform(contents)
+        other = self.other_features(contents, brands)
+        return hstack([tfidf_content, other], format='csr')
+
+    def transform_one(self, content, brand):
+        return self.transform([content], [brand])
@@ -0,0 +1,346 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# JPEG markers that stand alone (no length field): RST0-7 and TEM
+_STANDALONE_MARKERS = set(range(0xD0, 0xD8)) | {0x01}
+SOI, EOI, SOS = 0xD8, 0xD9, 0xDA
+MJPEG_CONTENT_TYPES = ("multipart/x-mixed-replace", "image/jpeg", "video/x-motion-jpeg", "video/mjpeg")
+
+
+class MjpegSplitter:
+    """Cuts a byte stream of back-to-back JPEG frames into whole frames.
+
+    Accepts raw concatenated JPEGs and multipart/x-mixed-replace bodies alike:
+    anything between frames (part headers, boundaries) is skipped. A frame
+    ends at the EOI marker found by walking its segments, not by searching
+    for FF D9, so EXIF thumbnails inside a frame do not cut it short. Parsing
+    resumes where the previous ``feed`` stopped.
+    """
+
+    def __init__(self, max_frame_bytes=8 * 1024 * 1024):
+        self.max_frame_bytes = max_frame_bytes
+        self.buffer = bytearray()
+        self.pos = None         # parse position inside the current frame, None before its SOI
+        self.in_scan = False    # inside entropy-coded data
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while True:
+            if self.pos is None:
+                start = self.buffer.find(b"\xff\xd8")
+                if start < 0:
+                    # Keep a trailing FF that may begin the next SOI
+                    del self.buffer[:max(0, len(self.buffer) - 1)]
+                    return frames
+                del self.buffer[:start]
+                self.pos, self.in_scan = 2, False
+            end = self._frame_end()
+            if end == -1:
+                continue
+            if end is None:
+                if len(self.buffer) > self.max_frame_bytes:
+                    raise ValueError(f"Frame exceeds {self.max_frame_bytes} bytes")
+                return frames
+            frames.append(bytes(self.buffer[:end]))
+            del self.buffer[:end]
+            self.pos = None
+
+    def _frame_end(self):
+        # End offset of the frame at the start of the buffer, None if it is
+        # incomplete, or -1 if it turned out not to be a JPEG
+        buffer, pos = self.buffer, self.pos
+        while True:
+            if self.in_scan:
+                # Entropy-coded data: FF 00 is a stuffed byte and RSTn markers
+                # sit inside the scan; any other marker ends it
+                while True:
+                    pos = buffer.find(b"\xff", pos)
+                    if pos < 0 or pos + 1 >= len(buffer):
+                        self.pos = len(buffer) - 1 if pos >= 0 else len(buffer)
+                        return None
+                    following = buffer[pos + 1]
+                    if following == 0x00 or following in _STANDALONE_MARKERS:
+                        pos += 2
+                    elif following == 0xFF:
+                        pos += 1
+                    else:
+                        break
+                self.in_scan = False
+            if pos + 2 > len(buffer):
+                self.pos = pos
+                return None
+            if buffer[pos] != 0xFF:
+                # Not a JPEG after all: drop this start and look for the next SOI
+                del buffer[:2]
+                self.pos = None
+                return -1
+            marker = buffer[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+            elif marker == EOI:
+                return pos + 2
+            elif marker in _STANDALONE_MARKERS or marker == SOI:
+                pos += 2
+            else:
+                if pos + 4 > len(buffer):
+                    self.pos = pos
+                    return None
+                length = (buffer[pos + 2] << 8) | buffer[pos + 3]
+                if pos + 2 + length > len(buffer):
+                    self.pos = pos
+                    return None
+                pos += 2 + length
+                self.in_scan = marker == SOS
+
+
+class FrameScheduler:
+    """Decides which frames of a stream go through the detector.
+
+    Frames are scheduled on the stream's own clock (media time, or arrival
+    time for live streams). After a frame is inferred the next one is due
+    once the detector's average cost (and ``1 / max_fps``) has passed, so a
+    slow detector skips frames instead of falling further behind, and a fast
+    one runs on every frame up to ``max_fps``.
+    """
+
+    def __init__(self, max_fps=0.0, smoothing=0.3):
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.smoothing = smoothing
+        self.cost = None
+        self.next_due = float("-inf")
+
+    def due(self, t):
+        return t >= self.next_due
+
+    def done(self, t, seconds):
+        self.cost = seconds if self.cost is None else self.cost + self.smoothing * (seconds - self.cost)
+        self.next_due = t + max(self.cost, self.min_interval)
+
+
+def iou_matrix(boxes, others):
+    # Pairwise intersection over union of two (n, 4) arrays of x1, y1, x2, y2 boxes
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    others = np.asarray(others, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(boxes[:, None, :2], others[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], others[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    other_area = np.prod(others[:, 2:] - others[:, :2], axis=1)
+    union = area[:, None] + other_area[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+class Track:
+    __slots__ = ("id", "label", "box", "hits", "missed", "confirmed")
+
+    def __init__(self, track_id, label, box):
+        self.id = track_id
+        self.label = label
+        self.box = box
+        self.hits = 1
+        self.missed = 0
+        self.confirmed = False
+
+
+class IouTracker:
+    """Keeps object identities across inferred frames by box overlap.
+
+    Detections are matched to tracks of the same label, greedily by highest
+    IoU. A track is reported once it has been seen on ``min_hits`` inferred
+    frames, so one-frame false positives never reach the client, and is
+    dropped after ``max_missed`` inferred frames without a match, so a label
+    does not flicker off when one frame misses it.
+    """
+
+    def __init__(self, iou_threshold=0.3, min_hits=2, max_missed=3):
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_missed = max_missed
+        self.tracks = []
+        self.next_id = 1
+
+    def update(self, detections):
+        """Match ``[(label, [x1, y1, x2, y2])]``; returns (added, removed) tracks."""
+        matched_tracks, matched_detections = set(), set()
+        for label in {label for label, _ in detections}:
+            track_ids = [i for i, track in enumerate(self.tracks) if track.label == label]
+            detection_ids = [j for j, (other, _) in enumerate(detections) if other == label]
+            if not track_ids:
+                continue
+            overlap = iou_matrix([self.tracks[i].box for i in track_ids], [detections[j][1] for j in detection_ids])
+            for flat in np.argsort(overlap, axis=None)[::-1]:
+                row, col = divmod(int(flat), len(detection_ids))
+                if overlap[row, col] < self.iou_threshold:
+                    break
+                i, j = track_ids[row], detection_ids[col]
+                if i in matched_tracks or j in matched_detections:
+                    continue
+                matched_tracks.add(i)
+                matched_detections.add(j)
+                track = self.tracks[i]
+                track.box, track.hits, track.missed = detections[j][1], track.hits + 1, 0
+
+        added, removed, kept = [], [], []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.missed += 1
+            if track.missed > self.max_missed:
+                if track.confirmed:
+                    removed.append(track)
+                continue
+            kept.append(track)
+        for j, (label, box) in enumerate(detections):
+            if j not in matched_detections:
+                kept.append(Track(self.next_id, label, box))
+                self.next_id += 1
+        for track in kept:
+            if not track.confirmed and track.hits >= self.min_hits:
+                track.confirmed = True
+                added.append(track)
+        self.tracks = kept
+        return added, removed
+
+    def labels(self):
+        return sorted(track.label for track in self.tracks if track.confirmed)
+
+
+def track_entry(track):
+    return {"id": track.id, "label": track.label}
+
+
+class StreamSession:
+    """Detection over one frame stream, reporting label changes only.
+
+    Frames are offered with their time on the stream's clock; frames the
+    scheduler skips are never decoded. Each inferred frame updates the
+    tracker, and an event ``{"frame", "t", "added", "removed"}`` is returned
+    only when a tracked object appears or disappears. ``decode(frame)`` turns
+    a frame (JPEG bytes or a BGR array) into the model input, or None, and
+    ``detect(image)`` returns ``[(label, [x1, y1, x2, y2])]``.
+    """
+
+    def __init__(self, detect, decode, max_fps=0.0, tracker=None):
+        self.detect = detect
+        self.decode = decode
+        self.scheduler = FrameScheduler(max_fps)
+        self.tracker = tracker or IouTracker()
+        self.frames = 0
+        self.inferred = 0
+        self.undecodable = 0
+        self.inference_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def offer(self, t, frame):
+        # Event for the frame at stream time t, or None. `frame` may be a
+        # zero-argument callable producing it, so skipped frames cost nothing.
+        index = self.frames
+        self.frames += 1
+        if not self.scheduler.due(t):
+            return None
+        start = time.perf_counter()
+        image = self.decode(frame() if callable(frame) else frame)
+        if image is None:
+            self.undecodable += 1
+            return None
+        detections = self.detect(image)
+        seconds = time.perf_counter() - start
+        self.scheduler.done(t, seconds)
+        self.inferred += 1
+        self.inference_seconds += seconds
+        added, removed = self.tracker.update(detections)
+        if not added and not removed:
+            return None
+        return {"frame": index, "t": round(t, 3), "added": [track_entry(track) for track in added],
+                "removed": [track_entry(track) for track in removed]}
+
+    def skip(self, count=1):
+        # Frames dropped before they were offered (a live stream's backlog)
+        self.frames += count
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "done": True,
+            "frames": self.frames,
+            "inferred": self.inferred,
+            "skipped": self.frames - self.inferred - self.undecodable,
+            "undecodable": self.undecodable,
+            "labels": self.tracker.labels(),
+            "frames_per_s": round(self.frames / elapsed, 2) if elapsed else None,
+            "inference_ms": round(1000.0 * self.inference_seconds / self.inferred, 2) if self.inferred else None,
+        }
+
+
+class UploadedStream:
+    """Feeds a request body, chunk by chunk, into a StreamSession.
+
+    An MJPEG body (by content type, or because it starts with a JPEG SOI) is
+    split and processed as it arrives, with frame times from ``fps``. Any
+    other body is taken as a video file: it is spooled to a temporary file of
+    at most ``max_video_bytes`` and read with OpenCV once complete, using the
+    container's own frame rate when it has one.
+    """
+
+    def __init__(self, session, content_type="", fps=15.0, max_video_bytes=100 * 1024 * 1024):
+        self.session = session
+        self.content_type = (content_type or "").lower()
+        self.fps = fps
+        self.max_video_bytes = max_video_bytes
+        self.splitter = None
+        self.video = None
+        self.video_bytes = 0
+
+    def _frame_events(self, frames):
+        events = []
+        for frame in frames:
+            event = self.session.offer(self.session.frames / self.fps, frame)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def feed(self, chunk):
+        # Events for the frames completed by this chunk of the body
+        if not chunk:
+            return []
+        if self.splitter is None and self.video is None:
+            if self.content_type.startswith(MJPEG_CONTENT_TYPES) or chunk[:2] == b"\xff\xd8":
+                self.splitter = MjpegSplitter()
+            else:
+                self.video = tempfile.NamedTemporaryFile(suffix=".video", delete=False)
+        if self.splitter is not None:
+            return self._frame_events(self.splitter.feed(chunk))
+        self.video_bytes += len(chunk)
+        if self.video_bytes > self.max_video_bytes:
+            raise ValueError(f"Video exceeds {self.max_video_bytes} bytes")
+        self.video.write(chunk)
+        return []
+
+    def finish(self):
+        # Events of a spooled video (yielded as it is read), then the summary
+        if self.video is not None:
+            import cv2
+            self.video.close()
+            capture = cv2.VideoCapture(self.video.name)
+            try:
+                if not capture.isOpened():
+                    raise ValueError("Unsupported or corrupt video")
+                fps = capture.get(cv2.CAP_PROP_FPS) or self.fps
+                while capture.grab():
+                    # Only frames the scheduler picks are decoded
+                    event = self.session.offer(self.session.frames / fps, lambda: capture.retrieve()[1])
+                    if event is not None:
+                        yield event
+            finally:
+                capture.release()
+                os.unlink(self.video.name)
+        yield self.session.summary()
+
+    def close(self):
+        # Remove a spooled video when the stream ends before finish()
+        if self.video is not None and os.path.exists(self.video.name):
+            self.video.close()
+            os.unlink(self.video.name)
@@ -0,0 +1,225 @@
+import struct
+import threading
+import weakref
+
+import cv2
+import numpy as np
+
+from instrumentation import stage
+
+# Grey used by YOLO's own letterboxing for the padding around the image
+PAD_VALUE = 114
+# libjpeg can scale by 1/2, 1/4 and 1/8 while decoding (DCT scaling), which
+# skips most of the decode work and never allocates the full-size image
+REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    1: cv2.IMREAD_COLOR,
+}
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Idle model input buffers by side, kept for the next request; more than
+# MAX_IDLE_BUFFERS idle ones of a side are left to the garbage collector
+MAX_IDLE_BUFFERS = 16
+_idle_buffers = {}
+_idle_lock = threading.Lock()
+# Allocator of the model input buffers, shape -> uint8 array that is
+# recycled once collected (the idle pool unless set_buffer_allocator() replaced it)
+_allocate = None
+
+
+def _exif_orientation(segment):
+    # Orientation tag of an APP1 Exif segment's first IFD, or 1
+    if not segment.startswith(b"Exif\x00\x00") or len(segment) < 14:
+        return 1
+    tiff = segment[6:]
+    endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if endian is None:
+        return 1
+    (ifd,) = struct.unpack_from(endian + "I", tiff, 4)
+    if ifd + 2 > len(tiff):
+        return 1
+    (entries,) = struct.unpack_from(endian + "H", tiff, ifd)
+    for i in range(entries):
+        offset = ifd + 2 + 12 * i
+        if offset + 12 > len(tiff):
+            break
+        tag, kind, _, value = struct.unpack_from(endian + "HHIH", tiff, offset)
+        if tag == EXIF_ORIENTATION_TAG and kind == 3:
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+
+def image_info(data):
+    """(format, width, height, EXIF orientation) read from the file header.
+
+    Only JPEG and PNG headers are parsed; anything else (or a truncated
+    header) gives None and is decoded the ordinary way. Width and height are
+    as stored, before the orientation is applied.
+    """
+    try:
+        if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+            width, height = struct.unpack_from(">II", data, 16)
+            return "png", width, height, 1
+        if data[:2] != b"\xff\xd8":
+            return None
+        orientation, offset = 1, 2
+        while offset + 4 <= len(data):
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset + 1]
+            if marker == 0xFF:  # fill byte
+                offset += 1
+                continue
+            (length,) = struct.unpack_from(">H", data, offset + 2)
+            if marker == 0xE1:
+                orientation = _exif_orientation(bytes(data[offset + 4:offset + 2 + length]))
+            elif marker in SOF_MARKERS:
+                height, width = struct.unpack_from(">HH", data, offset + 5)
+                return "jpeg", width, height, orientation
+            elif marker == 0xDA:  # start of scan without a frame header
+                return None
+            offset += 2 + length
+    except struct.error:
+        pass
+    return None
+
+
+def upright_size(data):
+    # (width, height) of an upload once turned upright, from its header, or None
+    info = image_info(data)
+    if info is None:
+        return None
+    _, width, height, orientation = info
+    return (height, width) if orientation >= 5 else (width, height)
+
+
+def reduction_factor(width, height, target_side):
+    # Largest libjpeg scale-down that keeps the long side at least target_side
+    long_side = max(width, height)
+    for factor in (8, 4, 2):
+        if long_side // factor >= target_side:
+            return factor
+    return 1
+
+
+def apply_orientation(image, orientation):
+    # Same transforms OpenCV applies for each EXIF orientation value
+    if orientation >= 5:
+        image = cv2.transpose(image)
+    flip = {2: 1, 3: -1, 4: 0, 6: 1, 7: -1, 8: 0}.get(orientation)
+    return image if flip is None else cv2.flip(image, flip)
+
+
+def _decode(data, target_side):
+    # (stored-orientation image, orientation to apply) or (None, 1)
+    info = image_info(data)
+    array = np.frombuffer(data, np.uint8)
+    if info is None or info[0] != "jpeg":
+        # Nothing to gain from the header; OpenCV applies any orientation itself
+        return cv2.imdecode(array, cv2.IMREAD_COLOR), 1
+    _, width, height, orientation = info
+    factor = reduction_factor(width, height, target_side) if target_side else 1
+    image = cv2.imdecode(array, REDUCED_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION)
+    return image, orientation
+
+
+def decode_image(data, target_side=None):
+    """Decode an upload to an upright BGR image, or None if it is not an image.
+
+    With ``target_side``, JPEGs are decoded at the smallest 1/2, 1/4 or 1/8
+    scale whose long side is still at least ``target_side``, so a 12MP photo
+    needed at 640px is never decoded at full size.
+    """
+    with stage("decode"):
+        image, orientation = _decode(data, target_side)
+        if image is None:
+            return None
+        return apply_orientation(image, orientation)
+
+
+def set_buffer_allocator(allocate):
+    # Where model input buffers come from, e.g. shared memory that inference
+    # worker processes read in place; buffers already handed out stay
+    global _allocate
+    _allocate = allocate
+
+
+def _return_buffer(size, buffer):
+    with _idle_lock:
+        idle = _idle_buffers.setdefault(size, [])
+        if len(idle) < MAX_IDLE_BUFFERS:
+            idle.append(buffer)
+
+
+def letterbox_buffer(size):
+    """A ``size`` x ``size`` model input buffer for one request.
+
+    Checked out of a pool of idle buffers and given back once the array
+    returned, and every view of it, is gone, so a buffer is never reused
+    while a batch or a cache still holds it, whatever thread asked for it.
+    With set_buffer_allocator(), the allocator's arrays are used instead;
+    it recycles them the same way.
+    """
+    shape = (size, size, 3)
+    if _allocate is not None:
+        return _allocate(shape)
+    with _idle_lock:
+        idle = _idle_buffers.get(size)
+        buffer = idle.pop() if idle else None
+    if buffer is None:
+        buffer = np.empty(shape, np.uint8)
+    # Views of an ndarray name its owner as their base, which would let a slice
+    # outlive the array handed out; views of one over a memoryview keep it
+    checked_out = np.asarray(memoryview(buffer))
+    weakref.finalize(checked_out, _return_buffer, size, buffer)
+    return checked_out
+
+
+def letterbox(image, size=640, orientation=1, out=None):
+    """Fit ``image`` into a ``size`` x ``size`` square without distorting it.
+
+    The image is scaled to fit, rotated to ``orientation`` after scaling (the
+    cheap side of the resize), centred, and padded with PAD_VALUE, all written
+    into ``out`` (a new array if not given). Returns ``out``.
+    """
+    if out is None:
+        out = np.empty((size, size, 3), np.uint8)
+    height, width = image.shape[:2]
+    upright_width, upright_height = (height, width) if orientation >= 5 else (width, height)
+    scale = min(size / upright_width, size / upright_height)
+    new_width = min(size, max(1, round(upright_width * scale)))
+    new_height = min(size, max(1, round(upright_height * scale)))
+    top, left = (size - new_height) // 2, (size - new_width) // 2
+    out[:top] = PAD_VALUE
+    out[top + new_height:] = PAD_VALUE
+    out[top:top + new_height, :left] = PAD_VALUE
+    out[top:top + new_height, left + new_width:] = PAD_VALUE
+
+    target = out[top:top + new_height, left:left + new_width]
+    # After a reduced decode the scale is rarely below 1/2, where bilinear (as
+    # YOLO's own letterbox uses) is as good as INTER_AREA and several times faster
+    interpolation = cv2.INTER_AREA if scale < 0.5 else cv2.INTER_LINEAR
+    if orientation == 1:
+        cv2.resize(image, (new_width, new_height), dst=target, interpolation=interpolation)
+    else:
+        stored_size = (new_height, new_width) if orientation >= 5 else (new_width, new_height)
+        target[...] = apply_orientation(cv2.resize(image, stored_size, interpolation=interpolation), orientation)
+    return out
+
+
+def decode_letterboxed(data, size=640):
+    """Decode an upload straight into a ``size`` x ``size`` model input.
+
+    Returns the letterboxed image (a pooled buffer, see letterbox_buffer())
+    or None if the upload is not an image.
+    """
+    with stage("decode"):
+        image, orientation = _decode(data, size)
+    if image is None:
+        return None
+    with stage("resize"):
+        return letterbox(image, size, orientation, out=letterbox_buffer(size))
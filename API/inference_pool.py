@@ -0,0 +1,474 @@
+import atexit
+import collections
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from instrumentation import capture_stages, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Thread counts read by OpenMP (PyTorch, XGBoost, scikit-learn), MKL,
+# OpenBLAS, numexpr, Accelerate and Tesseract (OMP_THREAD_LIMIT) when they
+# start their thread pools
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+                    "VECLIB_MAXIMUM_THREADS", "OMP_THREAD_LIMIT")
+# Settings of a pool in the config file, with their defaults
+POOL_DEFAULTS = {"processes": 1, "threads": 1, "max_queue": 16, "timeout_s": 60.0}
+# Model input blocks per shared-memory segment
+DEFAULT_SHARED_BLOCKS = 32
+
+
+class PoolQueueFull(Exception):
+    """Raised when every worker of an inference pool is busy and its queue is full."""
+
+
+class PoolTimeout(Exception):
+    """Raised when an inference pool task does not finish in time."""
+
+
+def pin_threads(threads):
+    """Cap the native thread pools of this process at ``threads`` threads.
+
+    Pools already running (BLAS and OpenMP libraries loaded so far) are
+    limited through threadpoolctl when it is installed, OpenCV and PyTorch
+    through their own settings, and libraries loaded later read the
+    THREAD_VARIABLES set here.
+    """
+    threads = max(1, int(threads))
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+    cv2.setNumThreads(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+# Where an image lives in shared memory: segment name, byte offset and shape
+SharedArray = collections.namedtuple("SharedArray", ("name", "offset", "shape"))
+
+
+class _Segment(shared_memory.SharedMemory):
+    # Arrays of a segment can outlive it at interpreter exit, when closing
+    # the mapping fails; it goes away with the process anyway
+    def __del__(self):
+        try:
+            self.close()
+        except (BufferError, OSError):
+            pass
+
+
+class SharedImageArena:
+    """Fixed-size blocks of one shared-memory segment, for uint8 arrays of one shape.
+
+    An array from allocate() is a view of the segment, so a worker process
+    reads it in place from its SharedArray (describe(), shared_view())
+    instead of receiving a pickled copy. Its block returns to the arena when
+    the array itself is garbage collected; views taken of it do not keep
+    the block.
+    """
+
+    def __init__(self, shape, blocks):
+        self.shape = tuple(shape)
+        self.block_bytes = int(np.prod(self.shape))
+        self.blocks = max(1, int(blocks))
+        self._memory = _Segment(create=True, size=self.block_bytes * self.blocks)
+        self._data = np.frombuffer(self._memory.buf, np.uint8)
+        self._address = self._data.ctypes.data
+        self._free = list(range(self.blocks - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self._memory.name
+
+    def allocate(self):
+        # A free block as an array of the arena's shape, or None when all are in use
+        with self._lock:
+            if not self._free:
+                return None
+            block = self._free.pop()
+        start = block * self.block_bytes
+        # Over a memoryview, so that every view of the block keeps this array
+        # alive (see image_ingest.letterbox_buffer())
+        array = np.asarray(memoryview(self._data[start:start + self.block_bytes].reshape(self.shape)))
+        weakref.finalize(array, self._release, block)
+        return array
+
+    def _release(self, block):
+        with self._lock:
+            self._free.append(block)
+
+    def in_use(self):
+        with self._lock:
+            return self.blocks - len(self._free)
+
+    def describe(self, array):
+        # SharedArray of an array that is one of this arena's blocks, else None
+        offset = array.ctypes.data - self._address
+        if (array.dtype != np.uint8 or array.shape != self.shape or not array.flags.c_contiguous
+                or offset < 0 or offset % self.block_bytes or offset >= self.block_bytes * self.blocks):
+            return None
+        return SharedArray(self.name, offset, self.shape)
+
+    def unlink(self):
+        # Remove the segment; workers that attached keep their mapping until they exit
+        try:
+            self._memory.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedImages:
+    """Shared-memory arenas for every input shape in use, of ``blocks`` blocks
+    each; a shape gets another arena when its arenas are all in use.
+
+    allocate() is the letterbox buffer allocator of the API process (see
+    image_ingest.set_buffer_allocator()), so decoded uploads are written
+    straight into shared memory. A block is free again once the request
+    drops its input, so a shape needs about as many blocks as there are
+    requests decoding or waiting for inference at once.
+    describe() turns an image into what is sent to a worker: its
+    SharedArray when it already is a block, else that of a block it is
+    copied into, else (not uint8) the array itself.
+    """
+
+    def __init__(self, blocks=DEFAULT_SHARED_BLOCKS):
+        self.blocks = max(1, int(blocks))
+        self._arenas = {}  # shape -> [SharedImageArena]
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+
+    def _allocate(self, shape):
+        # (arena, free block) of `shape`, adding an arena when all are in use
+        with self._lock:
+            arenas = self._arenas.setdefault(shape, [])
+            for arena in arenas:
+                block = arena.allocate()
+                if block is not None:
+                    return arena, block
+            if not any(self._arenas.values()):
+                atexit.register(self.unlink)
+            arena = SharedImageArena(shape, self.blocks)
+            arenas.append(arena)
+            return arena, arena.allocate()
+
+    def allocate(self, shape):
+        return self._allocate(tuple(shape))[1]
+
+    def describe(self, image):
+        """(what to send, what to keep alive until the worker is done) for ``image``."""
+        with self._lock:
+            arenas = list(self._arenas.get(image.shape, ()))
+        for arena in arenas:
+            shared = arena.describe(image)
+            if shared is not None:
+                kind = "shared"
+                break
+        else:
+            if image.dtype == np.uint8:
+                arena, block = self._allocate(image.shape)
+                block[...] = image
+                shared, image, kind = arena.describe(block), block, "copied"
+            else:
+                shared, kind = image, "pickled"
+        with self._lock:
+            self._counts[kind] += 1
+        return shared, image
+
+    def unlink(self):
+        with self._lock:
+            arenas = [arena for shape_arenas in self._arenas.values() for arena in shape_arenas]
+        for arena in arenas:
+            arena.unlink()
+
+    def stats(self):
+        with self._lock:
+            arenas = {shape: list(shape_arenas) for shape, shape_arenas in self._arenas.items()}
+            counts = dict(self._counts)
+        return {
+            "blocks_per_arena": self.blocks,
+            "arenas": {"x".join(map(str, shape)): {
+                "arenas": len(shape_arenas),
+                "in_use": sum(arena.in_use() for arena in shape_arenas),
+                "blocks": sum(arena.blocks for arena in shape_arenas),
+                "mb": round(sum(arena.block_bytes * arena.blocks for arena in shape_arenas) / 1e6, 1),
+            } for shape, shape_arenas in arenas.items()},
+            # Images sent in place, copied into a block first, or pickled
+            "images": {kind: counts.get(kind, 0) for kind in ("shared", "copied", "pickled")},
+        }
+
+
+# Per-process worker state: the module whose functions the pool runs, the
+# pool's barrier for broadcasts, and shared-memory segments attached so far by name
+_module = None
+_barrier = None
+_attached = {}
+
+
+def shared_view(image):
+    # The array a SharedArray describes, attached on first use (worker side)
+    if not isinstance(image, SharedArray):
+        return image
+    memory = _attached.get(image.name)
+    if memory is None:
+        # Spawned workers share the API process's resource tracker, which
+        # already tracks the segment, so attaching registers nothing new
+        memory = _attached[image.name] = _Segment(name=image.name)
+    return np.ndarray(image.shape, np.uint8, buffer=memory.buf, offset=image.offset)
+
+
+def _exit_with_parent():
+    # A worker of a killed API process would otherwise wait for tasks forever
+    multiprocessing.parent_process().join()
+    os._exit(0)
+
+
+def _init_worker(family, module, threads, environ, barrier):
+    global _module, _barrier
+    _barrier = barrier
+    threading.Thread(target=_exit_with_parent, name="parent-watch", daemon=True).start()
+    # Before module is imported; thread pools of libraries that spawn loaded
+    # earlier, with the API's main script, are capped by pin_threads
+    os.environ.update(environ)
+    pin_threads(threads)
+    _module = importlib.import_module(module)
+    _module.init_inference_worker(family)
+    # Loading the models may have started thread pools of their own
+    pin_threads(threads)
+
+
+def _run(function, args):
+    with capture_stages() as samples:
+        result = getattr(_module, function)(*args)
+    return result, samples
+
+
+def _broadcast(function, args, timeout):
+    # One of a broadcast's tasks, one per worker: each waits until every worker
+    # holds one, so no worker takes two of them
+    _barrier.wait(timeout)
+    result, samples = _run(function, args)
+    return os.getpid(), result, samples
+
+
+def _ping():
+    return os.getpid()
+
+
+class InferencePool:
+    """Worker processes that serve the models of one family.
+
+    Each of ``processes`` workers is spawned (not forked, so it inherits no
+    thread pools or locks from the API process), sets ``environ``, caps its
+    native thread pools at ``threads`` and imports ``module``, whose
+    ``init_inference_worker(family)`` loads and warms the family's models.
+    call() runs a function of ``module`` in a free worker and returns its
+    result; the stage timings the worker recorded are replayed into this
+    process's metrics. broadcast() runs a function once in every worker, e.g.
+    to reload their models.
+
+    Like OCREngine, at most ``processes + max_queue`` calls are admitted at a
+    time; past that call() raises PoolQueueFull right away. A worker that
+    dies takes the pool down with it, and the next call starts a new one.
+    """
+
+    def __init__(self, family, module, processes=1, threads=1, max_queue=16, timeout_s=60.0, environ=None):
+        self.family = family
+        self.module = module
+        self.processes = max(1, int(processes))
+        self.threads = max(1, int(threads))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout_s = timeout_s
+        self.environ = {name: str(value) for name, value in (environ or {}).items()}
+        self._slots = threading.BoundedSemaphore(self.processes + self.max_queue)
+        self._pool = None
+        self._barrier = None
+        self._start_lock = threading.Lock()
+        self._broadcast_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._restarts = 0
+
+    def start(self):
+        # Create the pool and wait for its workers' models before serving traffic
+        with self._start_lock:
+            if self._pool is None:
+                context = multiprocessing.get_context("spawn")
+                barrier = context.Barrier(self.processes)
+                pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=context, initializer=_init_worker,
+                    initargs=(self.family, self.module, self.threads, self.environ, barrier))
+                try:
+                    # The workers are started by the first submits
+                    futures = [pool.submit(_ping) for _ in range(self.processes)]
+                    pids = {future.result() for future in futures}
+                except Exception:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+                self._pool, self._barrier = pool, barrier
+                logger.info(f"Inference pool {self.family} started: {self.processes} process(es) "
+                            f"of {self.threads} thread(s), pids {sorted(pids)}")
+        return self
+
+    def shutdown(self):
+        with self._start_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _broken(self, pool):
+        # Drop a pool whose worker died; the next call starts a fresh one
+        with self._start_lock:
+            if self._pool is pool:
+                self._pool = None
+                self._restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.error(f"A worker of inference pool {self.family} died, the pool will be restarted")
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise PoolQueueFull(f"{self.family} inference queue is full "
+                                f"({self.processes} processes, {self.max_queue} queued)")
+        with self._stats_lock:
+            self._in_flight += 1
+
+    def _release(self, _future=None):
+        self._slots.release()
+        with self._stats_lock:
+            self._in_flight -= 1
+            self._completed += 1
+
+    def call(self, function, *args, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout_s
+        self._admit()
+        pool = None
+        try:
+            pool = self._pool or self.start()._pool
+            future = pool.submit(_run, function, args)
+        except Exception as e:
+            self._release()
+            if isinstance(e, BrokenProcessPool) and pool is not None:
+                self._broken(pool)
+            raise
+        # As in OCREngine, the slot is freed when the worker finishes
+        future.add_done_callback(self._release)
+        try:
+            result, samples = future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._stats_lock:
+                self._timeouts += 1
+            raise PoolTimeout(f"{self.family} inference did not finish within {timeout:.1f}s")
+        except BrokenProcessPool:
+            self._broken(pool)
+            raise
+        for sample in samples:
+            observe_stage(*sample)
+        return result
+
+    def broadcast(self, function, *args, timeout=None):
+        """Run ``function(*args)`` once in every worker; returns {pid: result}.
+
+        Not admitted like call(): it waits for each worker to finish its
+        current task, up to ``timeout`` (the pool's by default), and raises the
+        first worker's error if any fails.
+        """
+        timeout = timeout if timeout is not None else self.timeout_s
+        # Tasks of two broadcasts must not meet at the barrier
+        with self._broadcast_lock:
+            pool = None
+            while pool is None:
+                self.start()
+                with self._start_lock:
+                    pool, barrier = self._pool, self._barrier
+            futures = []
+            try:
+                futures = [pool.submit(_broadcast, function, args, timeout) for _ in range(self.processes)]
+                results = [future.result() for future in futures]
+            except BrokenProcessPool:
+                self._broken(pool)
+                raise
+            except Exception:
+                # A worker that timed out at the barrier broke it for the others
+                wait(futures)
+                barrier.reset()
+                raise
+        for _, _, samples in results:
+            for sample in samples:
+                observe_stage(*sample)
+        return {pid: result for pid, result, _ in results}
+
+    def queue_depth(self):
+        with self._stats_lock:
+            return max(0, self._in_flight - self.processes)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "processes": self.processes,
+                "threads": self.threads,
+                "max_queue": self.max_queue,
+                "started": self._pool is not None,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.processes),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+                "restarts": self._restarts,
+            }
+
+
+def load_pool_config(path, families):
+    """Serving topology from a JSON file (see plan_pools.py), e.g.::
+
+        {"frontend": {"threads": 1},
+         "pools": {"text": {"processes": 2, "threads": 1},
+                   "yolo": {"processes": 1, "threads": 3, "max_queue": 8, "timeout_s": 60}},
+         "shared_memory_blocks": 32}
+
+    Families missing from "pools" run in the API process as before. No path
+    gives the empty topology. Raises ValueError on unknown families or settings.
+    """
+    if not path:
+        return {"frontend": {}, "pools": {}, "shared_memory_blocks": DEFAULT_SHARED_BLOCKS}
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    unknown = set(config) - {"frontend", "pools", "shared_memory_blocks", "plan"}
+    if unknown:
+        raise ValueError(f"Unknown settings in {path}: {', '.join(sorted(unknown))}")
+    pools = {}
+    for family, settings in (config.get("pools") or {}).items():
+        if family not in families:
+            raise ValueError(f"Unknown model family in {path}: {family} (use {', '.join(families)})")
+        unknown = set(settings) - set(POOL_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown settings of pool {family} in {path}: {', '.join(sorted(unknown))}")
+        pools[family] = dict(POOL_DEFAULTS, **settings)
+        if pools[family]["processes"] < 1 or pools[family]["threads"] < 1:
+            raise ValueError(f"Pool {family} in {path} needs at least one process and one thread")
+    return {
+        "frontend": dict(config.get("frontend") or {}),
+        "pools": pools,
+        "shared_memory_blocks": int(config.get("shared_memory_blocks", DEFAULT_SHARED_BLOCKS)),
+    }
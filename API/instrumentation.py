@@ -0,0 +1,236 @@
+import bisect
+import contextlib
+import logging
+import random
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow OCR
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, labels), value) for labels, value in values]
+
+
+class Histogram:
+    """Bucketed distribution per combination of label values.
+
+    ``observe`` is a lock, a bisect and two additions, so it is cheap enough
+    to call several times per request; buckets are only made cumulative when
+    the metrics are rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts (last one is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        samples = []
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", _labels(self.labelnames, labels, f'le="{_number(bound)}"'),
+                                cumulative))
+            samples.append((f"{self.name}_sum", _labels(self.labelnames, labels), total))
+            samples.append((f"{self.name}_count", _labels(self.labelnames, labels), cumulative))
+        return samples
+
+
+class Callback:
+    """Gauge or counter read at scrape time from ``fn() -> {label values: value}``.
+
+    Used for values other components already keep (queue depths, cache hits),
+    so the request path pays nothing for them.
+    """
+
+    def __init__(self, name, documentation, labelnames, fn, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self):
+        return [(self.name, _labels(self.labelnames, labels), value) for labels, value in sorted(self.fn().items())]
+
+
+class MetricsRegistry:
+    """Metrics of one process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, labelnames, fn, kind="gauge"):
+        return self._add(Callback(name, documentation, labelnames, fn, kind))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # One broken callback must not take the whole scrape down
+                logging.getLogger(__name__).error(f"Metric {metric.name} failed: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "api_stage_seconds", "Time spent in each processing stage (model is set for inference stages)",
+    ("stage", "model"))
+request_seconds = metrics.histogram("api_request_seconds", "Request latency by endpoint", ("endpoint",))
+requests_total = metrics.counter("api_requests_total", "Requests by endpoint and status code", ("endpoint", "status"))
+errors_total = metrics.counter(
+    "api_errors_total", "Failed requests by endpoint (kind is client for 4xx, server for 5xx)", ("endpoint", "kind"))
+
+
+class StageTimer:
+    """Context manager recording the time of its block in api_stage_seconds."""
+
+    __slots__ = ("name", "model", "start")
+
+    def __init__(self, name, model=""):
+        self.name = name
+        self.model = model
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.name, time.perf_counter() - self.start, self.model)
+        return False
+
+
+def stage(name, model=""):
+    return StageTimer(name, model)
+
+
+def observe_stage(name, seconds, model=""):
+    stage_seconds.observe(seconds, name, model)
+    if _captured is not None:
+        _captured.append((name, seconds, model))
+
+
+# Samples being collected by capture_stages(), or None
+_captured = None
+
+
+@contextlib.contextmanager
+def capture_stages():
+    """Collect the stage samples recorded anywhere in this process while the
+    block runs, as (name, seconds, model) tuples.
+
+    For inference worker processes, which run one task at a time: the samples
+    go back with the task's result and are replayed with observe_stage() in
+    the API process, which is the one serving /metrics.
+    """
+    global _captured
+    samples = _captured = []
+    try:
+        yield samples
+    finally:
+        _captured = None
+
+
+def record_request(endpoint, status, seconds):
+    request_seconds.observe(seconds, endpoint)
+    requests_total.inc(endpoint, str(status))
+    if status >= 400:
+        errors_total.inc(endpoint, "client" if status < 500 else "server")
+
+
+class SampledInfoFilter(logging.Filter):
+    """Passes only a ``rate`` fraction of INFO records; other levels all pass.
+
+    Per-request INFO lines are the bulk of the log volume under load, while
+    warnings and errors are rare and always wanted. With ``select``, only
+    the INFO records it accepts are sampled and the others all pass.
+    """
+
+    def __init__(self, rate, select=None):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, float(rate)))
+        self.select = select
+
+    def filter(self, record):
+        if record.levelno != logging.INFO or self.rate >= 1.0:
+            return True
+        if self.select is not None and not self.select(record):
+            return True
+        return random.random() < self.rate
@@ -0,0 +1,378 @@
+import collections
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from result_cache import model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def _rss_bytes():
+    # Resident set size of this process, or None when it cannot be read
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def process_memory(pid="self"):
+    # RSS, PSS and unique (private) set size of a process from smaps_rollup
+    # (Linux only); USS is what one more pre-forked worker really costs
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {
+        "rss_bytes": fields.get("Rss", 0),
+        "pss_bytes": fields.get("Pss", 0),
+        "uss_bytes": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared_bytes": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+class ModelSpec:
+    def __init__(self, name, loader, files=(), group=None):
+        self.name = name
+        self.loader = loader
+        self.files = list(files)
+        self.group = group or name
+
+    def files_version(self):
+        return model_fingerprint(self.files)
+
+
+class LoadedModel:
+    def __init__(self, model, load_s, resident_bytes, version):
+        self.model = model
+        self.load_s = load_s
+        self.resident_bytes = resident_bytes
+        self.version = version
+        self.last_used = time.time()
+        self.uses = 0
+
+
+class ModelRegistry:
+    """Named models loaded on first use and unloaded LRU-first over a memory budget.
+
+    ``register`` only records how to load a model; nothing is imported or read
+    from disk until ``get`` (or ``warmup``) asks for it. Each load is timed and
+    its resident size measured as the RSS growth of the process (falling back
+    to the size of the weight files). When the loaded models exceed
+    ``memory_budget_bytes`` the least recently used ones are dropped; a request
+    that still holds a dropped model keeps using it until it finishes.
+
+    Models that only work together (a vectorizer and the classifiers trained
+    on its features) are registered in one ``group``. A model's version is
+    the fingerprint of its weight files when it was loaded, and a group's
+    version combines its members'. ``reload`` loads a group's new files next
+    to the serving models, runs the group's warmup on them, and swaps the
+    whole group in one step; ``snapshot`` hands a request models of one
+    generation, so requests already running finish on the old version.
+    """
+
+    def __init__(self, memory_budget_bytes=None):
+        self.memory_budget_bytes = memory_budget_bytes or None
+        self._specs = {}
+        self._loaded = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Loads are serialized so RSS deltas are attributed to one model
+        self._load_lock = threading.RLock()
+        self._loads = collections.Counter()
+        self._evictions = collections.Counter()
+        self._warmups = {}
+        # One reload at a time; serving never waits for it
+        self._reload_lock = threading.Lock()
+        self._reloads = collections.Counter()
+        self._reload_errors = {}
+
+    def register(self, name, loader, files=(), group=None):
+        self._specs[name] = ModelSpec(name, loader, files, group)
+
+    def register_warmup(self, group, warmup):
+        # warmup({name: model}) runs a sample input through a reloaded
+        # group (all its members, new ones included) before it serves
+        self._warmups[group] = warmup
+
+    def names(self):
+        return list(self._specs)
+
+    def groups(self):
+        return list(dict.fromkeys(spec.group for spec in self._specs.values()))
+
+    def group_of(self, name):
+        return self._specs[name].group
+
+    def members(self, group):
+        return [name for name, spec in self._specs.items() if spec.group == group]
+
+    def _group_version(self, group):
+        # Caller holds self._lock. Loaded members count with the version they
+        # were loaded from, the others with the files they would load now.
+        versions = []
+        for name in self.members(group):
+            entry = self._loaded.get(name)
+            versions.append((name, entry.version if entry is not None else self._specs[name].files_version()))
+        if len(versions) == 1:
+            return versions[0][1]
+        digest = hashlib.sha1("".join(f"{name}={version};" for name, version in versions).encode("utf-8"))
+        return digest.hexdigest()[:12]
+
+    def version(self, group):
+        # Version of the models of `group` (or of the group of model `group`) that would serve now
+        group = self._specs[group].group if group in self._specs else group
+        with self._lock:
+            return self._group_version(group)
+
+    def snapshot(self, names):
+        """Models ``names`` (all of one group) from a single generation, and its version.
+
+        Missing models are loaded first; the models and the version are then
+        read in one step, so a concurrent swap is either fully seen or not at all.
+        """
+        group = self._specs[names[0]].group
+        for _ in range(3):
+            with self._lock:
+                if all(name in self._loaded for name in names):
+                    models = {}
+                    for name in names:
+                        entry = self._loaded[name]
+                        self._loaded.move_to_end(name)
+                        entry.last_used = time.time()
+                        entry.uses += 1
+                        models[name] = entry.model
+                    return models, self._group_version(group)
+            for name in names:
+                self.get(name)
+        raise RuntimeError(f"Models {', '.join(names)} do not fit in the memory budget together")
+
+    def get_versioned(self, name):
+        # (model, version of its group) for a model that serves on its own
+        models, version = self.snapshot([name])
+        return models[name], version
+
+    def is_loaded(self, name):
+        with self._lock:
+            return name in self._loaded
+
+    def get(self, name):
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                self._loaded.move_to_end(name)
+                entry.last_used = time.time()
+                entry.uses += 1
+                return entry.model
+        return self._load(name)
+
+    def _load(self, name):
+        spec = self._specs.get(name)
+        if spec is None:
+            raise KeyError(f"Unknown model: {name}")
+        with self._load_lock:
+            # Another thread may have loaded it while we waited
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:
+                    self._loaded.move_to_end(name)
+                    entry.uses += 1
+                    return entry.model
+
+            entry = self._load_entry(spec)
+            entry.uses = 1
+            with self._lock:
+                self._loaded[name] = entry
+                self._loads[name] += 1
+                self._enforce_budget(keep=name)
+            return entry.model
+
+    def _load_entry(self, spec):
+        # Caller holds self._load_lock. The version is read before loading, so
+        # files replaced during the load show up as a newer version afterwards.
+        version = spec.files_version()
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            model = spec.loader()
+        except Exception as e:
+            logger.error(f"Failed to load model {spec.name}: {str(e)}")
+            raise
+        load_s = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        if rss_before is not None and rss_after is not None and rss_after > rss_before:
+            resident = rss_after - rss_before
+        else:
+            resident = sum(os.path.getsize(f) for f in spec.files if os.path.exists(f))
+        logger.info(f"Loaded model {spec.name} version {version} in {load_s:.2f}s ({resident / 1e6:.1f} MB)")
+        return LoadedModel(model, load_s, resident, version)
+
+    def stale_groups(self):
+        # {group: version its files are at now} for loaded groups whose files changed
+        with self._lock:
+            loaded = {name: entry.version for name, entry in self._loaded.items()}
+        stale = {}
+        for name, version in loaded.items():
+            spec = self._specs[name]
+            if spec.files_version() != version:
+                stale[spec.group] = model_fingerprint([f for member in self.members(spec.group)
+                                                        for f in self._specs[member].files])
+        return stale
+
+    def reload(self, group):
+        """Load, warm and swap in the current files of a group's loaded models.
+
+        Returns the group's new version, or None when none of its models is
+        loaded (they will load the new files on first use). On any failure
+        the old models keep serving and the error is raised.
+        """
+        with self._reload_lock:
+            names = [name for name in self.members(group) if self.is_loaded(name)]
+            if not names:
+                return None
+            try:
+                with self._load_lock:
+                    entries = {name: self._load_entry(self._specs[name]) for name in names}
+                warmup = self._warmups.get(group)
+                if warmup is not None:
+                    with self._lock:
+                        models = {name: entry.model for name, entry in self._loaded.items()
+                                  if self._specs[name].group == group}
+                    models.update((name, entry.model) for name, entry in entries.items())
+                    start = time.perf_counter()
+                    warmup(models)
+                    logger.info(f"Warmed up {group} in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                self._reload_errors[group] = str(e)
+                logger.error(f"Reload of {group} failed, the current version keeps serving: {str(e)}")
+                raise
+            with self._lock:
+                # Requests that already hold the old models finish with them
+                for name, entry in entries.items():
+                    entry.uses = self._loaded[name].uses if name in self._loaded else 0
+                    self._loaded[name] = entry
+                    self._loads[name] += 1
+                self._enforce_budget(keep=names[0])
+                version = self._group_version(group)
+            self._reloads[group] += 1
+            self._reload_errors.pop(group, None)
+            logger.info(f"Swapped in {group} version {version}")
+            return version
+
+    def _enforce_budget(self, keep):
+        # Caller holds self._lock
+        if not self.memory_budget_bytes:
+            return
+        total = sum(entry.resident_bytes for entry in self._loaded.values())
+        for name in list(self._loaded):
+            if total <= self.memory_budget_bytes:
+                break
+            if name == keep:
+                continue
+            total -= self._loaded.pop(name).resident_bytes
+            self._evictions[name] += 1
+            logger.info(f"Unloaded model {name} to stay within the memory budget")
+        if total > self.memory_budget_bytes:
+            logger.warning(f"Model {keep} alone exceeds the memory budget of {self.memory_budget_bytes / 1e6:.0f} MB")
+
+    def unload(self, name):
+        with self._lock:
+            return self._loaded.pop(name, None) is not None
+
+    def warmup(self, names=None):
+        for name in names if names is not None else self.names():
+            self.get(name)
+
+    def stats(self):
+        with self._lock:
+            models = {}
+            for name in self._specs:
+                entry = self._loaded.get(name)
+                models[name] = {
+                    "loaded": entry is not None,
+                    "loads": self._loads.get(name, 0),
+                    "evictions": self._evictions.get(name, 0),
+                }
+                if entry is not None:
+                    models[name].update({
+                        "version": entry.version,
+                        "load_time_s": round(entry.load_s, 4),
+                        "resident_bytes": entry.resident_bytes,
+                        "uses": entry.uses,
+                        "last_used": entry.last_used,
+                    })
+            resident = sum(entry.resident_bytes for entry in self._loaded.values())
+            groups = {group: {"version": self._group_version(group), "reloads": self._reloads.get(group, 0),
+                              "last_reload_error": self._reload_errors.get(group)}
+                      for group in self.groups()}
+        return {
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "resident_bytes": resident,
+            "models": models,
+            "groups": groups,
+        }
+
+
+class ModelWatcher:
+    """Reloads model groups whose weight files change on disk.
+
+    Polls the files' size and mtime every ``interval_s``. A changed group is
+    reloaded once its files have stayed the same for one more interval, so a
+    file still being copied is never loaded. Files that failed to reload are
+    not tried again until they change (POST /admin/reload still tries them).
+    Started lazily (like MicroBatcher), so it also runs in forked worker
+    processes.
+    """
+
+    def __init__(self, registry, interval_s=10.0):
+        self.registry = registry
+        self.interval_s = interval_s
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._pending = {}
+        self._failed = {}  # group -> files of its last failed reload
+
+    def ensure_started(self):
+        if self.interval_s <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+                self._thread.start()
+
+    def poll(self):
+        # Groups reloaded by this poll
+        stale = self.registry.stale_groups()
+        self._failed = {group: files for group, files in self._failed.items() if stale.get(group) == files}
+        stale = {group: files for group, files in stale.items() if group not in self._failed}
+        ready = [group for group, files in stale.items() if self._pending.get(group) == files]
+        self._pending = {group: files for group, files in stale.items() if group not in ready}
+        reloaded = []
+        for group in ready:
+            try:
+                self.registry.reload(group)
+                reloaded.append(group)
+            except Exception:
+                # Logged by reload; retried once the files change again
+                self._failed[group] = stale[group]
+        return reloaded
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_s)
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Model watcher poll failed: {str(e)}")
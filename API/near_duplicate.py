@@ -0,0 +1,138 @@
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Bits set in every byte value, for Hamming distances of packed hashes
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+HASH_BYTES = 16
+
+
+def image_hash(image):
+    """128-bit perceptual hash of a BGR image: 64-bit pHash then 64-bit dHash.
+
+    pHash keeps the signs of the lowest 8x8 DCT frequencies of a 32x32
+    thumbnail (robust to rescaling, recompression and brightness changes);
+    dHash keeps the signs of horizontal gradients of a 9x8 thumbnail (robust
+    to small shifts). Returned as 16 bytes of packed bits.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    thumb = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(thumb)[:8, :8].reshape(-1)
+    # The DC term is the mean brightness, not structure
+    phash = low > np.median(low[1:])
+    # Shrinking the full image straight to 9x8 is several times slower
+    small = cv2.resize(thumb, (9, 8), interpolation=cv2.INTER_AREA)
+    dhash = (small[:, 1:] > small[:, :-1]).reshape(-1)
+    return np.packbits(np.concatenate([phash, dhash]))
+
+
+class NearDuplicateIndex:
+    """Bounded in-memory map from perceptual hashes to endpoint responses.
+
+    A lookup returns the response stored for the closest image whose pHash
+    and dHash are both within ``max_distance`` bits of the query (0 matches
+    identical hashes only). Hashes live in one packed array so a lookup is a
+    vectorized XOR and popcount over every entry. The least recently matched
+    entry is evicted once ``max_entries`` are stored, and everything is
+    dropped when the model version changes.
+
+    The inference time of each stored response is kept, so a hit reports
+    the time it saved.
+    """
+
+    def __init__(self, max_entries=512, max_distance=4):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.version = None
+        self._hashes = np.zeros((max_entries, HASH_BYTES), dtype=np.uint8)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._entries = [None] * max_entries  # (response, inference seconds) per slot
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._forced = 0
+        self._saved_seconds = 0.0
+        self._distances = collections.Counter()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_distance >= 0
+
+    def _check_version(self, version):
+        # Responses of an older model must not be served
+        if version != self.version:
+            self._size = 0
+            self._entries = [None] * self.max_entries
+            self.version = version
+
+    def _nearest(self, image_hash):
+        # (slot, distance) of the closest stored hash; the distance of two
+        # hashes is the larger of their pHash and dHash Hamming distances
+        if not self._size:
+            return None, None
+        bits = POPCOUNT[self._hashes[:self._size] ^ image_hash]
+        distances = np.maximum(bits[:, :HASH_BYTES // 2].sum(axis=1, dtype=np.int32),
+                               bits[:, HASH_BYTES // 2:].sum(axis=1, dtype=np.int32))
+        nearest = int(np.argmin(distances))
+        return nearest, int(distances[nearest])
+
+    def lookup(self, image_hash, version):
+        # Stored response of the nearest image within max_distance, or None
+        with self._lock:
+            self._check_version(version)
+            nearest, distance = self._nearest(image_hash)
+            if nearest is None or distance > self.max_distance:
+                self._misses += 1
+                return None
+            response, seconds = self._entries[nearest]
+            self._last_used[nearest] = time.monotonic()
+            self._hits += 1
+            self._saved_seconds += seconds
+            self._distances[distance] += 1
+            return response
+
+    def add(self, image_hash, version, response, seconds):
+        # Store a response and the inference time it took; a fresh result
+        # replaces the entry it would have matched
+        with self._lock:
+            self._check_version(version)
+            nearest, distance = self._nearest(image_hash)
+            if nearest is not None and distance <= self.max_distance:
+                slot = nearest
+            elif self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._hashes[slot] = image_hash
+            self._last_used[slot] = time.monotonic()
+            self._entries[slot] = (response, seconds)
+
+    def record_forced(self):
+        with self._lock:
+            self._forced += 1
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._entries = [None] * self.max_entries
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "hits": self._hits,
+                "misses": self._misses,
+                "forced": self._forced,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self._saved_seconds, 3),
+                "hit_distances": {str(d): n for d, n in sorted(self._distances.items())},
+            }
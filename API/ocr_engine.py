@@ -0,0 +1,300 @@
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+from inference_pool import pin_threads
+
+logger = logging.getLogger(__name__)
+
+# Tesseract language codes, optionally combined with '+' (e.g. "eng+fil")
+LANG_PATTERN = re.compile(r"^[A-Za-z_]+(\+[A-Za-z_]+)*$")
+# Valid Tesseract page segmentation modes
+PSM_RANGE = range(0, 14)
+
+
+class OCRQueueFull(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class OCRTimeout(Exception):
+    """Raised when a request does not get its text back in time."""
+
+
+def preprocess_for_ocr(image):
+    # Convert image to grayscale for better OCR accuracy
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # Apply thresholding to enhance text visibility
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+
+# Per-process worker state: warm tesserocr API handles keyed by (lang, psm)
+_tess_apis = {}
+_tesserocr = None
+_worker_timeout = None
+
+
+def _init_worker(lang, psm, timeout_s, threads):
+    global _tesserocr, _worker_timeout
+    _worker_timeout = timeout_s
+    if threads:
+        # Tesseract's OpenMP threads and OpenCV's, per worker
+        pin_threads(threads)
+    try:
+        import tesserocr
+        _tesserocr = tesserocr
+        _tess_api(lang, psm)
+    except ImportError:
+        # pytesseract fallback: one tesseract subprocess per call
+        _tesserocr = None
+
+
+def _tess_api(lang, psm):
+    key = (lang, psm)
+    api = _tess_apis.get(key)
+    if api is None:
+        api = _tesserocr.PyTessBaseAPI(lang=lang)
+        if psm is not None:
+            api.SetPageSegMode(psm)
+        _tess_apis[key] = api
+    return api
+
+
+def _run_ocr(image, lang, psm):
+    thresh = preprocess_for_ocr(image)
+    if _tesserocr is not None:
+        # C-API path: reuse the worker's loaded Tesseract instead of starting a process
+        api = _tess_api(lang, psm)
+        height, width = thresh.shape
+        api.SetImageBytes(thresh.tobytes(), width, height, 1, width)
+        # Bounded like pytesseract's subprocess, so a page Tesseract hangs on
+        # gives its worker (and admission slot) back
+        if _worker_timeout and not api.Recognize(int(_worker_timeout * 1000)):
+            api.Clear()
+            raise RuntimeError(f"Tesseract did not finish within {_worker_timeout:.1f}s")
+        text = api.GetUTF8Text()
+        api.Clear()
+        return text
+
+    import pytesseract
+    config = f"--psm {psm}" if psm is not None else ""
+    return pytesseract.image_to_string(thresh, lang=lang, config=config, timeout=_worker_timeout or 0)
+
+
+def _ping():
+    return os.getpid()
+
+
+class OCREngine:
+    """Bounded pool of OCR worker processes.
+
+    Each worker keeps a warm Tesseract instance (tesserocr when installed,
+    pytesseract otherwise), so OCR never runs on the request thread and never
+    holds the GIL of the API process. Workers are spawned, not forked: the
+    pool may start (or restart) from a request thread of a multithreaded
+    server. Each call is limited to ``timeout_s`` inside the worker as well. At most ``workers + max_queue`` requests
+    are admitted at a time; past that ``run`` raises OCRQueueFull right away
+    so the caller can answer 503 instead of queueing without bound.
+    ``threads`` (0: the libraries' defaults) caps each worker's native thread
+    pools, as in inference_pool.pin_threads(). If a worker dies (a Tesseract
+    crash, the OOM killer), the requests it took down fail and the next one
+    starts a fresh pool.
+    """
+
+    def __init__(self, workers=2, max_queue=8, timeout_s=30.0, lang="eng", psm=None, threads=0):
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout_s = timeout_s
+        self.threads = max(0, int(threads))
+        self.lang = lang
+        self.psm = psm
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._pool = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._restarts = 0
+
+    def start(self):
+        # Create the pool and bring every worker up before serving traffic
+        with self._start_lock:
+            if self._pool is None:
+                pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.lang, self.psm, self.timeout_s, self.threads))
+                try:
+                    warmups = [pool.submit(_ping) for _ in range(self.workers)]
+                    for future in warmups:
+                        future.result()
+                except Exception:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+                self._pool = pool
+                logger.info(f"OCR engine started with {self.workers} worker process(es)")
+        return self
+
+    def shutdown(self):
+        with self._start_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _broken(self, pool):
+        # Drop a pool whose worker died; the next request starts a fresh one
+        with self._start_lock:
+            if self._pool is pool:
+                self._pool = None
+                self._restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.error("An OCR worker died, the OCR engine will be restarted")
+
+    def validate_options(self, lang=None, psm=None):
+        # Returns (lang, psm) with deployment defaults filled in; raises ValueError on bad input
+        lang = lang or self.lang
+        if not LANG_PATTERN.match(lang):
+            raise ValueError(f"Invalid OCR language: {lang}")
+        if psm is None or psm == "":
+            psm = self.psm
+        else:
+            psm = int(psm)
+            if psm not in PSM_RANGE:
+                raise ValueError(f"Invalid page segmentation mode: {psm}")
+        return lang, psm
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise OCRQueueFull(f"OCR queue is full ({self.workers} workers, {self.max_queue} queued)")
+        with self._stats_lock:
+            self._in_flight += 1
+
+    def _release(self, _future=None):
+        self._slots.release()
+        with self._stats_lock:
+            self._in_flight -= 1
+            self._completed += 1
+
+    def _timed_out(self, timeout):
+        with self._stats_lock:
+            self._timeouts += 1
+        return OCRTimeout(f"OCR did not finish within {timeout:.1f}s")
+
+    def run(self, image, lang=None, psm=None, timeout=None):
+        lang, psm = self.validate_options(lang, psm)
+        timeout = timeout if timeout is not None else self.timeout_s
+        self._admit()
+        pool = None
+        try:
+            pool = self._pool or self.start()._pool
+            future = pool.submit(_run_ocr, image, lang, psm)
+        except Exception as e:
+            self._release()
+            if isinstance(e, BrokenProcessPool) and pool is not None:
+                self._broken(pool)
+            raise
+        # The slot is freed when the worker finishes, not when the caller gives
+        # up, so a timed-out request still counts against the queue until then
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise self._timed_out(timeout)
+        except BrokenProcessPool:
+            self._broken(pool)
+            raise
+
+    def run_many(self, images, lang=None, psm=None, timeout=None):
+        # OCR several crops of one request in parallel across the workers; the
+        # request takes a single admission slot however many crops it has
+        lang, psm = self.validate_options(lang, psm)
+        timeout = timeout if timeout is not None else self.timeout_s
+        if not images:
+            return []
+        self._admit()
+        remaining = [len(images)]
+        remaining_lock = threading.Lock()
+
+        def crop_done(_future):
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._release()
+
+        futures = []
+        pool = None
+        try:
+            pool = self._pool or self.start()._pool
+            for image in images:
+                futures.append(pool.submit(_run_ocr, image, lang, psm))
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and pool is not None:
+                self._broken(pool)
+            for future in futures:
+                future.cancel()
+            with remaining_lock:
+                remaining[0] = len(futures)
+            if not futures:
+                self._release()
+            for future in futures:
+                future.add_done_callback(crop_done)
+            raise
+        for future in futures:
+            future.add_done_callback(crop_done)
+
+        done, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            raise self._timed_out(timeout)
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            self._broken(pool)
+            raise
+
+    def queue_depth(self):
+        with self._stats_lock:
+            return max(0, self._in_flight - self.workers)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "workers": self.workers,
+                "threads": self.threads,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.workers),
+                "completed": self._completed,
+                "restarts": self._restarts,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+            }
+
+
+def engine_from_env(**overrides):
+    # Settings from OCR_* variables; `overrides` (e.g. an inference pool
+    # config's "ocr" entry) take precedence
+    psm = os.environ.get("OCR_PSM")
+    settings = {
+        "workers": int(os.environ.get("OCR_WORKERS", str(min(4, os.cpu_count() or 1)))),
+        "max_queue": int(os.environ.get("OCR_MAX_QUEUE", "16")),
+        "timeout_s": float(os.environ.get("OCR_TIMEOUT_S", "30")),
+        "lang": os.environ.get("OCR_LANG", "eng"),
+        "psm": int(psm) if psm else None,
+        "threads": int(os.environ.get("OCR_THREADS", "0")),
+    }
+    settings.update(overrides)
+    return OCREngine(**settings)
@@ -0,0 +1,121 @@
+import cv2
+import numpy as np
+
+# Long side of the copy used to look for text; proposals are cheap at this size
+PROPOSAL_MAX_SIDE = 1280
+# Long side of the image that crops are cut from; 12MP photos are downscaled to this first
+OCR_MAX_SIDE = 2400
+# Crops shorter than this are upscaled, since Tesseract misses small glyphs
+MIN_CROP_HEIGHT = 24
+
+
+def _downscale(image, max_side):
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / float(max(height, width)))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return image, scale
+
+
+def propose_text_regions(image, max_side=PROPOSAL_MAX_SIDE, max_regions=64):
+    # Morphological text detector: strong local gradients closed horizontally
+    # into word/line blobs. Returns (x, y, w, h) boxes in the coordinates of `image`.
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small, scale = _downscale(gray, max_side)
+    height, width = small.shape
+
+    grad = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    bw = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    kernel_width = max(9, width // 80)
+    connected = cv2.morphologyEx(bw, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_width, 1)))
+    contours = cv2.findContours(connected, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # Skip specks, thin rules and blobs too large to be a text line
+        if h < 8 or w < 12 or h > height * 0.5 or w < h * 0.8:
+            continue
+        if cv2.countNonZero(bw[y:y + h, x:x + w]) < 0.15 * w * h:
+            continue
+        pad = max(2, h // 4)
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(width, x + w + pad), min(height, y + h + pad)
+        boxes.append((x0 / scale, y0 / scale, (x1 - x0) / scale, (y1 - y0) / scale))
+
+    # Largest regions first when there are too many, then reading order
+    boxes.sort(key=lambda b: b[2] * b[3], reverse=True)
+    boxes = [tuple(int(round(v)) for v in box) for box in boxes[:max_regions]]
+    return merge_words(reading_order(boxes))
+
+
+def reading_order(boxes):
+    # Group boxes into lines by vertical overlap, then sort lines top to bottom
+    # and boxes left to right; returns a flat list with a line number per box
+    lines = []
+    for box in sorted(boxes, key=lambda b: b[1] + b[3] / 2.0):
+        center = box[1] + box[3] / 2.0
+        for line in lines:
+            if abs(center - line['center']) <= 0.5 * min(box[3], line['height']):
+                line['boxes'].append(box)
+                break
+        else:
+            lines.append({'center': center, 'height': box[3], 'boxes': [box]})
+    ordered = []
+    for line_no, line in enumerate(lines):
+        for box in sorted(line['boxes'], key=lambda b: b[0]):
+            ordered.append((line_no, box))
+    return ordered
+
+
+def merge_words(regions, max_gap=1.5):
+    # Join neighbouring boxes on the same line (gap under max_gap x height) so
+    # each crop is a run of words rather than a single word
+    merged = []
+    for line_no, (x, y, w, h) in regions:
+        if merged and merged[-1][0] == line_no:
+            mx, my, mw, mh = merged[-1][1]
+            if x - (mx + mw) <= max_gap * max(h, mh):
+                x0, y0 = min(mx, x), min(my, y)
+                x1, y1 = max(mx + mw, x + w), max(my + mh, y + h)
+                merged[-1] = (line_no, (x0, y0, x1 - x0, y1 - y0))
+                continue
+        merged.append((line_no, (x, y, w, h)))
+    return merged
+
+
+def crop_regions(image, regions, ocr_max_side=OCR_MAX_SIDE):
+    # Cut crops for OCR from a copy capped at ocr_max_side (downscale-first for huge inputs)
+    working, scale = _downscale(image, ocr_max_side)
+    crops = []
+    for _, (x, y, w, h) in regions:
+        x0, y0 = int(x * scale), int(y * scale)
+        x1, y1 = int(np.ceil((x + w) * scale)), int(np.ceil((y + h) * scale))
+        crop = working[y0:y1, x0:x1]
+        if crop.shape[0] < MIN_CROP_HEIGHT:
+            factor = MIN_CROP_HEIGHT / float(max(1, crop.shape[0]))
+            crop = cv2.resize(crop, None, fx=factor, fy=factor, interpolation=cv2.INTER_CUBIC)
+        crops.append(np.ascontiguousarray(crop))
+    return crops
+
+
+def rescale_boxes(boxes, image, size):
+    # Boxes found in `image` in the pixels of the same picture at `size`
+    # (width, height), e.g. the full-size upload a reduced decode came from
+    height, width = image.shape[:2]
+    if size is None or tuple(size) == (width, height):
+        return boxes
+    scale_x, scale_y = size[0] / float(width), size[1] / float(height)
+    return [(int(round(x * scale_x)), int(round(y * scale_y)), int(round(w * scale_x)), int(round(h * scale_y)))
+            for x, y, w, h in boxes]
+
+
+def assemble_text(regions, texts):
+    # Join region texts: spaces within a line, newlines between lines
+    lines = {}
+    for (line_no, _), text in zip(regions, texts):
+        text = text.strip()
+        if text:
+            lines.setdefault(line_no, []).append(text)
+    return "\n".join(" ".join(parts) for _, parts in sorted(lines.items()))
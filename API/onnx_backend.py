@@ -0,0 +1,112 @@
+import json
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+# Inference backends a model can be served with: the original sklearn/XGBoost
+# pickle or ultralytics .pt, its ONNX export, or the int8-quantized export
+BACKENDS = ("native", "onnx", "onnx-int8")
+# Rows densified per onnxruntime call for exports that take dense input
+ONNX_MAX_ROWS = 64
+# Export metadata: leading columns fed as COO triplets (the TF-IDF block)
+SPARSE_COLUMNS = "sparse_columns"
+# Export metadata: JSON list of the only feature columns the graph reads
+INPUT_COLUMNS = "input_columns"
+# Export metadata: absent sparse entries are missing values (NaN), not 0
+ZERO_AS_MISSING = "zero_as_missing"
+
+
+def onnx_path(path, backend):
+    # model_weights/SVM.pkl -> model_weights/SVM.onnx (or SVM.int8.onnx)
+    stem = os.path.splitext(path)[0]
+    return f"{stem}.int8.onnx" if backend == "onnx-int8" else f"{stem}.onnx"
+
+
+def backends_from_env(names):
+    # MODEL_BACKEND sets the default for every model and MODEL_BACKENDS
+    # overrides single models, e.g. "SVM=onnx,yolo=onnx-int8"
+    default = os.environ.get("MODEL_BACKEND", "native")
+    backends = {name: default for name in names}
+    for entry in os.environ.get("MODEL_BACKENDS", "").split(","):
+        if not entry.strip():
+            continue
+        name, _, backend = entry.partition("=")
+        name, backend = name.strip(), backend.strip()
+        if name not in backends:
+            raise ValueError(f"Unknown model in MODEL_BACKENDS: {name}")
+        backends[name] = backend
+    invalid = {backend for backend in backends.values() if backend not in BACKENDS}
+    if invalid:
+        raise ValueError(f"Unknown model backend: {', '.join(sorted(invalid))}")
+    return backends
+
+
+def inference_session(path, threads=None):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    threads = int(os.environ.get("ONNX_THREADS", "0")) if threads is None else threads
+    if threads:
+        options.intra_op_num_threads = threads
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+class OnnxClassifier:
+    """ONNX Runtime stand-in for a fitted sklearn/XGBoost text classifier.
+
+    Exposes the ``predict`` the API calls on the native models, taking the
+    same sparse feature rows. How rows are fed depends on the export's
+    metadata (see export_onnx.py): linear models take the TF-IDF block as COO
+    triplets plus the remaining columns dense; tree models take a dense
+    matrix of just the columns they split on, with NaN for absent entries
+    when flagged ``zero_as_missing``.
+    """
+
+    def __init__(self, path, threads=None):
+        self.path = path
+        self.session = inference_session(path, threads)
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.sparse_columns = int(metadata[SPARSE_COLUMNS]) if SPARSE_COLUMNS in metadata else None
+        self.input_columns = np.array(json.loads(metadata[INPUT_COLUMNS])) if INPUT_COLUMNS in metadata else None
+        self.fill_value = np.nan if metadata.get(ZERO_AS_MISSING) == "1" else 0.0
+
+    def _sparse_feed(self, features):
+        features = csr_matrix(features)
+        rows = np.repeat(np.arange(features.shape[0], dtype=np.int64), np.diff(features.indptr))
+        in_block = features.indices < self.sparse_columns
+        other = np.zeros((features.shape[0], features.shape[1] - self.sparse_columns), dtype=np.float32)
+        other[rows[~in_block], features.indices[~in_block] - self.sparse_columns] = features.data[~in_block]
+        return {
+            "rows": rows[in_block],
+            "columns": features.indices[in_block].astype(np.int64),
+            "values": features.data[in_block].astype(np.float32),
+            "other": other,
+        }
+
+    def _dense(self, chunk):
+        if self.input_columns is not None:
+            chunk = chunk[:, self.input_columns]
+        if not issparse(chunk):
+            return np.asarray(chunk, dtype=np.float32)
+        coo = chunk.tocoo()
+        dense = np.full(coo.shape, self.fill_value, dtype=np.float32)
+        dense[coo.row, coo.col] = coo.data
+        return dense
+
+    def _run(self, features, output):
+        if self.sparse_columns is not None:
+            return self.session.run(None, self._sparse_feed(features))[output]
+        name = self.session.get_inputs()[0].name
+        outputs = []
+        for start in range(0, features.shape[0], ONNX_MAX_ROWS):
+            chunk = self._dense(features[start:start + ONNX_MAX_ROWS])
+            outputs.append(self.session.run(None, {name: chunk})[output])
+        return np.concatenate(outputs)
+
+    def predict(self, features):
+        return self._run(features, 0)
+
+    def decision_scores(self, features):
+        # Second graph output: class probabilities for XGBoost, decision scores for the linear models
+        return self._run(features, 1)
@@ -0,0 +1,126 @@
+# Size the inference pools of INFERENCE_POOLS_CONFIG from measured demand:
+# reads the api_stage_seconds totals of a running server's /metrics (or a
+# saved scrape), adds them up per model family, and splits the CPU cores
+# between the families and the front end in proportion, at least one core
+# each. Writes the pool config JSON that allAPI.py loads.
+# Run from the repository root, after the server has seen typical traffic:
+#   python API/plan_pools.py --metrics http://localhost:5000/metrics --cores 8 --output pools.json
+# --since takes an earlier scrape, so only the traffic in between counts.
+import argparse
+import json
+import math
+import os
+import re
+import sys
+from urllib.request import urlopen
+
+TEXT_MODEL_NAMES = ["Logistic_Regression", "Naive_Bayes", "SVM", "XGBoost"]
+# Stages that stay in the API process (decode, letterbox, perceptual hash,
+# JSON encoding). "upload" is left out: it is mostly waiting on the client.
+FRONTEND_STAGES = ("decode", "resize", "hash", "serialize")
+SAMPLE = re.compile(r'^api_stage_seconds_sum\{stage="([^"]*)",model="([^"]*)"\}\s+(\S+)$')
+# PyTorch spreads one batch over a few intra-op threads well, so YOLO pools get
+# processes of up to this many threads; text models and Tesseract get
+# single-thread processes, each working on its own request
+YOLO_THREADS_PER_PROCESS = 4
+
+
+def read_metrics(source):
+    if re.match(r"^https?://", source):
+        with urlopen(source, timeout=10) as response:
+            return response.read().decode("utf-8")
+    with open(source, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def family_of(stage, model):
+    if stage in FRONTEND_STAGES:
+        return "frontend"
+    if stage == "features" or model in TEXT_MODEL_NAMES:
+        return "text"
+    if stage == "inference" and model in ("yolo", "wound"):
+        return model
+    if stage == "tesseract":
+        return "ocr"
+    return None
+
+
+def stage_seconds(text):
+    # Seconds spent per family, from api_stage_seconds_sum samples
+    seconds = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line.strip())
+        if match:
+            family = family_of(match.group(1), match.group(2))
+            if family is not None:
+                seconds[family] = seconds.get(family, 0.0) + float(match.group(3))
+    return seconds
+
+
+def split_cores(demand, cores):
+    # Cores per family, at least one each, the rest by largest remainder of
+    # each family's share of the demand
+    cores_left = cores - len(demand)
+    total = sum(demand.values())
+    quotas = {family: cores_left * seconds / total if total else 0.0 for family, seconds in demand.items()}
+    split = {family: 1 + int(quota) for family, quota in quotas.items()}
+    by_remainder = sorted(quotas, key=lambda family: quotas[family] - int(quotas[family]), reverse=True)
+    for family in by_remainder[:max(0, cores - sum(split.values()))]:
+        split[family] += 1
+    return split
+
+
+def pool_settings(family, cores):
+    if family in ("yolo", "wound"):
+        processes = math.ceil(cores / YOLO_THREADS_PER_PROCESS)
+        return {"processes": processes, "threads": max(1, cores // processes), "max_queue": 2 * processes}
+    return {"processes": cores, "threads": 1, "max_queue": 4 * cores}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metrics', required=True, help='/metrics URL of a running server, or a saved scrape')
+    parser.add_argument('--since', help='earlier scrape to subtract, so only the traffic in between counts')
+    parser.add_argument('--cores', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--families', default='text,yolo,wound,ocr',
+                        help='model families that get a pool when they have demand')
+    parser.add_argument('--output', help='write the config here instead of printing it')
+    args = parser.parse_args()
+
+    seconds = stage_seconds(read_metrics(args.metrics))
+    if args.since:
+        for family, earlier in stage_seconds(read_metrics(args.since)).items():
+            seconds[family] = seconds.get(family, 0.0) - earlier
+    families = [name.strip() for name in args.families.split(",") if name.strip()]
+    demand = {family: max(0.0, seconds.get(family, 0.0)) for family in ["frontend"] + families
+              if family == "frontend" or seconds.get(family, 0.0) > 0}
+    if len(demand) == 1:
+        sys.exit("No inference time in the metrics yet; send the server some traffic first")
+    if args.cores < len(demand):
+        print(f"Only {args.cores} cores for {len(demand)} pools; every pool still gets one", file=sys.stderr)
+
+    split = split_cores(demand, max(args.cores, len(demand)))
+    total = sum(demand.values())
+    config = {
+        "frontend": {"threads": split["frontend"]},
+        "pools": {family: pool_settings(family, split[family]) for family in demand if family != "frontend"},
+        "plan": {
+            "cores": args.cores,
+            "demand_seconds": {family: round(value, 3) for family, value in demand.items()},
+            "demand_share": {family: round(value / total, 3) if total else 0.0 for family, value in demand.items()},
+            "cores_per_family": split,
+        },
+    }
+    for family, value in demand.items():
+        print(f"{family:<9} {value:10.1f} s  {value / total if total else 0.0:6.1%}  -> {split[family]} core(s)",
+              file=sys.stderr)
+    text = json.dumps(config, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def model_fingerprint(paths, extra=""):
+    # Short version string for a set of weight files: changes whenever any
+    # file is replaced (size or mtime), so cached results never outlive a model
+    h = hashlib.sha1(extra.encode("utf-8"))
+    for path in paths:
+        try:
+            st = os.stat(path)
+            h.update(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+        except OSError:
+            h.update(f"{os.path.basename(path)}:missing;".encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+class CacheBackend:
+    """Storage interface for ResultCache: opaque string keys to bytes values."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU bounded by entry count and total bytes, with optional TTL."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl_s=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries = collections.OrderedDict()  # key -> (value, expires_at)
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl_s if self.ttl_s else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes,
+                    "evictions": self._evictions}
+
+
+class SQLiteBackend(CacheBackend):
+    """LRU cache in a local SQLite file, shared by every worker process on the host."""
+
+    def __init__(self, path, max_entries=10000, max_bytes=256 * 1024 * 1024, ttl_s=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._local = threading.local()
+        self._evictions = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " expires_at REAL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS result_cache_lru ON result_cache (last_access)")
+
+    def _connect(self):
+        # One connection per thread (and per process: connections are not fork-safe)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM result_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE result_cache SET last_access = ? WHERE key = ?", (now, key))
+        return bytes(value)
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        conn = self._connect()
+        now = time.time()
+        expires_at = now + self.ttl_s if self.ttl_s else None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), expires_at, now),
+            )
+            conn.execute("DELETE FROM result_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn):
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM result_cache").fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk from least recently used until both bounds hold
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM result_cache ORDER BY last_access"):
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            entries -= 1
+            total -= size
+        conn.executemany("DELETE FROM result_cache WHERE key = ?", victims)
+        self._evictions += len(victims)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM result_cache")
+
+    def stats(self):
+        entries, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM result_cache").fetchone()
+        return {"backend": "sqlite", "path": self.path, "entries": entries, "bytes": total,
+                "evictions": self._evictions}
+
+
+class ResultCache:
+    """Content-addressed cache of JSON endpoint responses.
+
+    Keys hash the endpoint, the model version and the raw request payload, so
+    a retried upload is served without running the model again while a model
+    update naturally misses.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._hits = collections.Counter()
+        self._misses = collections.Counter()
+        self._errors = 0
+
+    @staticmethod
+    def make_key(endpoint, payload, version):
+        h = hashlib.sha256()
+        h.update(endpoint.encode("utf-8") + b"\0" + version.encode("utf-8") + b"\0")
+        h.update(payload)
+        return h.hexdigest()
+
+    def get(self, endpoint, key):
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never fail the request
+            logger.error(f"Result cache lookup failed: {str(e)}")
+            value = None
+            with self._lock:
+                self._errors += 1
+        with self._lock:
+            if value is None:
+                self._misses[endpoint] += 1
+            else:
+                self._hits[endpoint] += 1
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, result):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, json.dumps(result, separators=(",", ":")).encode("utf-8"))
+        except Exception as e:
+            logger.error(f"Result cache store failed: {str(e)}")
+            with self._lock:
+                self._errors += 1
+
+    def stats(self):
+        with self._lock:
+            hits, misses = dict(self._hits), dict(self._misses)
+            errors = self._errors
+        total_hits, total_misses = sum(hits.values()), sum(misses.values())
+        lookups = total_hits + total_misses
+        stats = {
+            "enabled": self.backend is not None,
+            "hits": total_hits,
+            "misses": total_misses,
+            "hit_rate": total_hits / lookups if lookups else 0.0,
+            "errors": errors,
+            "by_endpoint": {endpoint: {"hits": hits.get(endpoint, 0), "misses": misses.get(endpoint, 0)}
+                            for endpoint in sorted(set(hits) | set(misses))},
+        }
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+
+def cache_from_env():
+    # RESULT_CACHE_BACKEND: memory (default), sqlite or none
+    kind = os.environ.get("RESULT_CACHE_BACKEND", "memory").lower()
+    max_entries = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1024"))
+    max_bytes = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    ttl_s = float(os.environ.get("RESULT_CACHE_TTL_S", "0")) or None
+    if kind == "none":
+        backend = None
+    elif kind == "sqlite":
+        backend = SQLiteBackend(os.environ.get("RESULT_CACHE_PATH", "result_cache.sqlite3"),
+                                max_entries=max_entries, max_bytes=max_bytes, ttl_s=ttl_s)
+    elif kind == "memory":
+        backend = MemoryBackend(max_entries=max_entries, max_bytes=max_bytes, ttl_s=ttl_s)
+    else:
+        raise ValueError(f"Unknown RESULT_CACHE_BACKEND: {kind}")
+    return ResultCache(backend)
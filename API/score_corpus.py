@@ -0,0 +1,331 @@
+# Offline bulk credibility scoring of a JSONL or CSV corpus with the /predict
+# models, without going through HTTP. The input is streamed in fixed-size
+# chunks, each chunk is vectorized into one sparse matrix and scored in a pool
+# of worker processes, and results are appended to the output in input order.
+# After every written chunk a checkpoint records how far input and output got,
+# so an interrupted run picks up where it stopped when started again.
+# Run from the repository root:
+#   python API/score_corpus.py articles.jsonl scores.jsonl --workers 4
+#   python API/score_corpus.py archive.csv scores.csv --id-field url --models SVM,XGBoost
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from features import FeatureAssembler
+from onnx_backend import BACKENDS, OnnxClassifier, onnx_path
+
+TEXT_MODEL_NAMES = ["Logistic_Regression", "Naive_Bayes", "SVM", "XGBoost"]
+# csv's default 128 KiB field limit is smaller than some articles
+CSV_FIELD_LIMIT = 2 ** 31 - 1
+
+
+def credibility_label(pred):
+    return 'Not Credible' if pred == 1 else 'Credible'
+
+
+class CorpusScorer:
+    """Feature assembler and text models of one worker process."""
+
+    def __init__(self, weights_dir, model_names, backend="native"):
+        import joblib
+        self.assembler = FeatureAssembler(joblib.load(os.path.join(weights_dir, "content_vectorizer.pkl")),
+                                          joblib.load(os.path.join(weights_dir, "brand_columns.pkl")))
+        self.models = {}
+        for name in model_names:
+            path = os.path.join(weights_dir, f"{name}.pkl")
+            if backend == "native":
+                model = joblib.load(path)
+                # Parallelism comes from the process pool; one thread per worker
+                if hasattr(model, "n_jobs"):
+                    model.set_params(n_jobs=1)
+            else:
+                model = OnnxClassifier(onnx_path(path, backend), threads=1)
+            self.models[name] = model
+
+    def predict(self, features):
+        # {model: [label per row]}; a model failing on the whole matrix is
+        # retried row by row so one bad article cannot fail the chunk
+        labels = {}
+        for name, model in self.models.items():
+            try:
+                labels[name] = [credibility_label(pred) for pred in model.predict(features)]
+            except Exception:
+                labels[name] = []
+                for row in range(features.shape[0]):
+                    try:
+                        labels[name].append(credibility_label(model.predict(features[row])[0]))
+                    except Exception as e:
+                        labels[name].append(f'Error: {str(e)}')
+        return labels
+
+    def score(self, first_row, records, fields):
+        """Output dicts for one chunk of input records, in order.
+
+        Each has ``row`` (0-based position in the input), ``id`` when an id
+        field is set, and either ``predictions`` and ``verdict`` (the label a
+        majority of the models agree on, or None) or ``error``.
+        """
+        content_field, brand_field, id_field = fields
+        results, valid, contents, brands = [], [], [], []
+        for offset, record in enumerate(records):
+            result = {"row": first_row + offset}
+            if id_field:
+                result["id"] = record.get(id_field) if isinstance(record, dict) else None
+            results.append(result)
+            content = record.get(content_field) if isinstance(record, dict) else None
+            if not content or not isinstance(content, str):
+                result["error"] = "Content is required"
+                continue
+            brand = record.get(brand_field)
+            valid.append(result)
+            contents.append(content)
+            brands.append(str(brand) if brand not in (None, "") else "Unknown")
+        if not valid:
+            return results
+
+        labels = self.predict(self.assembler.transform(contents, brands))
+        quorum = len(self.models) // 2 + 1
+        for i, result in enumerate(valid):
+            predictions = {name: labels[name][i] for name in self.models}
+            votes = collections.Counter(label for label in predictions.values() if not label.startswith("Error"))
+            label, count = votes.most_common(1)[0] if votes else (None, 0)
+            result["predictions"] = predictions
+            result["verdict"] = label if count >= quorum else None
+        return results
+
+
+# Scorer of the current worker process, set by the pool initializer
+_scorer = None
+
+
+def _init_worker(weights_dir, model_names, backend):
+    global _scorer
+    _scorer = CorpusScorer(weights_dir, model_names, backend)
+
+
+def _score_chunk(first_row, records, fields):
+    return _scorer.score(first_row, records, fields)
+
+
+def input_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith((".csv", ".csv.txt")) else "jsonl"
+
+
+class OffsetLines:
+    """Lines of a binary file from ``offset``, decoded, counting the bytes read.
+
+    ``offset`` is always the end of the last line handed out, so it is a safe
+    place to resume from once the record that line ends has been written.
+    """
+
+    def __init__(self, f, offset):
+        self.f = f
+        self.offset = offset
+        f.seek(offset)
+
+    def __iter__(self):
+        for line in self.f:
+            self.offset += len(line)
+            yield line.decode("utf-8")
+
+
+def read_records(path, fmt, offset):
+    """Yield ``(end offset, record)`` from byte ``offset`` of a JSONL or CSV file.
+
+    CSV files are read with their header line, so resuming from the middle of
+    one still maps columns to names. Lines that are not valid JSON are yielded
+    as None and scored as errors, keeping rows aligned with the input.
+    """
+    with open(path, "rb") as f:
+        if fmt == "csv":
+            csv.field_size_limit(CSV_FIELD_LIMIT)
+            header_lines = OffsetLines(f, 0)
+            header = next(csv.reader(header_lines), None)
+            if header is None:
+                return
+            lines = OffsetLines(f, max(offset, header_lines.offset))
+            for row in csv.reader(lines):
+                yield lines.offset, dict(zip(header, row))
+        else:
+            lines = OffsetLines(f, offset)
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield lines.offset, record
+
+
+def chunked(records, size):
+    # Lists of at most `size` records, with the input offset after the last one
+    chunk, end = [], None
+    for end, record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield end, chunk
+            chunk = []
+    if chunk:
+        yield end, chunk
+
+
+class ResultWriter:
+    """Appends scored records to a JSONL or CSV file and tracks its size."""
+
+    def __init__(self, path, model_names, id_field, offset):
+        self.csv = input_format(path) == "csv"
+        self.columns = ["row"] + (["id"] if id_field else []) + list(model_names) + ["verdict", "error"]
+        mode = "r+b" if os.path.exists(path) else "wb"
+        self.f = open(path, mode)
+        # Drop whatever was written after the last checkpoint
+        self.f.truncate(offset)
+        self.f.seek(offset)
+        if self.csv and offset == 0:
+            self.write_csv([self.columns])
+
+    def write_csv(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        self.f.write(buffer.getvalue().encode("utf-8"))
+
+    def write(self, results):
+        if self.csv:
+            rows = []
+            for result in results:
+                fields = dict(result.get("predictions", {}), **result)
+                rows.append(["" if fields.get(column) is None else fields[column] for column in self.columns])
+            self.write_csv(rows)
+        else:
+            self.f.write("".join(json.dumps(result) + "\n" for result in results).encode("utf-8"))
+
+    def flush(self):
+        # Data must be on disk before a checkpoint points past it
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+
+def load_checkpoint(path, settings):
+    # Only a run with the same input, output, models, backend and id field
+    # may resume: anything else would append rows that do not match
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    for key, value in settings.items():
+        if checkpoint.get(key) != value:
+            raise SystemExit(f"{path} was written with {key} {checkpoint.get(key)!r}, not {value!r}; "
+                             f"use --restart")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    # Written to a temporary file and renamed, so a crash leaves either the old
+    # checkpoint or the new one, never half of one
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="JSONL (one JSON object per line) or CSV file with a header line")
+    parser.add_argument("output", help="results file; .csv for CSV, anything else for JSONL")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: from the extension)")
+    parser.add_argument("--content-field", default="content")
+    parser.add_argument("--brand-field", default="brand")
+    parser.add_argument("--id-field", help="input field copied to the output to identify each article")
+    parser.add_argument("--models", default=",".join(TEXT_MODEL_NAMES), help="comma-separated text models")
+    parser.add_argument("--backend", choices=BACKENDS, default=os.environ.get("MODEL_BACKEND", "native"))
+    parser.add_argument("--weights", default="model_weights", help="directory with the vectorizer and models")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=2000, help="articles vectorized and scored together")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and start over")
+    parser.add_argument("--progress-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    model_names = [name.strip() for name in args.models.split(",") if name.strip()]
+    unknown = set(model_names) - set(TEXT_MODEL_NAMES)
+    if unknown or not model_names:
+        parser.error(f"--models must name some of {', '.join(TEXT_MODEL_NAMES)}")
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    settings = {"input": os.path.abspath(args.input), "output": os.path.abspath(args.output),
+                "models": model_names, "backend": args.backend, "id_field": args.id_field}
+    checkpoint = None if args.restart else load_checkpoint(checkpoint_path, settings)
+    if checkpoint is None:
+        checkpoint = dict(settings, input_offset=0, rows=0, output_offset=0, errors=0)
+    elif checkpoint.get("done"):
+        print(f"{args.input} was already scored into {args.output} ({checkpoint['rows']} articles)")
+        return
+    else:
+        print(f"Resuming after {checkpoint['rows']} articles (byte {checkpoint['input_offset']} of the input)")
+
+    fmt = input_format(args.input, args.format)
+    fields = (args.content_field, args.brand_field, args.id_field)
+    writer = ResultWriter(args.output, model_names, args.id_field, checkpoint["output_offset"])
+    # Chunks in flight are bounded so memory stays flat however large the input is
+    max_pending = 2 * args.workers
+    pending = collections.deque()
+    start = last_report = time.perf_counter()
+    scored = last_scored = 0
+
+    def write_next():
+        nonlocal scored, last_report, last_scored
+        future, end_offset = pending.popleft()
+        results = future.result()
+        writer.write(results)
+        checkpoint.update(input_offset=end_offset, output_offset=writer.flush(),
+                          rows=checkpoint["rows"] + len(results),
+                          errors=checkpoint["errors"] + sum(1 for result in results if "error" in result))
+        save_checkpoint(checkpoint_path, checkpoint)
+        scored += len(results)
+        now = time.perf_counter()
+        if now - last_report >= args.progress_every:
+            print(f"{checkpoint['rows']} articles, {(scored - last_scored) / (now - last_report):.0f} articles/s "
+                  f"(run average {scored / (now - start):.0f})", flush=True)
+            last_report, last_scored = now, scored
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.weights, model_names, args.backend)) as pool:
+            next_row = checkpoint["rows"]
+            for end_offset, records in chunked(read_records(args.input, fmt, checkpoint["input_offset"]),
+                                               args.chunk_size):
+                pending.append((pool.submit(_score_chunk, next_row, records, fields), end_offset))
+                next_row += len(records)
+                while len(pending) >= max_pending:
+                    write_next()
+            while pending:
+                write_next()
+        checkpoint["done"] = True
+        save_checkpoint(checkpoint_path, checkpoint)
+    except KeyboardInterrupt:
+        print(f"Interrupted after {checkpoint['rows']} articles; run the same command again to resume",
+              file=sys.stderr)
+        sys.exit(130)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} articles in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.0f} articles/s), "
+          f"{checkpoint['rows']} in total with {checkpoint['errors']} errors, into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Preload-then-fork server for allAPI.py: models are loaded once in the master,
+# their weights are memory-mapped, and N worker processes are forked from it so
+# every worker shares the same model pages instead of holding its own copy.
+# Each worker has pools of its own: an OCR engine of OCR_WORKERS spawned
+# Tesseract processes, started right after the fork and before it serves,
+# plus the threads allAPI.py starts on first use (YOLO batchers, /predict
+# ensemble, /analyze tasks, model watcher). Workers * OCR_WORKERS Tesseract
+# processes run in total. POSIX only. Run from the repository root:
+#   python API/serve_prefork.py --workers 4 --port 5000
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger("serve_prefork")
+
+
+def serve_worker(allAPI, sock, host):
+    from werkzeug.serving import make_server
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Before any request thread exists, rather than lazily from one
+    if "ocr" in allAPI.ENABLED_ENDPOINTS:
+        allAPI.ocr_engine.start()
+    server = make_server(host, sock.getsockname()[1], allAPI.app, threaded=True, fd=sock.fileno())
+    logger.info(f"Worker {os.getpid()} serving")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--mode', choices=('mmap', 'preload', 'independent'), default='mmap',
+                        help='mmap: preload and memory-map weights (default); preload: preload only; '
+                             'independent: every worker loads its own models, for comparison')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        sys.exit("serve_prefork.py needs os.fork(); use allAPI.py on this platform")
+
+    import allAPI
+    from result_cache import model_fingerprint
+    from shared_weights import share_registry
+
+    if allAPI.inference_pools:
+        # Every forked worker would start a full set of pools of its own
+        sys.exit("INFERENCE_POOLS_CONFIG already runs the models in worker processes; "
+                 "serve it with a single front-end process (asgiAPI.py)")
+
+    # Load every enabled model in the master. Nothing is run through the
+    # models here, so no BLAS/OpenMP thread pools exist yet when we fork.
+    if args.mode != 'independent':
+        allAPI.warmup_models()
+        # Unloading a shared model in one worker would replace it with a private copy
+        allAPI.model_registry.memory_budget_bytes = None
+    if args.mode == 'mmap':
+        files = sorted(os.path.join('model_weights', f) for f in os.listdir('model_weights') if not f.startswith('.'))
+        directory = os.path.join('model_weights', '.shared', model_fingerprint(files))
+        total = share_registry(allAPI.model_registry, directory)
+        logger.info(f"Memory-mapped {total / 1e6:.1f} MB of model weights from {directory}")
+
+    # Keep the garbage collector from touching (and so un-sharing) preloaded objects
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve_worker(allAPI, sock, args.host)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        spawn()
+    logger.info(f"Master {os.getpid()} serving on {args.host}:{args.port} with {args.workers} worker(s)")
+
+    # Replace workers that die until asked to stop
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, restarting")
+            time.sleep(0.5)
+            spawn()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import logging
+import os
+from collections.abc import Mapping
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+logger = logging.getLogger(__name__)
+
+# Arrays smaller than this stay on the heap; mapping them is not worth a file
+MIN_SHARED_BYTES = 64 * 1024
+# Terms up to this many UTF-8 bytes go in the fixed-width sorted array; the few
+# longer ones are kept in a small dict
+VOCAB_TERM_WIDTH = 24
+
+
+def mmap_array(array, path):
+    # Write `array` to `path` once (atomically, so concurrent processes agree)
+    # and return a copy-on-write memory map of it. Pages come from the page
+    # cache and are shared by every process that maps the same file.
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+            # Written-back pages are mapped clean; unflushed ones show up as
+            # private dirty memory in every process that maps them
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    mapped = np.load(path, mmap_mode="c")
+    # Fault every page in now, before forking, so workers map resident pages
+    if mapped.nbytes:
+        int(mapped.reshape(-1).view(np.uint8)[::4096].sum())
+    return mapped
+
+
+class SortedVocabulary(Mapping):
+    """Read-only term -> column mapping backed by sorted numpy arrays.
+
+    Drop-in replacement for ``TfidfVectorizer.vocabulary_``: a dict of 100k+
+    str/int objects gets its refcounts touched on every lookup, which
+    un-shares its pages in forked workers, while these arrays can be memory
+    mapped and stay shared.
+    """
+
+    def __init__(self, terms, columns, overflow, width=VOCAB_TERM_WIDTH):
+        self.terms = terms          # sorted UTF-8 terms, dtype S<width>
+        self.columns = columns      # column index of terms[i]
+        self.overflow = overflow    # terms longer than width bytes
+        self.width = width
+
+    @classmethod
+    def from_dict(cls, vocabulary, width=VOCAB_TERM_WIDTH):
+        short = sorted((term.encode("utf-8"), column) for term, column in vocabulary.items()
+                       if len(term.encode("utf-8")) <= width)
+        overflow = {term: column for term, column in vocabulary.items() if len(term.encode("utf-8")) > width}
+        terms = np.array([term for term, _ in short], dtype=f"S{width}")
+        columns = np.array([column for _, column in short], dtype=np.int32)
+        return cls(terms, columns, overflow, width)
+
+    def __getitem__(self, term):
+        key = term.encode("utf-8")
+        if len(key) > self.width:
+            return self.overflow[term]
+        i = int(np.searchsorted(self.terms, key))
+        if i < len(self.terms) and self.terms[i] == key:
+            return int(self.columns[i])
+        raise KeyError(term)
+
+    def lookup(self, terms):
+        # Columns of many terms at once, -1 where absent: one searchsorted
+        # over the distinct terms instead of one per occurrence
+        distinct = list(dict.fromkeys(terms))
+        keys = [term.encode("utf-8") for term in distinct]
+        columns = np.full(len(keys), -1, dtype=np.int64)
+        if keys and len(self.terms):
+            # Keys longer than width are truncated here and resolved from overflow below
+            packed = np.array(keys, dtype=self.terms.dtype)
+            positions = np.minimum(np.searchsorted(self.terms, packed), len(self.terms) - 1)
+            found = self.terms[positions] == packed
+            columns[found] = self.columns[positions[found]]
+        for i, key in enumerate(keys):
+            if len(key) > self.width:
+                columns[i] = self.overflow.get(distinct[i], -1)
+        by_term = dict(zip(distinct, columns.tolist()))
+        return np.fromiter(map(by_term.__getitem__, terms), dtype=np.int64, count=len(terms))
+
+    def __contains__(self, term):
+        try:
+            self[term]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for term in self.terms:
+            yield term.decode("utf-8")
+        yield from self.overflow
+
+    def __len__(self):
+        return len(self.terms) + len(self.overflow)
+
+
+def share_vocabulary(vectorizer, directory, prefix):
+    # Swap the vectorizer's vocabulary dict for memory-mapped sorted arrays
+    vocab = vectorizer.vocabulary_
+    if not isinstance(vocab, SortedVocabulary):
+        vocab = SortedVocabulary.from_dict(vocab)
+    vectorizer.vocabulary_ = SortedVocabulary(
+        mmap_array(vocab.terms, os.path.join(directory, f"{prefix}.vocab_terms.npy")),
+        mmap_array(vocab.columns, os.path.join(directory, f"{prefix}.vocab_columns.npy")),
+        vocab.overflow, vocab.width)
+
+
+def share_estimator(estimator, directory, prefix):
+    # Memory-map every large ndarray / CSR attribute of a fitted estimator
+    # (coef_, feature_log_prob_, support_vectors_, idf_, ...)
+    shared = 0
+    for attr, value in list(vars(estimator).items()):
+        if isinstance(value, np.memmap):
+            continue
+        if isinstance(value, np.ndarray) and value.dtype != object and value.nbytes >= MIN_SHARED_BYTES:
+            setattr(estimator, attr, mmap_array(value, os.path.join(directory, f"{prefix}.{attr}.npy")))
+            shared += value.nbytes
+        elif issparse(value) and value.format == "csr" and value.data.nbytes >= MIN_SHARED_BYTES:
+            parts = [mmap_array(getattr(value, part), os.path.join(directory, f"{prefix}.{attr}.{part}.npy"))
+                     for part in ("data", "indices", "indptr")]
+            setattr(estimator, attr, csr_matrix(tuple(parts), shape=value.shape, copy=False))
+            shared += value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    return shared
+
+
+def share_torch_module(module, directory, prefix):
+    # Point every large parameter at a memory-mapped copy of its weights
+    import torch
+    shared = 0
+    with torch.no_grad():
+        for name, param in module.named_parameters():
+            array = param.detach().cpu().numpy()
+            if array.nbytes < MIN_SHARED_BYTES:
+                continue
+            param.data = torch.from_numpy(mmap_array(array, os.path.join(directory, f"{prefix}.{name}.npy")))
+            shared += array.nbytes
+    return shared
+
+
+def share_model(name, model, directory):
+    # Dispatch on the kinds of objects the API registry holds; returns bytes mapped
+    os.makedirs(directory, exist_ok=True)
+    if hasattr(model, "vectorizer"):
+        # FeatureAssembler: vocabulary plus idf_ of the TF-IDF transformer
+        share_vocabulary(model.vectorizer, directory, name)
+        return share_estimator(model.vectorizer._tfidf, directory, f"{name}.tfidf")
+    if hasattr(model, "fuse") and hasattr(model, "model") and hasattr(model.model, "named_parameters"):
+        # ultralytics YOLO: fuse Conv+BN now so workers never rewrite the weights
+        model.fuse()
+        return share_torch_module(model.model, directory, name)
+    if hasattr(model, "predict") and hasattr(model, "__dict__"):
+        # sklearn estimators; XGBoost keeps its trees in a native booster and is left as is
+        return share_estimator(model, directory, name)
+    return 0
+
+
+def share_registry(registry, directory):
+    # Memory-map the weights of every model loaded in the registry
+    total = 0
+    for name in registry.names():
+        if registry.is_loaded(name):
+            shared = share_model(name, registry.get(name), directory)
+            logger.info(f"Memory-mapped {shared / 1e6:.1f} MB of {name} weights")
+            total += shared
+    return total
@@ -0,0 +1,177 @@
+import os
+
+import numpy as np
+
+# Input sides a request may ask for; multiples of the models' 32-pixel stride
+IMAGE_SIZES = (320, 480, 640)
+
+# Form or query fields that adjust a request's profile
+REQUEST_FIELDS = ("profile", "imgsz", "conf", "nms_iou", "max_det", "classes")
+
+
+class YoloProfile:
+    """Settings of a YOLO call: input side, confidence threshold, NMS IoU
+    threshold, most detections kept, class filter and half precision.
+
+    ``classes`` holds class indices (None: every class). Profiles compare and
+    hash by their settings, so requests with the same settings share a
+    micro-batch and cache entries.
+    """
+
+    def __init__(self, imgsz=640, conf=0.25, iou=0.7, max_det=300, classes=None, half=False):
+        if imgsz % 32 or not 32 <= imgsz <= 1280:
+            raise ValueError(f"Invalid imgsz: {imgsz} (a multiple of 32 up to 1280)")
+        if not 0.0 <= conf <= 1.0:
+            raise ValueError(f"Invalid conf: {conf} (0 to 1)")
+        if not 0.0 < iou <= 1.0:
+            raise ValueError(f"Invalid nms_iou: {iou} (above 0, at most 1)")
+        if max_det < 1:
+            raise ValueError(f"Invalid max_det: {max_det}")
+        self.imgsz = int(imgsz)
+        self.conf = float(conf)
+        self.iou = float(iou)
+        self.max_det = int(max_det)
+        self.classes = tuple(sorted(set(classes))) if classes is not None else None
+        self.half = bool(half)
+
+    def replace(self, **changes):
+        settings = {"imgsz": self.imgsz, "conf": self.conf, "iou": self.iou, "max_det": self.max_det,
+                    "classes": self.classes, "half": self.half}
+        settings.update(changes)
+        return YoloProfile(**settings)
+
+    @property
+    def key(self):
+        classes = ",".join(map(str, self.classes)) if self.classes is not None else "all"
+        return (f"imgsz={self.imgsz};conf={self.conf:g};iou={self.iou:g};max_det={self.max_det};"
+                f"classes={classes};half={int(self.half)}")
+
+    def __eq__(self, other):
+        return isinstance(other, YoloProfile) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"YoloProfile({self.key})"
+
+    def predict_kwargs(self):
+        # Arguments of an ultralytics predict call. The image is already
+        # letterboxed to imgsz, so passing it keeps ultralytics from resizing
+        # it to its default 640 again.
+        return {"imgsz": self.imgsz, "conf": self.conf, "iou": self.iou, "max_det": self.max_det,
+                "classes": list(self.classes) if self.classes is not None else None,
+                "half": self.half, "verbose": False}
+
+
+PROFILES = {
+    # A quarter of the pixels of 640, fewer and surer boxes
+    "fast": YoloProfile(320, conf=0.35, max_det=50),
+    "balanced": YoloProfile(480, conf=0.3, max_det=100),
+    # Ultralytics' own defaults
+    "accurate": YoloProfile(640),
+}
+
+
+def profiles_from_env(names):
+    # YOLO_PROFILE sets the profile of every model and YOLO_PROFILES overrides
+    # single models, e.g. "wound=fast". YOLO_IMAGE_SIZE, if set, replaces their
+    # input side, and YOLO_HALF=1 asks for half precision (used on GPU only).
+    default = os.environ.get("YOLO_PROFILE", "accurate")
+    chosen = {name: default for name in names}
+    for entry in os.environ.get("YOLO_PROFILES", "").split(","):
+        if not entry.strip():
+            continue
+        name, _, profile = entry.partition("=")
+        if name.strip() not in chosen:
+            raise ValueError(f"Unknown model in YOLO_PROFILES: {name.strip()}")
+        chosen[name.strip()] = profile.strip()
+    unknown = {profile for profile in chosen.values() if profile not in PROFILES}
+    if unknown:
+        raise ValueError(f"Unknown YOLO profile: {', '.join(sorted(unknown))}")
+    changes = {"half": os.environ.get("YOLO_HALF", "0") == "1"}
+    if os.environ.get("YOLO_IMAGE_SIZE"):
+        changes["imgsz"] = int(os.environ["YOLO_IMAGE_SIZE"])
+    return {name: PROFILES[profile].replace(**changes) for name, profile in chosen.items()}
+
+
+def request_profile(base, fields, class_indices=None):
+    """Profile of one request: ``base`` (the deployment's), or the named
+    ``profile`` field, with single settings sent in ``fields`` on top.
+
+    ``classes`` is a comma-separated list of class names, resolved with
+    ``class_indices()`` (name -> index; None where a class filter is not
+    supported). Raises ValueError on invalid fields.
+    """
+    name = fields.get("profile")
+    profile = base
+    if name:
+        if name not in PROFILES:
+            raise ValueError(f"Unknown profile: {name} (use {', '.join(PROFILES)})")
+        profile = PROFILES[name].replace(half=base.half)
+    changes = {}
+    for field, setting, cast in (("imgsz", "imgsz", int), ("conf", "conf", float), ("nms_iou", "iou", float),
+                                 ("max_det", "max_det", int)):
+        value = fields.get(field)
+        if value is None or value == "":
+            continue
+        try:
+            changes[setting] = cast(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {field}: {value}")
+    if "imgsz" in changes and changes["imgsz"] not in IMAGE_SIZES:
+        raise ValueError(f"Invalid imgsz: {changes['imgsz']} (use {', '.join(map(str, IMAGE_SIZES))})")
+    requested = fields.get("classes")
+    if requested:
+        if class_indices is None:
+            raise ValueError("classes is not supported on this endpoint")
+        indices = class_indices()
+        wanted = [c.strip() for c in requested.split(",") if c.strip()]
+        if not wanted:
+            # An empty filter would hide every detection
+            raise ValueError(f"Invalid classes: {requested!r} (use comma-separated class names)")
+        unknown = [c for c in wanted if c not in indices]
+        if unknown:
+            raise ValueError(f"Unknown classes: {', '.join(unknown)}")
+        changes["classes"] = [indices[c] for c in wanted]
+    return profile.replace(**changes) if changes else profile
+
+
+def detected_classes(result):
+    # Class index of every detection of an ultralytics result, read from the
+    # boxes' cls tensor in one step instead of one tensor access per box
+    classes = result.boxes.cls
+    if hasattr(classes, "cpu"):
+        classes = classes.cpu().numpy()
+    return np.asarray(classes).astype(np.int64)
+
+
+def label_array(names):
+    # A model's class names ({index: name}) as an array indexable by class indices
+    return np.array([names[i] for i in range(len(names))], dtype=object)
+
+
+class Detections:
+    """What the endpoints read from an ultralytics result (``names`` and the
+    boxes' ``cls`` and ``xyxy``) as numpy arrays, so it pickles small and
+    without the input image, for results sent back by inference workers."""
+
+    class Boxes:
+        def __init__(self, cls, xyxy):
+            self.cls = cls
+            self.xyxy = xyxy
+
+        def __len__(self):
+            return len(self.cls)
+
+    def __init__(self, names, cls, xyxy):
+        self.names = names
+        self.boxes = Detections.Boxes(cls, xyxy)
+
+    @classmethod
+    def from_result(cls, result):
+        xyxy = result.boxes.xyxy
+        if hasattr(xyxy, "cpu"):
+            xyxy = xyxy.cpu().numpy()
+        return cls(dict(result.names), detected_classes(result),
+                   np.asarray(xyxy, dtype=np.float32).reshape(-1, 4))
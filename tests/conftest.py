@@ -0,0 +1,16 @@
+# Tests import the API modules the way allAPI.py does, from API/, and read
+# the shipped model weights from model_weights/ at the repository root
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(REPO_DIR, "API")
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+
+@pytest.fixture(scope="session")
+def model_path():
+    return lambda name: os.path.join(REPO_DIR, "model_weights", name)
@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import (AdmissionController, AdmissionRejected, current_deadline, parse_deadline, set_deadline,
+                       timeout_for, with_deadline)
+
+
+def queue_requests(controller, names, order):
+    # One thread per name, queued in this order; each records its turn and
+    # releases its slot right away
+    threads = []
+    for name in names:
+        def run(name=name):
+            controller.enter(name)
+            order.append(name)
+            controller.release(name)
+        waiting = controller.waiting(name)
+        thread = threading.Thread(target=run)
+        thread.start()
+        while controller.waiting(name) == waiting:
+            time.sleep(0.001)
+        threads.append(thread)
+    return threads
+
+
+def test_queues_served_in_proportion_to_weights():
+    controller = AdmissionController({"wound": 8, "process_image": 8}, weights={"wound": 4}, max_in_flight=1)
+    controller.enter("wound")
+    order = []
+    threads = queue_requests(controller, ["process_image"] * 8 + ["wound"] * 8, order)
+    controller.release("wound")
+    for thread in threads:
+        thread.join(5)
+    assert sorted(order) == sorted(["process_image"] * 8 + ["wound"] * 8)
+    # Four wound slots for each process_image one while both wait, and the
+    # lighter queue is not starved
+    first = order[:10]
+    assert first.count("wound") == 8 and first.count("process_image") == 2
+    assert "process_image" in order[:5]
+
+
+def test_queue_is_first_in_first_out():
+    controller = AdmissionController({"predict": 1})
+    controller.enter("predict")
+    order = []
+    threads = []
+    for i in range(5):
+        def run(i=i):
+            controller.enter("predict")
+            order.append(i)
+            controller.release("predict")
+        threads.append(threading.Thread(target=run))
+        threads[-1].start()
+        while controller.waiting("predict") < i + 1:
+            time.sleep(0.001)
+    controller.release("predict")
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_full_queue_answers_429_with_retry_after():
+    controller = AdmissionController({"ocr": 1}, max_queue=1)
+    controller.enter("ocr")
+    controller.release("ocr", seconds=2.5)
+    controller.enter("ocr")
+    threads = queue_requests(controller, ["ocr"], [])
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enter("ocr")
+    assert rejected.value.status == 429
+    # Two requests ahead (the queued one and this one) at 2.5 s each
+    assert rejected.value.retry_after == 5
+    assert rejected.value.response()[2] == {"Retry-After": "5"}
+    controller.release("ocr")
+    threads[0].join(5)
+    assert controller.rejected() == {("ocr", "queue_full"): 1}
+
+
+def test_deadline_before_estimated_turn_answers_503():
+    controller = AdmissionController({"wound": 1})
+    controller.enter("wound")
+    controller.release("wound", seconds=1.0)
+    controller.enter("wound")
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enter("wound", deadline=time.monotonic() + 0.5)
+    assert rejected.value.status == 503 and rejected.value.retry_after == 1
+    # Shed right away rather than after waiting
+    assert time.monotonic() - start < 0.1
+    assert controller.waiting("wound") == 0
+
+
+def test_expired_deadline_answers_504_without_retry_after():
+    controller = AdmissionController({"predict": 4})
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enter("predict", deadline=time.monotonic() - 0.001)
+    assert rejected.value.status == 504 and rejected.value.retry_after is None
+    assert len(rejected.value.response()) == 2
+    assert controller.in_flight("predict") == 0
+
+
+def test_deadline_passing_in_queue_answers_504():
+    controller = AdmissionController({"predict": 1})
+    controller.enter("predict")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enter("predict", deadline=time.monotonic() + 0.05)
+    assert rejected.value.status == 504
+    assert controller.waiting("predict") == 0
+
+
+def test_queue_timeout_answers_503():
+    controller = AdmissionController({"predict": 1}, queue_timeout_s=0.05)
+    controller.enter("predict")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enter("predict")
+    assert rejected.value.status == 503 and rejected.value.retry_after >= 1
+    assert controller.waiting("predict") == 0
+    # The slot is still the first request's, and frees normally
+    controller.release("predict")
+    controller.enter("predict")
+
+
+def test_total_in_flight_limit_is_shared():
+    controller = AdmissionController({"predict": 2, "ocr": 2}, max_in_flight=2, queue_timeout_s=0.05)
+    controller.enter("predict")
+    controller.enter("ocr")
+    with pytest.raises(AdmissionRejected):
+        controller.enter("predict")
+    controller.release("ocr")
+    controller.enter("predict")
+    assert controller.stats()["in_flight"] == 2
+
+
+def test_cancelled_async_wait_keeps_no_slot():
+    controller = AdmissionController({"analyze": 1})
+
+    async def scenario():
+        controller.enter("analyze")
+        waiting = asyncio.ensure_future(controller.enter_async("analyze"))
+        await asyncio.sleep(0.01)
+        assert controller.waiting("analyze") == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        controller.release("analyze")
+        await controller.enter_async("analyze")
+
+    asyncio.run(scenario())
+    assert controller.in_flight("analyze") == 1 and controller.waiting("analyze") == 0
+
+
+def test_parse_deadline():
+    assert parse_deadline("250", now=10.0) == pytest.approx(10.25)
+    assert parse_deadline("-5", now=10.0) == 10.0
+    for value in (None, "", "soon", "nan", "inf"):
+        assert parse_deadline(value) is None
+
+
+def test_with_deadline_carries_the_deadline_to_another_thread():
+    deadline = time.monotonic() + 1.0
+    seen = []
+
+    def task():
+        seen.append((current_deadline(), timeout_for(30.0)))
+
+    thread = threading.Thread(target=with_deadline(deadline, task))
+    thread.start()
+    thread.join()
+    carried, timeout = seen[0]
+    assert carried == deadline and 0.0 < timeout <= 1.0
+    # The wrapper restores the worker thread's own deadline afterwards
+    set_deadline(None)
+    with_deadline(deadline, lambda: None)()
+    assert current_deadline() is None
+    assert timeout_for(30.0) == 30.0 and timeout_for(None) is None
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+import batching
+from batching import MicroBatcher
+
+
+class Recorder:
+    # run_batch that records every batch and can hold the worker until released
+    def __init__(self, hold=False):
+        self.batches = []
+        self.running = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.running.set()
+        self.release.wait(5)
+        return [item * 10 for item in items]
+
+
+def test_requests_queued_together_share_a_batch():
+    run_batch = Recorder(hold=True)
+    batcher = MicroBatcher("yolo", run_batch, max_batch_size=4, max_wait_ms=50)
+    first = batcher.submit(0)
+    run_batch.running.wait(5)
+    futures = [batcher.submit(i) for i in range(1, 7)]
+    run_batch.release.set()
+    assert first.result(5) == 0
+    assert [future.result(5) for future in futures] == [10, 20, 30, 40, 50, 60]
+    assert run_batch.batches == [[0], [1, 2, 3, 4], [5, 6]]
+    stats = batcher.stats()
+    assert stats["batches"] == 3 and stats["items"] == 7
+    assert stats["batch_size_distribution"] == {"1": 1, "2": 1, "4": 1}
+
+
+def test_window_closes_after_max_wait():
+    run_batch = Recorder()
+    batcher = MicroBatcher("yolo", run_batch, max_batch_size=8, max_wait_ms=20)
+    first = batcher.submit(1)
+    time.sleep(0.2)
+    second = batcher.submit(2)
+    assert (first.result(5), second.result(5)) == (10, 20)
+    assert run_batch.batches == [[1], [2]]
+
+
+def test_expired_request_fails_without_taking_a_place():
+    run_batch = Recorder(hold=True)
+    batcher = MicroBatcher("wound", run_batch, max_batch_size=4, max_wait_ms=0)
+    batcher.submit(0)
+    run_batch.running.wait(5)
+    expired = batcher.submit(1, deadline=time.monotonic() + 0.01)
+    live = batcher.submit(2, deadline=time.monotonic() + 5.0)
+    time.sleep(0.05)
+    run_batch.release.set()
+    with pytest.raises(TimeoutError):
+        expired.result(5)
+    assert live.result(5) == 20
+    assert run_batch.batches == [[0], [2]]
+    assert batcher.stats()["expired"] == 1
+
+
+def test_call_waits_no_longer_than_the_deadline():
+    run_batch = Recorder(hold=True)
+    batcher = MicroBatcher("wound", run_batch)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        batcher(1, timeout=30.0, deadline=time.monotonic() + 0.05)
+    assert time.monotonic() - start < 1.0
+    # And the plain timeout still applies when it is the shorter one
+    with pytest.raises(TimeoutError):
+        batcher(2, timeout=0.05, deadline=time.monotonic() + 30.0)
+    run_batch.release.set()
+
+
+def test_deadline_is_compared_on_the_monotonic_clock(monkeypatch):
+    # Queue timing uses perf_counter and deadlines use monotonic; a
+    # perf_counter far from monotonic must not make a live request look expired
+    perf_counter = time.perf_counter
+    monkeypatch.setattr(batching.time, "perf_counter", lambda: perf_counter() + 1e6)
+    run_batch = Recorder()
+    batcher = MicroBatcher("wound", run_batch, max_wait_ms=10)
+    assert batcher(3, deadline=time.monotonic() + 5.0) == 30
+    assert batcher.stats()["expired"] == 0
+    assert batcher.stats()["queue_wait_ms"]["max"] < 1000.0
+
+
+def test_batch_failure_reaches_every_request():
+    def run_batch(items):
+        raise ValueError("model failed")
+
+    batcher = MicroBatcher("ocr", run_batch, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(5)
+    assert batcher.stats()["errors"] >= 1
+
+
+def test_wrong_number_of_results_is_an_error():
+    batcher = MicroBatcher("ocr", lambda items: items[:-1], max_wait_ms=0)
+    with pytest.raises(RuntimeError, match="returned 0 results for 1 inputs"):
+        batcher(1, timeout=5)
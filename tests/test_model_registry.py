@@ -0,0 +1,82 @@
+import pytest
+
+from model_registry import ModelWatcher
+
+
+class FakeRegistry:
+    # Just what ModelWatcher uses: the stale groups and a reload that can fail
+    def __init__(self):
+        self.stale = {}
+        self.failing = set()
+        self.reloads = []
+
+    def stale_groups(self):
+        return dict(self.stale)
+
+    def reload(self, group):
+        self.reloads.append(group)
+        if group in self.failing:
+            raise RuntimeError(f"{group} weights are truncated")
+        return self.stale.pop(group)
+
+
+@pytest.fixture
+def watched():
+    registry = FakeRegistry()
+    return registry, ModelWatcher(registry, interval_s=0)
+
+
+def test_reloads_once_files_stop_changing(watched):
+    registry, watcher = watched
+    registry.stale["yolo"] = "v2-partial"
+    assert watcher.poll() == []
+    registry.stale["yolo"] = "v2"
+    assert watcher.poll() == []
+    assert watcher.poll() == ["yolo"]
+    assert registry.reloads == ["yolo"]
+
+
+def test_failed_files_are_not_retried_until_they_change(watched):
+    registry, watcher = watched
+    registry.stale["yolo"] = "broken"
+    registry.failing.add("yolo")
+    watcher.poll()
+    assert watcher.poll() == []
+    assert registry.reloads == ["yolo"] and watcher._failed == {"yolo": "broken"}
+    for _ in range(3):
+        assert watcher.poll() == []
+    assert registry.reloads == ["yolo"]
+
+    # New files are loaded once they have settled
+    registry.failing.clear()
+    registry.stale["yolo"] = "fixed"
+    assert watcher.poll() == []
+    assert watcher._failed == {}
+    assert watcher.poll() == ["yolo"]
+    assert registry.reloads == ["yolo", "yolo"]
+
+
+def test_failure_is_forgotten_once_the_group_is_no_longer_stale(watched):
+    registry, watcher = watched
+    registry.stale["ocr"] = "broken"
+    registry.failing.add("ocr")
+    watcher.poll()
+    watcher.poll()
+    assert "ocr" in watcher._failed
+    # Reloaded some other way (POST /admin/reload), then broken again with the same files
+    del registry.stale["ocr"]
+    watcher.poll()
+    assert watcher._failed == {}
+    registry.stale["ocr"] = "broken"
+    watcher.poll()
+    watcher.poll()
+    assert registry.reloads == ["ocr", "ocr"]
+
+
+def test_one_failing_group_does_not_hold_back_another(watched):
+    registry, watcher = watched
+    registry.stale.update(yolo="broken", ocr="v2")
+    registry.failing.add("yolo")
+    watcher.poll()
+    assert watcher.poll() == ["ocr"]
+    assert watcher._failed == {"yolo": "broken"}
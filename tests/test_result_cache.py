@@ -0,0 +1,147 @@
+import os
+import threading
+
+import pytest
+
+import result_cache
+from result_cache import MemoryBackend, ResultCache, SQLiteBackend
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", b"1")
+    backend.set("b", b"2")
+    assert backend.get("a") == b"1"
+    backend.set("c", b"3")
+    assert backend.get("b") is None
+    assert (backend.get("a"), backend.get("c")) == (b"1", b"3")
+    assert backend.stats()["evictions"] == 1
+
+
+def test_memory_backend_bounds_bytes():
+    backend = MemoryBackend(max_entries=100, max_bytes=10)
+    backend.set("a", b"x" * 6)
+    backend.set("b", b"y" * 6)
+    assert backend.get("a") is None and backend.get("b") == b"y" * 6
+    # A value larger than the whole cache is never stored
+    backend.set("c", b"z" * 11)
+    assert backend.get("c") is None
+    assert backend.stats()["bytes"] == 6
+
+
+def test_memory_backend_entries_expire(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "monotonic", clock)
+    backend = MemoryBackend(ttl_s=60)
+    backend.set("a", b"1")
+    clock.now += 59
+    assert backend.get("a") == b"1"
+    clock.now += 1
+    assert backend.get("a") is None
+    assert backend.stats()["entries"] == 0
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    return lambda **kwargs: SQLiteBackend(str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_sqlite_backend_evicts_least_recently_used(sqlite_backend, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "time", clock)
+    backend = sqlite_backend(max_entries=2)
+    for key in ("a", "b"):
+        clock.now += 1
+        backend.set(key, key.encode())
+    clock.now += 1
+    assert backend.get("a") == b"a"
+    clock.now += 1
+    backend.set("c", b"c")
+    assert backend.get("b") is None
+    assert backend.stats()["entries"] == 2 and backend.stats()["evictions"] == 1
+
+
+def test_sqlite_backend_entries_expire(sqlite_backend, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "time", clock)
+    backend = sqlite_backend(ttl_s=60)
+    backend.set("a", b"1")
+    clock.now += 60
+    assert backend.get("a") is None
+    assert backend.stats()["entries"] == 0
+
+
+def test_sqlite_backend_opens_one_connection_per_thread(sqlite_backend):
+    backend = sqlite_backend()
+    backend.set("main", b"1")
+    seen = {}
+
+    def run():
+        seen["conn"] = backend._connect()
+        seen["value"] = backend.get("main")
+        backend.set("thread", b"2")
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    assert seen["conn"] is not backend._connect()
+    assert seen["value"] == b"1" and backend.get("thread") == b"2"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork()")
+def test_sqlite_backend_reconnects_after_fork(sqlite_backend):
+    backend = sqlite_backend()
+    parent = backend._connect()
+    backend.set("parent", b"1")
+    pid = os.fork()
+    if pid == 0:
+        # Exit status reports to the parent; nothing raised here reaches pytest
+        try:
+            ok = backend._connect() is not parent and backend.get("parent") == b"1"
+            backend.set("child", b"2")
+        except BaseException:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert backend._connect() is parent
+    assert backend.get("child") == b"2"
+
+
+def test_result_cache_keys_change_with_model_version():
+    key = ResultCache.make_key("process_image", b"payload", "v1")
+    assert key == ResultCache.make_key("process_image", b"payload", "v1")
+    assert key != ResultCache.make_key("process_image", b"payload", "v2")
+    assert key != ResultCache.make_key("wound", b"payload", "v1")
+
+
+def test_result_cache_round_trip_and_hit_rate():
+    cache = ResultCache(MemoryBackend())
+    key = cache.make_key("wound", b"image", "v1")
+    assert cache.get("wound", key) is None
+    cache.set(key, {"boxes": [[1, 2, 3, 4]]})
+    assert cache.get("wound", key) == {"boxes": [[1, 2, 3, 4]]}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_broken_backend_never_fails_the_request():
+    class Broken(MemoryBackend):
+        def get(self, key):
+            raise OSError("disk full")
+
+        def set(self, key, value):
+            raise OSError("disk full")
+
+    cache = ResultCache(Broken())
+    cache.set("key", {"ok": True})
+    assert cache.get("wound", "key") is None
+    assert cache.stats()["errors"] == 2
@@ -0,0 +1,100 @@
+# FastTfidf must give the same matrix as TfidfVectorizer.transform, bit for
+# bit: same shape, dtype and sparsity pattern, and the exact float values. It
+# is checked on the shipped vectorizer (with its own and with the shared
+# sorted-array vocabulary) over generated articles and edge cases (empty,
+# non-ASCII, bytes, out-of-vocabulary and long terms), on vectorizers fitted
+# with options the API's does not use, and through FeatureAssembler.
+# Run from the repository root: python -m pytest tests
+# (API/benchmarks/bench_tfidf.py times the two; this does not time anything)
+import copy
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from features import FeatureAssembler, FastTfidf
+from shared_weights import SortedVocabulary
+
+EDGE_CASES = [
+    "", "   ", "a", "x y z", "\n\t\n",
+    "Senate APPROVES new Budget for public schools",
+    "Ñoño CAFÉ café naïve São Paulo Δελτίο 東京 新闻",
+    "snake_case_words and numbers 2026 12.5 1,000 covid19",
+    "repeat repeat repeat repeat the the the",
+    "punctuation!!! (brackets) [more] {and} quotes' \"double\" hyphen-ated e-mail@example.com",
+    "zzqxj qqqzzk unlikelyterm notinthevocabularyatall",
+    b"Bytes input: Department of Health advisory",
+]
+# Options the API's vectorizer does not use, fitted on the generated articles
+FIT_OPTIONS = [
+    {"sublinear_tf": True}, {"binary": True}, {"norm": "l1"}, {"norm": None},
+    {"use_idf": False}, {"smooth_idf": False}, {"dtype": np.float32},
+    {"lowercase": False}, {"token_pattern": r"(?u)\b\w+\b"}, {"min_df": 2, "max_df": 0.5},
+]
+
+
+def long_terms(vectorizer, count=5):
+    # Vocabulary terms the sorted-array vocabulary keeps in its overflow dict
+    return sorted((term for term in vectorizer.vocabulary_ if len(term.encode("utf-8")) > 24), key=len)[:count]
+
+
+def mismatches(vectorizer, documents):
+    # Batches (all documents, then each one alone) where FastTfidf differs
+    fast = FastTfidf(vectorizer)
+    failed = []
+    for batch in [documents] + [[doc] for doc in documents]:
+        expected, actual = vectorizer.transform(batch), fast.transform(batch)
+        if not (expected.shape == actual.shape and expected.dtype == actual.dtype
+                and np.array_equal(expected.indptr, actual.indptr)
+                and np.array_equal(expected.indices, actual.indices)
+                and expected.data.tobytes() == actual.data.tobytes()):
+            failed.append(f"{str(batch[0])[:60]!r} ({len(batch)} documents)")
+    return failed
+
+
+@pytest.fixture(scope="module")
+def vectorizer(model_path):
+    return joblib.load(model_path("content_vectorizer.pkl"))
+
+
+@pytest.fixture(scope="module")
+def articles(vectorizer):
+    # Articles over the vectorizer's vocabulary, common terms drawn more often
+    # (df ~ exp(-idf)), of log-normal length around 250 words
+    terms = np.array(sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get))
+    weights = np.exp(-np.asarray(vectorizer.idf_, dtype=np.float64))
+    rng = np.random.default_rng(0)
+    lengths = np.clip(rng.lognormal(np.log(250), 0.6, 200), 5, 5000).astype(int)
+    return [" ".join(rng.choice(terms, length, p=weights / weights.sum())) for length in lengths]
+
+
+@pytest.fixture(scope="module")
+def documents(vectorizer, articles):
+    return articles + EDGE_CASES + [" ".join(long_terms(vectorizer))]
+
+
+def test_shipped_vectorizer(vectorizer, documents):
+    assert mismatches(vectorizer, documents) == []
+
+
+def test_shipped_vectorizer_sorted_vocabulary(vectorizer, documents):
+    shared = copy.deepcopy(vectorizer)
+    shared.vocabulary_ = SortedVocabulary.from_dict(shared.vocabulary_)
+    assert mismatches(shared, documents) == []
+
+
+@pytest.mark.parametrize("options", FIT_OPTIONS,
+                         ids=lambda options: ",".join(f"{k}={v!r}" for k, v in options.items()))
+def test_fitted_options(options, articles, documents):
+    assert mismatches(TfidfVectorizer(**options).fit(articles), documents) == []
+
+
+def test_feature_assembler(vectorizer, articles, model_path):
+    brand_columns = joblib.load(model_path("brand_columns.pkl"))
+    fast = FeatureAssembler(vectorizer, brand_columns, fast_tfidf=True)
+    slow = FeatureAssembler(vectorizer, brand_columns, fast_tfidf=False)
+    contents = articles[:20] + [text for text in EDGE_CASES if isinstance(text, str)]
+    brands = ["Unknown"] * len(contents)
+    expected, actual = slow.transform(contents, brands), fast.transform(contents, brands)
+    assert expected.shape == actual.shape and (expected != actual).nnz == 0